@@ -21,7 +21,6 @@ Gregor Taylor - June 2018
 import sys
 import time
 import os
-import csv
 import matplotlib
 matplotlib.use("TkAgg")
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
@@ -38,9 +37,28 @@ import ThorlabsPM100
 from hardware import SIM900
 import numpy as np
 from ExceptionLogger import exception_logger
+from measurement import AcquisitionEngine
+from measurement.sweeps import efficiency_sweep, dcr_sweep, setup_counter, DarkCountCache
+from measurement.monitors import values_vs_time, vvt_headers, rt_log, LOG_FLUSH_ROWS, LOG_FLUSH_INTERVAL
+from measurement.writer import open_writer
+from measurement.store import available_formats, STORE_FORMATS, readable_while_writing
+from measurement.scheduler import FixedRateScheduler
+from measurement.switching import SwitchDetector, switching_current_search
+from measurement.planner import AdaptiveBiasPlanner
+from measurement.settle import SettleDetector
+from measurement.ranging import AttenuationRanger, atten_for_photon_flux
+from measurement.rig import open_instruments
+from measurement.checkpoint import SweepCheckpoint, checkpoint_path
+from measurement.reprocess import save_reprocessed
+from measurement.loader import TailReader, load_efficiency, atten_label
+from measurement.stream import StreamBuffer
+from measurement.decimate import minmax_decimate, is_sorted
+from measurement.jobs import JobQueue, JOB_PARAMS, REQUIRED, parse_job_params, run_jobs
 
 #Define font for labels   
 LARGE_FONT= ("Verdana", 12)
+#Redraw cap for plots following a running measurement
+LIVE_FPS = 10
 #Define plot style
 style.use('ggplot')
 ##############################################################################
@@ -57,10 +75,12 @@ class DataGatheringapp(Tk):
         self.SIM_slots = {}
         self.headers = ['Time']
         self.plot_arrays_dict = {}
-        self.plot_col_dict = {}
-        self.measurement_after_id = None    #ID to keep track of measurements running
+        self.tail = None    #TailReader for the file last plotted, kept so replots only parse new rows
+        self.live = StreamBuffer()    #Rows of the running measurement, for the live graph
         self.Filename = ''
         self.rm = ResourceManager()    #Pyvisa resource manager
+        self.engine = AcquisitionEngine()    #Runs measurements in a worker thread
+        self.engine_page = None    #Page that gets the samples from the engine
 
         container = ttk.Frame(self)
         container.pack(side="top", fill="both", expand = True)
@@ -69,12 +89,13 @@ class DataGatheringapp(Tk):
         #Frames hold the app pages
         self.frames = {}
         #all page must be added to following tuple
-        for F in (StartPage, MeasTypePage,ValuesTimePage, WorkingPage, DisplayGraphPage, EDPSetupPage, EfficiencyPage, DCRPage, PlotExistingFilePage, RTPage):
+        for F in (StartPage, MeasTypePage,ValuesTimePage, WorkingPage, DisplayGraphPage, EDPSetupPage, EfficiencyPage, DCRPage, IswPage, PlotExistingFilePage, RTPage, QueuePage):
             frame=F(container, self)
             self.frames[F] = frame
             #defines the grid
             frame.grid(row=0, column=0, sticky="nsew")
         self.show_frame(StartPage)
+        self.poll_engine()
 
     def show_frame(self, cont):
         #Raises the chosen page to the top.
@@ -82,6 +103,31 @@ class DataGatheringapp(Tk):
         if cont == DisplayGraphPage:
             frame.event_generate("<<ShowGraphPage>>")
         frame.tkraise()
+
+    def start_measurement(self, page, task, *args):
+        if self.engine.running:
+            messagebox.showerror('Error', 'Measurement still running')
+            return False
+        self.engine_page = page
+        filename = getattr(args[0], 'filename', args[0]) if len(args) > 0 else None    #Data file (or writer) comes first
+        self.live = StreamBuffer(filename if isinstance(filename, str) else None)
+        self.engine.start(task, self, *args)
+        return True
+
+    def poll_engine(self):
+        #Hands anything the worker thread has produced to the page that started it
+        for kind, payload in self.engine.get_messages():
+            if kind == 'prompt':
+                messagebox.showinfo(*payload)
+                self.engine.acknowledge()
+                continue
+            if kind == 'sample':
+                self.live.add(payload)
+            if kind == 'error':
+                messagebox.showerror('Error', 'Measurement failed:\n'+payload)
+            if self.engine_page != None:
+                self.engine_page.on_engine_message(self, kind, payload)
+        self.after(100, self.poll_engine)
         
 ##############################################################################
 #Add instruments
@@ -151,6 +197,8 @@ class MeasTypePage(ttk.Frame):
 
         ttk.Button(self, text="Efficiency/DCR/PCR", command=lambda: self.go_to_EDP_page(controller)).grid(row=3,column=1)
 
+        ttk.Button(self, text="Job queue (unattended runs)", command=lambda: controller.show_frame(QueuePage)).grid(row=4,column=1)
+
         ttk.Button(self, text="Go back to instrument setup page", command=lambda: controller.show_frame(StartPage)).grid(row=5,column=1)
 
     def go_to_EDP_page(self, controller):
@@ -230,40 +278,53 @@ class WorkingPage(ttk.Frame):
         ttk.Label(self,text="Enter wavelength of interest:").grid(row=2,column=1)
         wav_pwr = ttk.Entry(self)
         wav_pwr.grid(row=2,column=2)
+
+        ttk.Label(self,text="Sample period in seconds (leave blank for 1s):").grid(row=3,column=1)
+        period = ttk.Entry(self)
+        period.grid(row=3,column=2)
         
-        start_meas_button = ttk.Button(self, text="Start measuring", command=lambda: self.setup_data_gather(controller, av_pwr.get(),wav_pwr.get()))
-        start_meas_button.grid(row=3,column=1)
+        start_meas_button = ttk.Button(self, text="Start measuring", command=lambda: self.setup_data_gather(controller, av_pwr.get(),wav_pwr.get(), period.get()))
+        start_meas_button.grid(row=4,column=1)
         
         stop_meas_button = ttk.Button(self, text="Stop measuring", command=lambda:self.stop_meas(controller))
-        stop_meas_button.grid(row=4,column=1)
+        stop_meas_button.grid(row=5,column=1)
+
+        pause_meas_button = ttk.Button(self, text="Pause/Resume", command=lambda:self.pause_meas(controller))
+        pause_meas_button.grid(row=5,column=2)
 
         graph_button = ttk.Button(self, text="Graph", command=lambda: self.graph_it(controller))
-        graph_button.grid(row=5,column=1)
+        graph_button.grid(row=6,column=1)
 
         self.size_label=ttk.Label(self, text= ("File size = 0 bytes"))#MIGHT NEED SELF HERE
-        self.size_label.grid(row=6,column=1)
+        self.size_label.grid(row=7,column=1)
 
         RT_butt = ttk.Button(self, text='Go to RT measurement page', command=lambda: controller.show_frame(RTPage))
-        RT_butt.grid(row=7,column=1)
+        RT_butt.grid(row=8,column=1)
+
+        ttk.Button(self, text="Go back to measurement choice page", command=lambda: controller.show_frame(MeasTypePage)).grid(row=9,column=1)
 
-        ttk.Button(self, text="Go back to measurement choice page", command=lambda: controller.show_frame(MeasTypePage)).grid(row=8,column=1)
+        add_format_option(self, 1, 3, logs=True)
 
 
-    def setup_data_gather(self, controller, av_pwr_count, wav_pwr):
+    def setup_data_gather(self, controller, av_pwr_count, wav_pwr, period):
         #sets up header data and connects all isntruments required
+        if controller.engine.running:
+            messagebox.showerror('Error', 'Measurement still running')
+            return
+        try:
+            self.scheduler = FixedRateScheduler(float(period) if period != '' else 1)
+        except ValueError:
+            messagebox.showerror('Error', 'Enter a valid sample period')
+            return
         controller.Filename = os.path.dirname(os.path.abspath(__file__))+"\\Data\\"+time.ctime().replace(" ", "_").replace(":","_")
+        controller.headers = vvt_headers(controller)
         if controller.SIM_slots['ThermSlot'] != '':
-            controller.headers+=['T1', 'T2', 'T3']
             controller.Filename+='_temp'
         if controller.SIM_slots['VSource'] != '':
-            controller.headers.append('V_Source(V)')
             controller.Filename+='_VSrc'
         if controller.SIM_slots['VMeter'] != '':
             controller.Filename+='_VMeas'
-            for i in range(controller.SIM_slots['NumberOfVMeters']):
-                controller.headers.append('V_'+str(i+1)+'(V)')
         if controller.instr_address_dict['power_m_address'] != '':
-            controller.headers.append('Power(W)')
             controller.Filename+='_power'
             #setup pwr meter connection
             pwr_m_address = controller.rm.open_resource(controller.instr_address_dict['power_m_address']) #put this in one line
@@ -272,66 +333,38 @@ class WorkingPage(ttk.Frame):
             if av_pwr_count != '':
                 controller.PM100.sense.average.count=int(av_pwr_count) #must be set for low powers
         if controller.instr_address_dict['pulse_c_address'] != '':
-            controller.headers.append('Counts')
             controller.Filename+='_counts'
             #setup pulse counter connection
             controller.PCounter = controller.rm.open_resource(controller.instr_address_dict['pulse_c_address'])
-        #PRINT HEADERS TO FILE#
-        controller.Filename+='.txt'
+        controller.Filename+=data_extension(self)
         try:
             os.makedirs(os.path.dirname(controller.Filename))
         except OSError:
            pass
-        with open(controller.Filename, 'a+') as file_handle:
-            writer_csv =  csv.writer(file_handle, delimiter=',')
-            writer_csv.writerow(controller.headers)
+        #File stays open for the run, rows go out in batches. Headers are written by the measurement
+        self.writer = open_writer(controller.Filename, flush_rows=LOG_FLUSH_ROWS, flush_interval=LOG_FLUSH_INTERVAL)
         
         #setup connections to SIM9000 if required
         if (controller.SIM_slots['ThermSlot'],controller.SIM_slots['VMeter'], controller.SIM_slots['VSource']) != ('','',''):
             controller.sim900 = SIM900(controller.instr_address_dict['sim900_address'])
         
-        self.get_dataset(controller)
-
-
-
-    def get_dataset(self, controller):
-        if controller.measurement_after_id == None:
-            self.start_time_meas = time.time()
-        #Always time
-        data_to_write = [str(time.time()-self.start_time_meas)]
-        #Other applicable data
-        for i in controller.headers[1:]:
-            if i == 'T1':
-                t1 = str(controller.sim900.ask(controller.SIM_slots['ThermSlot'],'TVAL? 1')).strip()
-                t2 = str(controller.sim900.ask(controller.SIM_slots['ThermSlot'],'TVAL? 2')).strip()
-                t3 = str(controller.sim900.ask(controller.SIM_slots['ThermSlot'],'TVAL? 3')).strip()
-                data_to_write += [t1,t2,t3]
-            if i == 'V_Source(V)':
-                data_to_write.append(str(controller.sim900.ask(controller.SIM_slots['VSource'],'VOLT?')).strip()) # not sure correct
-            if i == 'Power(W)':
-                data_to_write.append(str(controller.PM100.read).strip())
-            if i == 'Counts':
-                data_to_write.append('x')#Wont do counts yet
-            if i == 'V_1(V)':
-                data_to_write.append(str(controller.sim900.ask(controller.SIM_slots['VMeter'],'VOLT? 1,1')).strip())
-            if i == 'V_2(V)':
-                data_to_write.append(str(controller.sim900.ask(controller.SIM_slots['VMeter'],'VOLT? 2,1')).strip())
-            if i == 'V_3 (V)':
-                data_to_write.append(str(controller.sim900.ask(controller.SIM_slots['VMeter'],'VOLT? 3,1')).strip())
-            if i == 'V_4 (V)':
-                data_to_write.append(str(controller.sim900.ask(controller.SIM_slots['VMeter'],'VOLT? 4,1')).strip())
-        with open(controller.Filename, 'a+') as file_handle:
-            writer_csv =  csv.writer(file_handle, delimiter=',')
-            writer_csv.writerow(data_to_write)
-        self.size_label['text'] = "File size = "+str(os.path.getsize(controller.Filename))+" bytes"
-        controller.measurement_after_id = app.after(1000, self.get_dataset, controller)
-                
+        controller.start_measurement(self, values_vs_time, self.writer, controller.headers, self.scheduler, True)
+
+    def on_engine_message(self, controller, kind, payload):
+        if kind == 'sample':
+            self.size_label['text'] = "File size = "+str(self.writer.size)+" bytes, missed samples = "+str(self.scheduler.missed)
+
     def stop_meas(self, controller):
-        app.after_cancel(controller.measurement_after_id)
-        controller.measurement_after_id = None
+        controller.engine.stop()
+
+    def pause_meas(self, controller):
+        if controller.engine.paused:
+            controller.engine.resume()
+        else:
+            controller.engine.pause()
      
     def graph_it(self, controller):
-        if controller.measurement_after_id != None:
+        if controller.engine.running and not readable_while_writing(controller.Filename):
             messagebox.showerror('Error', 'Measurement still running')
         elif controller.Filename == None:
             messagebox.showerror('Error', 'No file to plot!')
@@ -357,6 +390,16 @@ class DisplayGraphPage(ttk.Frame):
         self.toolbar = NavigationToolbar2Tk(self.canvas, self)
         self.toolbar.update()
         self.canvas._tkcanvas.pack(side="top", fill="both", expand = True)
+        #Live mode - lines follow the running measurement and only they are redrawn (blitted)
+        self.live = False
+        self.live_lines = []    #[(line, x column, y column, attenuation block or None, x scale)]
+        self.live_version = None
+        self.live_rows = 0
+        self.live_after_id = None
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.full_data = {}    #Line -> (x, y) it was decimated from
+        self.canvas.mpl_connect('resize_event', lambda event: self.decimate_lines())
 
         return_button = ttk.Button(self, text="Return to home", command=lambda: controller.show_frame(StartPage))
         return_button.pack()    #Need to pack as one of the matplotlib funcs uses pack so cannot mix with grid
@@ -365,6 +408,7 @@ class DisplayGraphPage(ttk.Frame):
 
 
     def on_show_graph_page(self, controller):
+        self.stop_live()
         if self.graph_set == True:    #This bit clears everything from the graph page everytime it's opened.
             controller.Y_index_list = []
             controller.Y2_index_list = []
@@ -383,6 +427,10 @@ class DisplayGraphPage(ttk.Frame):
             self.graph_set = False
         self.sp1_1 = self.VvT_graph.add_subplot(111)
         self.sp1_1.set_prop_cycle(cycler('color', self.axis_1_colours))
+        self.sp1_1.callbacks.connect('xlim_changed', lambda axes: self.decimate_lines())    #twinx shares the x axis
+        self.live = self.is_live(controller)
+        self.live_lines = []
+        self.full_data = {}
         #Plots data based on plot_type
         if controller.plot_type == 'VvT':
             self.config_plot_butt=ttk.Button(self, text="Configure columns", command=lambda: WhatToPlot(controller))
@@ -390,7 +438,8 @@ class DisplayGraphPage(ttk.Frame):
             self.plot_VvT_butt = ttk.Button(self, text="Plot it", command=lambda: self.plot_VvT(controller))
             self.plot_VvT_butt.pack(side=RIGHT)
         elif controller.plot_type == 'DCR':
-            self.sp1_1.plot(controller.plot_arrays_dict[2],controller.plot_arrays_dict[3], 'ko', markersize=2)
+            line, = self.sp1_1.plot(self.column(controller, 2), self.column(controller, 3), 'ko', markersize=2, animated=self.live)
+            self.live_lines.append((line, 2, 3, None, 1))
             self.sp1_1.set_yscale('log')
             self.sp1_1.set_ylabel('Counts (CPS)')
             self.sp1_1.set_xlabel('Bias (A)')
@@ -399,37 +448,210 @@ class DisplayGraphPage(ttk.Frame):
             self.select_atten_box=ttk.Combobox(self, values=list(controller.eff_dict.keys()))    #Can change plot depending on atten value selected
             self.select_atten_box.pack()
             self.select_atten_box.bind("<<ComboboxSelected>>", lambda event:self.eff_plot_update(controller))
+            if self.live:    #Every attenuation so far, a line each, until one is picked
+                self.sp1_1.set_ylabel('Efficiency (%)')
+                self.sp1_1.set_xlabel('Bias(uA)')
+                self.sp1_1.set_title('Efficiency (live)')
+        elif controller.plot_type == 'ISW':
+            self.sp1_1.hist(controller.plot_arrays_dict[2]*1e6, bins=max(5, len(controller.plot_arrays_dict[2])//5))
+            self.sp1_1.set_ylabel('Occurrences')
+            self.sp1_1.set_xlabel('Switching current (uA)')
+            self.sp1_1.set_title('Switching current histogram')
         elif controller.plot_type == 'RT':
-            self.sp1_1.plot(controller.plot_arrays_dict[2],controller.plot_arrays_dict[5], 'bo', markersize=2)
+            line, = self.sp1_1.plot(self.column(controller, 2), self.column(controller, 5), 'bo', markersize=2, animated=self.live)
+            self.live_lines.append((line, 2, 5, None, 1))
             self.sp1_1.set_ylabel('R (Ohm)')
             self.sp1_1.set_xlabel('T (K)')
             self.sp1_1.set_title('R-T')
 
         self.graph_set = True
-        self.canvas.draw()
+        if self.live and controller.plot_type != 'VvT':    #VvT waits for its columns to be picked
+            self.start_live(controller)
+        else:
+            self.canvas.draw()
     
     def eff_plot_update(self, controller):
+        self.stop_live()    #A single attenuation from the file
+        self.live = False
+        self.live_lines = []
         atten = self.select_atten_box.get()
         self.VvT_graph.clear()
         sp1_1 = self.VvT_graph.add_subplot(111)
-        sp1_1.plot(controller.bias_arr, controller.eff_dict[atten], 'r*')
+        sp1_1.plot(controller.bias_dict[atten], controller.eff_dict[atten], 'r*')
         sp1_1.set_ylabel('Efficiency (%)')
         sp1_1.set_xlabel('Bias(uA)')
         sp1_1.set_title('Efficiency at '+atten+'dB attenuation')
         self.canvas.draw()
 
     def plot_VvT(self, controller):
+        self.stop_live()
         for i in controller.Y_index_list:
-            self.sp1_1.plot(controller.plot_arrays_dict[controller.X_index], controller.plot_arrays_dict[i])
+            line, = self.sp1_1.plot(self.column(controller, controller.X_index), self.column(controller, i), animated=self.live)
+            self.live_lines.append((line, controller.X_index, i, None, 1))
+            self.full_data[line] = line.get_data()
         self.sp1_1.set_xlabel(controller.data_titles[controller.X_index])
         self.sp1_1.set_ylabel(controller.data_titles[controller.Y_index_list[0]]) #This should grab the first title that was plotted and set it
         if controller.Y2_index_list != []:
             self.sp1_2=self.sp1_1.twinx()
             self.sp1_2.set_prop_cycle(cycler('color', self.axis_2_colours))
             for i in controller.Y2_index_list:
-                self.sp1_2.plot(controller.plot_arrays_dict[controller.X_index], controller.plot_arrays_dict[i])
+                line, = self.sp1_2.plot(self.column(controller, controller.X_index), self.column(controller, i), animated=self.live)
+                self.live_lines.append((line, controller.X_index, i, None, 1))
+                self.full_data[line] = line.get_data()
             self.sp1_2.set_ylabel(controller.data_titles[controller.Y2_index_list[0]])
-        self.canvas.draw()
+        self.decimate_lines()
+        if self.live:
+            self.start_live(controller)
+        else:
+            self.canvas.draw()
+
+    #Values against time logs can be millions of points - each line only gets
+    #the points that can be seen at the axes' width in pixels (see
+    #measurement/decimate.py), picked again from the full arrays whenever the
+    #x range changes (toolbar zoom/pan, autoscale).
+    def decimate_lines(self):
+        for line, (x, y) in self.full_data.items():
+            line.set_data(*self.decimated(x, y))
+
+    def decimated(self, x, y):
+        #Range from sp1_1 - sp1_2 shares it but is only updated after the callback
+        if not is_sorted(x):
+            return x, y
+        x_low, x_high = sorted(self.sp1_1.get_xlim())
+        return minmax_decimate(x, y, x_low, x_high, self.sp1_1.get_window_extent().width)
+
+    #Live plotting - the lines are made once and given the new data with
+    #set_data. The axes, ticks and grid are drawn once and kept as a bitmap;
+    #each frame puts that back and draws only the lines over it (blitting),
+    #at most LIVE_FPS times a second. A full redraw only happens when a new
+    #point falls outside the axes.
+    def is_live(self, controller):
+        #Follows the running measurement only if that's the file being plotted
+        if not controller.engine.running or controller.plot_type not in ('VvT', 'DCR', 'RT', 'EFF'):
+            return False
+        filename = getattr(controller, 'EFF_filename', None) if controller.plot_type == 'EFF' else controller.Filename
+        return controller.live.filename != None and controller.live.filename == filename
+
+    def column(self, controller, index):
+        if self.live:
+            return controller.live.column(index)
+        return controller.plot_arrays_dict[index]
+
+    def start_live(self, controller):
+        self.live_version = None
+        self.live_rows = 0
+        self.update_live_lines(controller)
+        self.rescale()
+        self.live_after_id = self.after(int(1000/LIVE_FPS), lambda: self.live_tick(controller))
+
+    def stop_live(self):
+        if self.live_after_id != None:
+            self.after_cancel(self.live_after_id)
+            self.live_after_id = None
+
+    def live_tick(self, controller):
+        self.live_after_id = None
+        if controller.live.version != self.live_version:
+            if self.update_live_lines(controller) and self.toolbar.mode == '':    #Not while zooming/panning
+                self.rescale()
+            else:
+                self.blit_lines()
+        if controller.engine.running:
+            self.live_after_id = self.after(int(1000/LIVE_FPS), lambda: self.live_tick(controller))
+        else:    #Run over - leave an ordinary plot
+            self.live = False
+            outside = self.update_live_lines(controller)
+            for line, x_index, y_index, block, x_scale in self.live_lines:
+                line.set_animated(False)
+            if outside and self.toolbar.mode == '':
+                self.rescale()
+            else:
+                self.canvas.draw()
+
+    def update_live_lines(self, controller):
+        #Gives the lines everything that's come in, returns True if a new
+        #point is outside the axes
+        live = controller.live
+        new_rows = live.rows-self.live_rows
+        self.live_version = live.version
+        self.live_rows = live.rows
+        outside = False
+        if controller.plot_type == 'EFF':
+            outside = self.add_eff_lines(live)
+        for line, x_index, y_index, block, x_scale in self.live_lines:
+            x = live.column(x_index)*x_scale
+            y = live.column(y_index)
+            if block != None:
+                atten, start, end = live.block_ranges()[block]
+                x = x[start:end]
+                y = y[start:end]
+            if new_rows > 0 and not outside:
+                outside = self.outside_view(line.axes, x[-new_rows:], y[-new_rows:])
+            if line in self.full_data:
+                self.full_data[line] = (x, y)
+                x, y = self.decimated(x, y)
+            line.set_data(x, y)
+        return outside
+
+    def add_eff_lines(self, live):
+        #A line for each attenuation the sweep has reached
+        blocks = live.block_ranges()
+        count = len([i for i in self.live_lines if i[3] != None])
+        for block in range(count, len(blocks)):
+            line, = self.sp1_1.plot([], [], '*', label=atten_label(blocks[block][0])+'dB', animated=True)
+            self.live_lines.append((line, 0, 3, block, 10))
+        if count < len(blocks):
+            self.sp1_1.legend()
+            return True
+        return False
+
+    def outside_view(self, axes, x, y):
+        keep = np.isfinite(x) & np.isfinite(y)
+        if axes.get_yscale() == 'log':
+            keep &= y > 0
+        if not keep.any():
+            return False
+        x = x[keep]
+        y = y[keep]
+        x_low, x_high = sorted(axes.get_xlim())
+        y_low, y_high = sorted(axes.get_ylim())
+        return x.min() < x_low or x.max() > x_high or y.min() < y_low or y.max() > y_high
+
+    def rescale(self):
+        for axes in self.VvT_graph.axes:
+            axes.relim()
+            axes.autoscale_view()
+            if self.live:    #Room to grow into, so a run only redraws in full now and then
+                axes.set_xlim(self.headroom(axes.get_xlim(), axes.get_xscale()))
+                axes.set_ylim(self.headroom(axes.get_ylim(), axes.get_yscale()))
+        self.canvas.draw()    #on_draw keeps the new background and puts the lines on it
+
+    def headroom(self, limits, scale):
+        low, high = limits
+        if scale == 'log':
+            return low/2, high*2
+        span = (high-low)*0.25
+        return low-span, high+span
+
+    def on_draw(self, event):
+        #Any full redraw (rescale, toolbar zoom, window resize) leaves out the
+        #animated lines - keep the empty axes as the new background and blit
+        #the lines back on
+        if self.live:
+            self.background = self.canvas.copy_from_bbox(self.VvT_graph.bbox)
+            self.draw_lines()
+
+    def blit_lines(self):
+        if self.background == None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_lines()
+
+    def draw_lines(self):
+        for line, x_index, y_index, block, x_scale in self.live_lines:
+            line.axes.draw_artist(line)
+        self.canvas.blit(self.VvT_graph.bbox)
 
 
 ##############################################################################
@@ -512,19 +734,30 @@ class EDPSetupPage(ttk.Frame):
         ttk.Label(self, text="Voltage source slot?:").grid(row=2,column=1)
         VSource_slot = ttk.Entry(self)
         VSource_slot.grid(row=2,column=2)
+
+        ttk.Label(self, text="Thermometer slot? (optional):").grid(row=3,column=1)
+        Therm_slot = ttk.Entry(self)
+        Therm_slot.grid(row=3,column=2)
+
+        ttk.Label(self, text="Voltmeter slot? (optional, V-dev on input 2):").grid(row=4,column=1)
+        VMeter_slot = ttk.Entry(self)
+        VMeter_slot.grid(row=4,column=2)
         
-        ttk.Button(self, text="System efficiency measurement", command=lambda: self.confirm_Vsrc(controller, VSource_slot.get(), EfficiencyPage)).grid(row=3,column=1)
-        ttk.Button(self, text="Dark counts against bias measurement", command=lambda: self.confirm_Vsrc(controller, VSource_slot.get(), DCRPage)).grid(row=4,column=1)
+        ttk.Button(self, text="System efficiency measurement", command=lambda: self.confirm_Vsrc(controller, VSource_slot.get(), Therm_slot.get(), VMeter_slot.get(), EfficiencyPage)).grid(row=5,column=1)
+        ttk.Button(self, text="Dark counts against bias measurement", command=lambda: self.confirm_Vsrc(controller, VSource_slot.get(), Therm_slot.get(), VMeter_slot.get(), DCRPage)).grid(row=6,column=1)
+        ttk.Button(self, text="Switching current search", command=lambda: self.confirm_Vsrc(controller, VSource_slot.get(), Therm_slot.get(), VMeter_slot.get(), IswPage)).grid(row=7,column=1)
 
-        ttk.Button(self, text="Go back to instrument setup page", command=lambda: controller.show_frame(StartPage)).grid(row=5,column=1)
-        ttk.Button(self, text="Go back to measurement choice page", command=lambda: controller.show_frame(MeasTypePage)).grid(row=6,column=1)
+        ttk.Button(self, text="Go back to instrument setup page", command=lambda: controller.show_frame(StartPage)).grid(row=8,column=1)
+        ttk.Button(self, text="Go back to measurement choice page", command=lambda: controller.show_frame(MeasTypePage)).grid(row=9,column=1)
 
-    def confirm_Vsrc(self,controller,VSrc_slot, page_to_go_to):
+    def confirm_Vsrc(self,controller,VSrc_slot, Therm_slot, VMeter_slot, page_to_go_to):
         if VSrc_slot == '':
             messagebox.showerror('Error', 'No voltage source slot entered!')
             pass
         else:
             controller.SIM_slots["VSource"] = VSrc_slot
+            controller.SIM_slots["ThermSlot"] = Therm_slot
+            controller.SIM_slots["VMeter"] = VMeter_slot
             controller.show_frame(page_to_go_to)
 
 ##############################################################################
@@ -553,6 +786,7 @@ class EfficiencyPage(ttk.Frame):
         ttk.Label(self, text="Attenuations? (Seperate with comma if multiple):").grid(row=5,column=1)
         attens= ttk.Entry(self)
         attens.grid(row=5,column=2)
+        self.attens_entry = attens
 
         ttk.Label(self, text="Wavelength? (nm)").grid(row=6,column=1)
         wav= ttk.Entry(self)
@@ -562,8 +796,8 @@ class EfficiencyPage(ttk.Frame):
         ip_pwr= ttk.Entry(self)
         ip_pwr.grid(row=7,column=2)
 
-        start_meas_button = ttk.Button(self, text="Start measuring", command=lambda:self.start_meas(controller, start_bias.get(), end_bias.get(), bias_step.get(), bias_r.get(), attens.get(), wav.get(), ip_pwr.get()))
-        start_meas_button.grid(row=8,column=1)
+        self.start_meas_button = ttk.Button(self, text="Start measuring", command=lambda:self.start_meas(controller, start_bias.get(), end_bias.get(), bias_step.get(), bias_r.get(), attens.get(), wav.get(), ip_pwr.get()))
+        self.start_meas_button.grid(row=8,column=1)
 
         self.working_label = ttk.Label(self, text="No measurement running", foreground='red')
         self.working_label.grid(row=8,column=2)
@@ -571,9 +805,15 @@ class EfficiencyPage(ttk.Frame):
         stop_meas_button = ttk.Button(self, text="Stop measuring", command=lambda:self.stop_meas(controller))
         stop_meas_button.grid(row=9,column=1)
 
+        pause_meas_button = ttk.Button(self, text="Pause/Resume", command=lambda:self.pause_meas(controller))
+        pause_meas_button.grid(row=9,column=2)
+
         graph_button = ttk.Button(self, text="Graph", command=lambda: graph_EFF(controller))
         graph_button.grid(row=10,column=1)
 
+        ttk.Button(self, text="Resume interrupted sweep", command=lambda: resume_sweep(self)).grid(row=10,column=2)
+        self.resume_filename = None
+
         ttk.Button(self, text="Go back to instrument setup page", command=lambda: controller.show_frame(StartPage)).grid(row=11,column=1)
         ttk.Button(self, text="Go back to measurement choice page", command=lambda: controller.show_frame(MeasTypePage)).grid(row=12,column=1)
 
@@ -584,15 +824,75 @@ class EfficiencyPage(ttk.Frame):
         laser_rr = ttk.Entry(self)
         laser_rr.grid(row=3,column=3)
 
-        calc_atten_button = ttk.Button(self, text="Calculate attenuation", command=lambda: self.calculate_atten(laser_rr.get(), wav.get(), ip_pwr.get()))
-        calc_atten_button.grid(row=4, column=3)
+        ttk.Label(self, text="Photons per pulse wanted (per s for CW, blank for 0.1 or 1000000):").grid(row=4,column=3)
+        ph_wanted = ttk.Entry(self)
+        ph_wanted.grid(row=5,column=3)
+
+        calc_atten_button = ttk.Button(self, text="Calculate attenuation", command=lambda: self.calculate_atten(laser_rr.get(), wav.get(), ip_pwr.get(), ph_wanted.get()))
+        calc_atten_button.grid(row=6, column=3)
         
-        ttk.Label(self, text="Attenuation for 0.1 photons/s (or 1000000 per s for CW):").grid(row=5, column=3)
+        ttk.Label(self, text="Attenuation (also put in the attenuations box):").grid(row=7, column=3)
         self.atten_value_label = ttk.Label(self, text='')
-        self.atten_value_label.grid(row=6, column=3)
+        self.atten_value_label.grid(row=8, column=3)
+
+        #Auto-ranging on the counter
+        ttk.Label(self, text="Attenuation auto-ranging", font=LARGE_FONT).grid(row=9,column=3)
+
+        self.auto_range = BooleanVar(value=False)
+        ttk.Checkbutton(self, text="Find the attenuation on the counter before sweeping", variable=self.auto_range).grid(row=10,column=3)
+
+        ttk.Label(self, text="Target PCR-DCR (CPS):").grid(row=11,column=3)
+        self.range_rate = ttk.Entry(self)
+        self.range_rate.grid(row=12,column=3)
 
+        ttk.Label(self, text="Bias to range at (first attenuation is the starting guess):").grid(row=13,column=3)
+        self.range_bias = ttk.Entry(self)
+        self.range_bias.grid(row=14,column=3)
+        self.ranger = None
+
+        #Sweep options
+        ttk.Label(self, text="Sweep options", font=LARGE_FONT).grid(row=1,column=4,columnspan=2)
+
+        self.reuse_dark = BooleanVar(value=True)
+        ttk.Checkbutton(self, text="Measure dark counts once per bias (reuse for all attenuations)", variable=self.reuse_dark).grid(row=2,column=4,columnspan=2)
+
+        ttk.Label(self, text="Re-measure dark counts if T1 drifts by (K, needs thermometer):").grid(row=3,column=4)
+        self.dark_t_tol = ttk.Entry(self)
+        self.dark_t_tol.grid(row=3,column=5)
+
+        ttk.Label(self, text="Sweep order (batched = all biases dark, then all light):").grid(row=4,column=4)
+        self.sweep_order = ttk.Combobox(self, values=['interleaved', 'batched'], state='readonly')
+        self.sweep_order.set('interleaved')
+        self.sweep_order.grid(row=4,column=5)
+
+        ttk.Label(self, text="Target uncertainty on PCR-DCR (e.g. 0.01, blank for fixed 5 gates):").grid(row=5,column=4)
+        self.count_target = ttk.Entry(self)
+        self.count_target.grid(row=5,column=5)
+
+        ttk.Label(self, text="Max integration time for each of DCR/PCR (s):").grid(row=6,column=4)
+        self.count_max_time = ttk.Entry(self)
+        self.count_max_time.insert(0, '30')
+        self.count_max_time.grid(row=6,column=5)
+
+        add_switch_options(self, 7, 4)
+
+        add_adaptive_options(self, 10, 4)
+
+        add_settle_options(self, 12, 4)
+
+        add_format_option(self, 15, 4)
+
+        #Saved in the checkpoint so a resumed sweep gets the same settings
+        self.settings_widgets = {'start_bias': start_bias, 'end_bias': end_bias, 'bias_step': bias_step, 'bias_r': bias_r, 'attens': attens,
+                                 'wav': wav, 'ip_pwr': ip_pwr, 'reuse_dark': self.reuse_dark, 'dark_t_tol': self.dark_t_tol,
+                                 'sweep_order': self.sweep_order, 'count_target': self.count_target, 'count_max_time': self.count_max_time,
+                                 'detect_switch': self.detect_switch, 'on_switch': self.on_switch, 'switch_v': self.switch_v,
+                                 'adaptive': self.adaptive, 'point_budget': self.point_budget, 'detect_settle': self.detect_settle,
+                                 'settle_method': self.settle_method, 'settle_tol': self.settle_tol, 'auto_range': self.auto_range,
+                                 'range_rate': self.range_rate, 'range_bias': self.range_bias}
 
     def start_meas(self, controller, start_bias, stop_bias, bias_step, bias_r, attens, wav, ip_pwr):
+        resume_filename, self.resume_filename = self.resume_filename, None
         if start_bias == '':
             messagebox.showerror('Error', 'Enter a valid start bias value')
         elif stop_bias == '':
@@ -601,25 +901,58 @@ class EfficiencyPage(ttk.Frame):
             messagebox.showerror('Error', 'Enter a valid bias step value')
         elif bias_r == '':
             messagebox.showerror('Error', 'Enter a valid bias resistor value')
-        elif attens == '':
+        elif attens == '' and self.auto_range.get() == False:
             messagebox.showerror('Error', 'Enter a valid attenuation value')
         elif wav == '':
             messagebox.showerror('Error', 'Enter a valid wavelength value')
         elif ip_pwr == '':
             messagebox.showerror('Error', 'Enter a valid input power value')
+        elif controller.engine.running:
+            messagebox.showerror('Error', 'Measurement still running')
         else:
-            controller.EFF_filename = os.path.dirname(os.path.abspath(__file__))+"\\Data\\"+time.ctime().replace(" ", "_").replace(":","_")+"EFF.txt"
-            self.first_atten = True
-            self.biases = np.arange(float(start_bias), float(stop_bias)+float(bias_step), float(bias_step)) 
+            if resume_filename != None:    #Carry on appending to the interrupted sweep's file
+                controller.EFF_filename = resume_filename
+            else:
+                controller.EFF_filename = os.path.dirname(os.path.abspath(__file__))+"\\Data\\"+time.ctime().replace(" ", "_").replace(":","_")+"EFF"+data_extension(self)
+            try:
+                self.biases = make_bias_plan(self, start_bias, stop_bias, bias_step, log_values=False)
+            except ValueError as e:
+                messagebox.showerror('Error', str(e))
+                return
+            if self.adaptive.get() and self.sweep_order.get() == 'batched':
+                messagebox.showerror('Error', 'Adaptive bias steps need the interleaved sweep order')
+                return
             self.bias_r = float(bias_r)
-            self.attens = attens.split(',')
+            self.attens = attens.split(',') if attens != '' else []
+            try:
+                self.ranger = self.make_ranger(controller)
+            except ValueError as e:
+                messagebox.showerror('Error', str(e))
+                return
             self.wav = int(wav)
             self.ip_pwr = float(ip_pwr)
+            try:
+                self.count_target_val = float(self.count_target.get()) if self.count_target.get() != '' else None
+                self.count_max_time_val = float(self.count_max_time.get())
+            except ValueError:
+                messagebox.showerror('Error', 'Enter a valid target uncertainty and max integration time')
+                return
+            try:
+                self.detector = make_switch_detector(self, controller)
+                self.settle = make_settle_detector(self, controller)
+            except ValueError as e:
+                messagebox.showerror('Error', str(e))
+                return
+            if self.reuse_dark.get():
+                if self.dark_t_tol.get() != '' and controller.SIM_slots.get('ThermSlot', '') == '':
+                    messagebox.showerror('Error', 'Dark count refresh on temperature drift needs a thermometer slot')
+                    return
+                self.dark_cache = DarkCountCache(float(self.dark_t_tol.get()) if self.dark_t_tol.get() != '' else None)
+            else:
+                self.dark_cache = None
         #open pulse counter    
             controller.PCounter = controller.rm.open_resource(controller.instr_address_dict['pulse_c_address'])
-        #setup pulse counter
-            controller.PCounter.write(':INP1:COUP DC;IMP 50 OHM')
-            controller.PCounter.write('SENS:TOT:ARM:STOP:TIM 1')
+            setup_counter(controller)
         #open sim900
             controller.sim900 = SIM900(controller.instr_address_dict['sim900_address'])
         #open attenuator
@@ -630,99 +963,47 @@ class EfficiencyPage(ttk.Frame):
 
             self.working_label['text']="Measurement running!"
             self.working_label['foreground']='green'
-            self.setup_measurement(controller)
-
-    def calc_photon_flux(self, atten, wavelength, input_pwr):
-        h = 6.626070040e-34
-        c = 2.99792458e8
-        out_pwr = (float(input_pwr))*(10**(-float(atten)/10)) 
-        E_per_photon = h*(c/(int(wavelength)*1e-9)) #convert wlength to m 
-        photon_flux = out_pwr/E_per_photon
-        return photon_flux
-
-    def calc_efficiency(self, P_counts,D_counts, photon_flux):
-        eff = ((P_counts-D_counts)/photon_flux)*100
-        return eff
-
-    def setup_measurement(self, controller):
-        if self.first_atten == True:   #Sets up the counter for attenuations
-            self.atten_id = 0
-            self.first_atten = False
-        if self.atten_id >= len(self.attens):
+            controller.start_measurement(self, efficiency_sweep, controller.EFF_filename, self.biases, self.attens, self.wav, self.ip_pwr, self.dark_cache, self.sweep_order.get(),
+                                         self.count_target_val, self.count_max_time_val, self.detector, self.on_switch.get(), self.bias_r, self.settle,
+                                         self.ranger, SweepCheckpoint(controller.EFF_filename, get_settings(self.settings_widgets)))
+
+    def make_ranger(self, controller):
+        if self.auto_range.get() == False:
+            return None
+        if controller.manual_atten:
+            raise ValueError('Auto-ranging needs programmable attenuators')
+        try:
+            target_rate = float(self.range_rate.get())
+            bias = float(self.range_bias.get())
+            start = float(self.attens[0]) if self.attens != [] else None
+        except ValueError:
+            raise ValueError('Enter a valid target count rate and ranging bias')
+        return AttenuationRanger(target_rate, bias, start)
+
+    def on_engine_message(self, controller, kind, payload):
+        if kind != 'sample':    #finished, stopped or failed
             self.working_label['text']="No measurement running"
             self.working_label['foreground']='red'
-            controller.measurement_after_id = None
-            if controller.manual_atten == False:
-                controller.Op_Attn_1.write(':OUTP:STAT OFF')
-        else:
-            self.atten = int(self.attens[self.atten_id])
-            self.photon_flux = self.calc_photon_flux(self.atten, self.wav, self.ip_pwr)
-            with open(controller.EFF_filename, 'a+') as file_handle:
-                writer_csv =  csv.writer(file_handle, delimiter=',')
-                writer_csv.writerow((['ATTENUATION', self.atten, self.photon_flux ]))
-            if controller.manual_atten == False:    #If two attenuators needed use both
-                if controller.instr_address_dict["opat2_address"] != '':
-                    controller.Op_Attn_1.write(':INP:ATT '+ str(self.atten/2) + ' dB')
-                    controller.Op_Attn_2.write(':INP:ATT '+ str(self.atten/2) + ' dB')
-                    controller.Op_Attn_2.write(':OUTP:STAT ON')
-                else:    #else use one
-                    controller.Op_Attn_1.write(':INP:ATT '+ str(self.atten) + ' dB')
-            self.get_EFF_data(controller)
-        
-    def get_EFF_data(self, controller):
-        if controller.measurement_after_id == None:    #Sets up the counter for bias points
-            self.bias_id = 0
-        #SET BIAS
-        controller.sim900.write(controller.SIM_slots['VSource'], 'VOLT %.3f'%self.biases[self.bias_id])
-        controller.sim900.write(controller.SIM_slots['VSource'],'OPON')
-        #TAKE DATA
-        #DC
-        self.counts_cont=[]
-        if controller.manual_atten == False:
-            controller.Op_Attn_1.write(':OUTP:STAT OFF')
-        else:
-            messagebox.showinfo('Block input', 'Block the light into the fibre')
-        while len(self.counts_cont) < 5:
-            controller.PCounter.write('SENS:TOT:ARM:STOP:TIM 1')
-            self.counts_cont.append(float(controller.PCounter.query("READ?")))
-        DC_val = sum(self.counts_cont)/5
-        
-        #PC
-        if controller.manual_atten == False:
-            controller.Op_Attn_1.write(':OUTP:STAT ON')
-        else:
-            messagebox.showinfo('Unblock input', 'Allow the light into the fibre')
-        self.counts_cont = []
-        while len(self.counts_cont) < 5:
-            controller.PCounter.write('SENS:TOT:ARM:STOP:TIM 1')
-            self.counts_cont.append(float(controller.PCounter.query("READ?")))
-        PC_val = sum(self.counts_cont)/5
-        eff = self.calc_efficiency(PC_val, DC_val, self.photon_flux)
-
-        data_to_write = ([self.biases[self.bias_id], DC_val, PC_val, eff])
-        #WRITE DATA
-        with open(controller.EFF_filename, 'a+') as file_handle:
-            writer_csv =  csv.writer(file_handle, delimiter=',')
-            writer_csv.writerow(data_to_write)
-        self.bias_id += 1
-        if self.bias_id < len(self.biases):    #check doing all points here
-            controller.measurement_after_id = app.after(1500, self.get_EFF_data, controller)    #wait 1s, go again.
-        elif self.bias_id == len(self.biases):
-            controller.sim900.write(controller.SIM_slots['VSource'],'OPOF')    #turn bias off before changing attenuations
-            self.atten_id += 1
-            controller.measurement_after_id = None
-            self.setup_measurement(controller)
+        elif payload[0] == 'RANGING':
+            self.atten_value_label['text'] = '%gdB: %.4g CPS'%(payload[1], payload[2])
+        elif payload[0] == 'ATTENUATION' and self.ranger != None:
+            self.attens_entry.delete(0, END)
+            self.attens_entry.insert(0, str(payload[1]))
 
     def stop_meas(self, controller):
-        if controller.measurement_after_id != None:
-            app.after_cancel(controller.measurement_after_id)
-            controller.measurement_after_id = None
-        self.working_label['text']="No measurement running"
-        self.working_label['foreground']='red'
-
-    def calculate_atten(self, laser_r, wav, power):
-        h = 6.626070040e-34
-        c = 2.99792458e8
+        controller.engine.stop()
+
+    def pause_meas(self, controller):
+        if controller.engine.paused:
+            controller.engine.resume()
+            self.working_label['text']="Measurement running!"
+            self.working_label['foreground']='green'
+        elif controller.engine.running:
+            controller.engine.pause()
+            self.working_label['text']="Measurement paused"
+            self.working_label['foreground']='orange'
+
+    def calculate_atten(self, laser_r, wav, power, ph_wanted):
         if laser_r == '':
             messagebox.showerror('Error', 'Enter a valid laser rep rate')
         elif wav == '':
@@ -730,18 +1011,17 @@ class EfficiencyPage(ttk.Frame):
         elif power == '':
             messagebox.showerror('Error', 'Enter a valid power')
         else:
-            ppp = []
             laser_rr=float(laser_r)
-            energy_per_photon = h*(c/(float(wav)/1e9))
-            if laser_rr == 1:    #For CW
+            if ph_wanted != '':
+                ideal_num = float(ph_wanted)
+            elif laser_rr == 1:    #For CW
                 ideal_num = 1000000
             else:    #For pulsed
                 ideal_num = 0.1
-            for i in range(0,180):    #Goes through 0to180dB attenuations and calculates photons per pulse for each
-                ph_p_pul = (float(power)*10**(-(float(i)/10))/energy_per_photon)*(1/laser_rr)
-                ppp.append(ph_p_pul)
-            nearest = min(ppp, key=lambda x:abs(x-ideal_num))    #Finds nearest value to ideal value
-            self.atten_value_label['text'] = str(ppp.index(nearest))+'dB'
+            atten = atten_for_photon_flux(ideal_num*laser_rr, wav, power)    #photons/s wanted
+            self.atten_value_label['text'] = '%gdB'%atten
+            self.attens_entry.delete(0, END)
+            self.attens_entry.insert(0, '%g'%atten)
 
 ##############################################################################
 #DCR measurement page
@@ -766,8 +1046,8 @@ class DCRPage(ttk.Frame):
         bias_r = ttk.Entry(self)
         bias_r.grid(row=4,column=2)
 
-        start_meas_button = ttk.Button(self, text="Start measuring", command=lambda:self.start_meas(controller, start_bias.get(), end_bias.get(), bias_step.get(), bias_r.get()))
-        start_meas_button.grid(row=5,column=1)
+        self.start_meas_button = ttk.Button(self, text="Start measuring", command=lambda:self.start_meas(controller, start_bias.get(), end_bias.get(), bias_step.get(), bias_r.get()))
+        self.start_meas_button.grid(row=5,column=1)
 
         self.working_label = ttk.Label(self, text="No measurement running", foreground='red')
         self.working_label.grid(row=5,column=2)
@@ -775,60 +1055,216 @@ class DCRPage(ttk.Frame):
         stop_meas_button = ttk.Button(self, text="Stop measuring", command=lambda:self.stop_meas(controller))
         stop_meas_button.grid(row=6,column=1)
 
+        pause_meas_button = ttk.Button(self, text="Pause/Resume", command=lambda:self.pause_meas(controller))
+        pause_meas_button.grid(row=6,column=2)
+
         graph_button = ttk.Button(self, text="Graph", command=lambda: extract_data(controller, 'DCR'))
         graph_button.grid(row=7,column=1)
 
+        ttk.Button(self, text="Resume interrupted sweep", command=lambda: resume_sweep(self)).grid(row=7,column=2)
+        self.resume_filename = None
+
         ttk.Button(self, text="Go back to instrument setup page", command=lambda: controller.show_frame(StartPage)).grid(row=8,column=1)
         ttk.Button(self, text="Go back to measurement choice page", command=lambda: controller.show_frame(MeasTypePage)).grid(row=9,column=1)
+
+        #Long integration options for low DCR
+        ttk.Label(self, text="Long integration (low DCR)", font=LARGE_FONT).grid(row=1,column=3,columnspan=2)
+
+        ttk.Label(self, text="Min total counts per bias (blank for one 1s gate):").grid(row=2,column=3)
+        self.min_counts = ttk.Entry(self)
+        self.min_counts.grid(row=2,column=4)
+
+        ttk.Label(self, text="Max dwell per bias (s):").grid(row=3,column=3)
+        self.max_dwell = ttk.Entry(self)
+        self.max_dwell.insert(0, '60')
+        self.max_dwell.grid(row=3,column=4)
+
+        ttk.Label(self, text="Move on once rate is clearly below (CPS, optional):").grid(row=4,column=3)
+        self.rate_floor = ttk.Entry(self)
+        self.rate_floor.grid(row=4,column=4)
+
+        self.progress_label = ttk.Label(self, text='')
+        self.progress_label.grid(row=5,column=3,columnspan=2)
+
+        add_switch_options(self, 6, 3)
+
+        add_adaptive_options(self, 9, 3)
+
+        add_settle_options(self, 11, 3)
+
+        add_format_option(self, 14, 3)
+
+        #Saved in the checkpoint so a resumed sweep gets the same settings
+        self.settings_widgets = {'start_bias': start_bias, 'end_bias': end_bias, 'bias_step': bias_step, 'bias_r': bias_r,
+                                 'min_counts': self.min_counts, 'max_dwell': self.max_dwell, 'rate_floor': self.rate_floor,
+                                 'detect_switch': self.detect_switch, 'on_switch': self.on_switch, 'switch_v': self.switch_v,
+                                 'adaptive': self.adaptive, 'point_budget': self.point_budget, 'detect_settle': self.detect_settle,
+                                 'settle_method': self.settle_method, 'settle_tol': self.settle_tol}
         
     def start_meas(self, controller, start_bias, stop_bias, bias_step, bias_r):
-        controller.Filename = os.path.dirname(os.path.abspath(__file__))+"\\Data\\"+time.ctime().replace(" ", "_").replace(":","_")+"_DCR.txt"
-        with open (controller.Filename, 'a+') as DCR_file:
-            writer_csv = csv.writer(DCR_file, delimiter=',')
-            writer_csv.writerow(['Time(s)', 'VSrc(V)', 'ISrc(A)', 'Counts(CPS)'])
-        self.biases = np.arange(float(start_bias), float(stop_bias)+float(bias_step), float(bias_step)) 
+        resume_filename, self.resume_filename = self.resume_filename, None
+        if controller.engine.running:
+            messagebox.showerror('Error', 'Measurement still running')
+            return
+        try:
+            min_counts = float(self.min_counts.get()) if self.min_counts.get() != '' else None
+            max_dwell = float(self.max_dwell.get())
+            rate_floor = float(self.rate_floor.get()) if self.rate_floor.get() != '' else None
+        except ValueError:
+            messagebox.showerror('Error', 'Enter valid long integration settings')
+            return
+        try:
+            detector = make_switch_detector(self, controller)
+            settle = make_settle_detector(self, controller)
+        except ValueError as e:
+            messagebox.showerror('Error', str(e))
+            return
+        try:
+            self.biases = make_bias_plan(self, start_bias, stop_bias, bias_step, log_values=True)
+        except ValueError as e:
+            messagebox.showerror('Error', str(e))
+            return
+        if resume_filename != None:    #Carry on appending to the interrupted sweep's file
+            controller.Filename = resume_filename
+        else:
+            controller.Filename = os.path.dirname(os.path.abspath(__file__))+"\\Data\\"+time.ctime().replace(" ", "_").replace(":","_")+"_DCR"+data_extension(self)
         self.bias_r = bias_r
         controller.PCounter = controller.rm.open_resource(controller.instr_address_dict['pulse_c_address'])
-        #setup pulse counter
-        controller.PCounter.write(':INP1:COUP DC;IMP 50 OHM')
-        controller.PCounter.write('SENS:TOT:ARM:STOP:TIM 1')
+        setup_counter(controller)
         #open sim900
         controller.sim900 = SIM900(controller.instr_address_dict['sim900_address'])
         self.working_label['text']="Measurement running!"
         self.working_label['foreground']='green'
-        self.get_DCR_data(controller)
-        
-    def get_DCR_data(self, controller):
-        if controller.measurement_after_id == None:
-            self.start_time_meas = time.time()
-            self.bias_id = 0
-        #SET BIAS
-        controller.sim900.write(controller.SIM_slots['VSource'], 'VOLT %.3f'%self.biases[self.bias_id])
-        controller.sim900.write(controller.SIM_slots['VSource'],'OPON')
-        #TAKE DATA
-        data_to_write = [str(time.time()-self.start_time_meas)]#time
-        data_to_write.append(str(self.biases[self.bias_id]).strip()) #voltage
-        I_src = self.biases[self.bias_id]/float(self.bias_r) #work out the current from the bias r
-        data_to_write.append(str(I_src).strip())
-        data_to_write.append(float(controller.PCounter.query('READ?')))
-        #WRITE DATA
-        with open(controller.Filename, 'a+') as file_handle:
-            writer_csv =  csv.writer(file_handle, delimiter=',')
-            writer_csv.writerow(data_to_write)
-        self.bias_id += 1
-        if self.bias_id < len(self.biases):#check doing all points here
-            controller.measurement_after_id = app.after(1500, self.get_DCR_data, controller) #wait 1.5s, go again.
+        controller.start_measurement(self, dcr_sweep, controller.Filename, self.biases, self.bias_r, min_counts, max_dwell, rate_floor,
+                                     detector, self.on_switch.get(), settle, SweepCheckpoint(controller.Filename, get_settings(self.settings_widgets)))
+
+    def on_engine_message(self, controller, kind, payload):
+        if kind == 'sample':
+            if payload[0] == 'PROGRESS':    #Running rate while integrating
+                self.progress_label['text'] = "Bias %.3f V: %.3g +/- %.2g CPS after %d s"%tuple(payload[1:])
+            elif payload[0] == 'SWITCHING':
+                self.progress_label['text'] = "Switched at %.3f V"%payload[1]
         else:
             self.working_label['text']="No measurement running"
             self.working_label['foreground']='red'
-            controller.measurement_after_id = None
 
     def stop_meas(self, controller):
-        if controller.measurement_after_id != None:
-            app.after_cancel(controller.measurement_after_id)
-            controller.measurement_after_id = None
-        self.working_label['text']="No measurement running"
-        self.working_label['foreground']='red'
+        controller.engine.stop()
+
+    def pause_meas(self, controller):
+        if controller.engine.paused:
+            controller.engine.resume()
+            self.working_label['text']="Measurement running!"
+            self.working_label['foreground']='green'
+        elif controller.engine.running:
+            controller.engine.pause()
+            self.working_label['text']="Measurement paused"
+            self.working_label['foreground']='orange'
+
+##############################################################################
+#Switching current search page
+##############################################################################
+
+class IswPage(ttk.Frame):
+    def __init__(self, parent, controller):
+        Frame.__init__(self, parent)
+        ttk.Label(self, text="Lowest bias to search from?:").grid(row=1,column=1)
+        low_bias = ttk.Entry(self)
+        low_bias.grid(row=1,column=2)
+
+        ttk.Label(self, text="Highest bias to search to?:").grid(row=2,column=1)
+        high_bias = ttk.Entry(self)
+        high_bias.grid(row=2,column=2)
+
+        ttk.Label(self, text="Resolution? (V, 0.001 minimum):").grid(row=3,column=1)
+        resolution = ttk.Entry(self)
+        resolution.grid(row=3,column=2)
+
+        ttk.Label(self, text="Bias resistor value?:").grid(row=4,column=1)
+        bias_r = ttk.Entry(self)
+        bias_r.grid(row=4,column=2)
+
+        ttk.Label(self, text="Number of repeats (for the histogram)?:").grid(row=5,column=1)
+        repeats = ttk.Entry(self)
+        repeats.insert(0, '1')
+        repeats.grid(row=5,column=2)
+
+        ttk.Label(self, text="Detect switching with:").grid(row=6,column=1)
+        self.method = ttk.Combobox(self, values=['voltmeter', 'counter'], state='readonly')
+        self.method.set('voltmeter')
+        self.method.grid(row=6,column=2)
+
+        ttk.Label(self, text="Switched above V-dev (V) / below count rate (CPS):").grid(row=7,column=1)
+        threshold = ttk.Entry(self)
+        threshold.insert(0, '0.01')
+        threshold.grid(row=7,column=2)
+
+        start_meas_button = ttk.Button(self, text="Start measuring", command=lambda:self.start_meas(controller, low_bias.get(), high_bias.get(), resolution.get(),
+                                                                                                   bias_r.get(), repeats.get(), threshold.get()))
+        start_meas_button.grid(row=8,column=1)
+
+        self.working_label = ttk.Label(self, text="No measurement running", foreground='red')
+        self.working_label.grid(row=8,column=2)
+
+        stop_meas_button = ttk.Button(self, text="Stop measuring", command=lambda:self.stop_meas(controller))
+        stop_meas_button.grid(row=9,column=1)
+
+        pause_meas_button = ttk.Button(self, text="Pause/Resume", command=lambda:self.pause_meas(controller))
+        pause_meas_button.grid(row=9,column=2)
+
+        self.result_label = ttk.Label(self, text='')
+        self.result_label.grid(row=10,column=1,columnspan=2)
+
+        graph_button = ttk.Button(self, text="Graph", command=lambda: extract_data(controller, 'ISW'))
+        graph_button.grid(row=11,column=1)
+
+        ttk.Button(self, text="Go back to instrument setup page", command=lambda: controller.show_frame(StartPage)).grid(row=12,column=1)
+        ttk.Button(self, text="Go back to measurement choice page", command=lambda: controller.show_frame(MeasTypePage)).grid(row=13,column=1)
+
+        add_format_option(self, 1, 3)
+
+    def start_meas(self, controller, low_bias, high_bias, resolution, bias_r, repeats, threshold):
+        if controller.engine.running:
+            messagebox.showerror('Error', 'Measurement still running')
+            return
+        try:
+            low_bias, high_bias, resolution = float(low_bias), float(high_bias), float(resolution)
+            bias_r, repeats, threshold = float(bias_r), int(repeats), float(threshold)
+        except ValueError:
+            messagebox.showerror('Error', 'Enter valid search settings')
+            return
+        if self.method.get() == 'voltmeter' and controller.SIM_slots.get('VMeter', '') == '':
+            messagebox.showerror('Error', 'Voltmeter detection needs a voltmeter slot')
+            return
+        controller.Filename = os.path.dirname(os.path.abspath(__file__))+"\\Data\\"+time.ctime().replace(" ", "_").replace(":","_")+"_ISW"+data_extension(self)
+        controller.sim900 = SIM900(controller.instr_address_dict['sim900_address'])
+        if self.method.get() == 'counter':
+            controller.PCounter = controller.rm.open_resource(controller.instr_address_dict['pulse_c_address'])
+            setup_counter(controller)
+        self.working_label['text']="Measurement running!"
+        self.working_label['foreground']='green'
+        controller.start_measurement(self, switching_current_search, controller.Filename, low_bias, high_bias, resolution,
+                                     bias_r, repeats, self.method.get(), threshold)
+
+    def on_engine_message(self, controller, kind, payload):
+        if kind == 'sample':
+            self.result_label['text'] = "Repeat %d: Isw = %.4g A (%d steps)"%(payload[0], payload[2], payload[3])
+        else:
+            self.working_label['text']="No measurement running"
+            self.working_label['foreground']='red'
+
+    def stop_meas(self, controller):
+        controller.engine.stop()
+
+    def pause_meas(self, controller):
+        if controller.engine.paused:
+            controller.engine.resume()
+            self.working_label['text']="Measurement running!"
+            self.working_label['foreground']='green'
+        elif controller.engine.running:
+            controller.engine.pause()
+            self.working_label['text']="Measurement paused"
+            self.working_label['foreground']='orange'
 
 ##############################################################################
 #Plot existing data file page
@@ -853,6 +1289,17 @@ class PlotExistingFilePage(ttk.Frame):
         plot_VvT_b = ttk.Button(self, text='Plot values vs time file', command=lambda: self.plot_type_handler(controller,'VvT'))
         plot_VvT_b.grid(row=5,column=1)
 
+        ttk.Label(self, text="Corrected input power (W) for an efficiency file (blank keeps the saved one):").grid(row=6,column=1)
+        corrected_pwr = ttk.Entry(self)
+        corrected_pwr.grid(row=6,column=2)
+
+        ttk.Label(self, text="Wavelength (nm, blank keeps the saved one):").grid(row=7,column=1)
+        corrected_wav = ttk.Entry(self)
+        corrected_wav.grid(row=7,column=2)
+
+        reprocess_b = ttk.Button(self, text='Recompute efficiency and plot it', command=lambda: self.reprocess(controller, corrected_pwr.get(), corrected_wav.get()))
+        reprocess_b.grid(row=8,column=1)
+
     def load_file(self):
         self.generic_filename = askopenfilename(initialdir="Z:\\", title="Choose a file")
     
@@ -872,6 +1319,22 @@ class PlotExistingFilePage(ttk.Frame):
                 controller.Filename = self.generic_filename
                 extract_data(controller, plt_type)
 
+    def reprocess(self, controller, input_power, wavelength):
+        #Writes <file>_reprocessed with the efficiency recomputed, the original is left alone
+        if self.generic_filename == '':
+            messagebox.showerror('Error', 'No file loaded!')
+            return
+        base, extension = os.path.splitext(self.generic_filename)
+        new_filename = base+'_reprocessed'+extension
+        try:
+            save_reprocessed(self.generic_filename, new_filename, float(input_power) if input_power != '' else None,
+                             float(wavelength) if wavelength != '' else None)
+        except ValueError as e:
+            messagebox.showerror('Error', str(e))
+            return
+        controller.EFF_filename = new_filename
+        graph_EFF(controller)
+
 ##############################################################################
 #R-T Pages
 ##############################################################################
@@ -891,114 +1354,334 @@ class RTPage(ttk.Frame):
         bias_point=ttk.Entry(self)
         bias_point.grid(row=5,column=1)
 
-        start_meas_button = ttk.Button(self, text="Start measuring", command=lambda:self.start_meas(controller, bias_r.get(), bias_point.get()))
-        start_meas_button.grid(row=6,column=1)
+        ttk.Label(self, text="Sample period in seconds (leave blank for 1s):").grid(row=6,column=1)
+        period=ttk.Entry(self)
+        period.grid(row=7,column=1)
+
+        start_meas_button = ttk.Button(self, text="Start measuring", command=lambda:self.start_meas(controller, bias_r.get(), bias_point.get(), period.get()))
+        start_meas_button.grid(row=8,column=1)
 
         self.working_label = ttk.Label(self, text="No measurement running", foreground='red')
-        self.working_label.grid(row=7,column=1)
+        self.working_label.grid(row=9,column=1)
+
+        self.missed_label = ttk.Label(self, text="Missed samples = 0")
+        self.missed_label.grid(row=9,column=2)
         
         stop_meas_button = ttk.Button(self, text="Stop measuring", command=lambda:self.stop_meas(controller))
-        stop_meas_button.grid(row=8,column=1)
+        stop_meas_button.grid(row=10,column=1)
+
+        pause_meas_button = ttk.Button(self, text="Pause/Resume", command=lambda:self.pause_meas(controller))
+        pause_meas_button.grid(row=10,column=2)
 
         graph_button = ttk.Button(self, text="Graph", command=lambda: extract_data(controller, 'RT'))
-        graph_button.grid(row=9,column=1)
+        graph_button.grid(row=11,column=1)
+
+        ttk.Button(self, text="Go back to instrument setup page", command=lambda: controller.show_frame(StartPage)).grid(row=12,column=1)
+        ttk.Button(self, text="Go back to measurement choice page", command=lambda: controller.show_frame(MeasTypePage)).grid(row=13,column=1)
 
-        ttk.Button(self, text="Go back to instrument setup page", command=lambda: controller.show_frame(StartPage)).grid(row=10,column=1)
-        ttk.Button(self, text="Go back to measurement choice page", command=lambda: controller.show_frame(MeasTypePage)).grid(row=11,column=1)
+        add_format_option(self, 2, 2, logs=True)
 
-    def start_meas(self, controller, bias_r, bias_point):
-        controller.Filename = os.path.dirname(os.path.abspath(__file__))+"\\Data\\"+time.ctime().replace(" ", "_").replace(":","_")+"_RT.txt"
-        with open (controller.Filename, 'a+') as RT_file:
-            writer_csv = csv.writer(RT_file, delimiter=',')
-            writer_csv.writerow(['Time(s)', 'T1(K)', 'T2(K)', 'T3(K)', 'VSrc(V)', 'VDev(V)', 'RDev'])
+    def start_meas(self, controller, bias_r, bias_point, period):
+        if controller.engine.running:
+            messagebox.showerror('Error', 'Measurement still running')
+            return
+        try:
+            self.scheduler = FixedRateScheduler(float(period) if period != '' else 1)
+        except ValueError:
+            messagebox.showerror('Error', 'Enter a valid sample period')
+            return
+        controller.Filename = os.path.dirname(os.path.abspath(__file__))+"\\Data\\"+time.ctime().replace(" ", "_").replace(":","_")+"_RT"+data_extension(self)
         self.bias_r = float(bias_r)
-        #open sim900 and set the bias point
+        #open sim900, the bias point is set by the measurement
         controller.sim900 = SIM900(controller.instr_address_dict['sim900_address'])
-        controller.sim900.write(controller.SIM_slots['VSource'], 'VOLT '+bias_point)
-        controller.sim900.write(controller.SIM_slots['VSource'],'OPON')
         self.working_label['text']="Measurement running!"
         self.working_label['foreground']='green'
-        self.get_RT_data(controller)
-
-    def get_RT_data(self, controller):
-        if controller.measurement_after_id == None:
-            self.start_time_meas = time.time()
-        #TAKE DATA
-        data_to_write = [str(time.time()-self.start_time_meas)]#time
-        t1 = str(controller.sim900.ask(controller.SIM_slots['ThermSlot'],'TVAL? 1')).strip()
-        t2 = str(controller.sim900.ask(controller.SIM_slots['ThermSlot'],'TVAL? 2')).strip()
-        t3 = str(controller.sim900.ask(controller.SIM_slots['ThermSlot'],'TVAL? 3')).strip()
-        Vsrc=float(controller.sim900.ask(controller.SIM_slots['VMeter'],'VOLT? 1,1').strip().split(' ')[-1])
-        Vdev=float(controller.sim900.ask(controller.SIM_slots['VMeter'],'VOLT? 2,1').strip())
-        R = Vdev/((Vsrc-Vdev)/self.bias_r)
-        data_to_write+=[t1,t2,t3,Vsrc,Vdev,R]
-        #WRITE DATA
-        with open(controller.Filename, 'a+') as file_handle:
-            writer_csv =  csv.writer(file_handle, delimiter=',')
-            writer_csv.writerow(data_to_write)
-
-        controller.measurement_after_id = app.after(1000, self.get_RT_data, controller) #wait 1s, go again.
-        
+        controller.start_measurement(self, rt_log, controller.Filename, self.bias_r, bias_point, self.scheduler)
+
+    def on_engine_message(self, controller, kind, payload):
+        if kind == 'sample':
+            self.missed_label['text'] = "Missed samples = "+str(self.scheduler.missed)
+        else:    #Bias is turned off by the measurement when it stops
+            self.working_label['text']="No measurement running"
+            self.working_label['foreground']='red'
+
     def stop_meas(self, controller):
-        if controller.measurement_after_id != None:
-            app.after_cancel(controller.measurement_after_id)
-            controller.measurement_after_id = None
-        self.working_label['text']="No measurement running"
-        self.working_label['foreground']='red'
-        controller.sim900.write(controller.SIM_slots['VSource'],'OPOF')
+        controller.engine.stop()
+
+    def pause_meas(self, controller):
+        if controller.engine.paused:
+            controller.engine.resume()
+            self.working_label['text']="Measurement running!"
+            self.working_label['foreground']='green'
+        elif controller.engine.running:
+            controller.engine.pause()
+            self.working_label['text']="Measurement paused"
+            self.working_label['foreground']='orange'
+
+##############################################################################
+#Job queue page
+##############################################################################
+
+class QueuePage(ttk.Frame):
+    def __init__(self, parent, controller):
+        Frame.__init__(self, parent)
+        #Queue is kept in the data folder so it survives restarts
+        self.data_dir = os.path.dirname(os.path.abspath(__file__))+"\\Data\\"
+        self.job_queue = JobQueue(os.path.join(self.data_dir, 'job_queue.json'))
+
+        label = ttk.Label(self, text="Job queue: jobs run back-to-back, each into its own file", font=LARGE_FONT)
+        label.grid(row=1,column=1,columnspan=3,padx=20)
+
+        ttk.Label(self, text="Job type:").grid(row=2,column=1)
+        self.job_kind = ttk.Combobox(self, values=list(JOB_PARAMS.keys()), state='readonly')
+        self.job_kind.set('DCR')
+        self.job_kind.grid(row=2,column=2)
+        self.job_kind.bind("<<ComboboxSelected>>", lambda event: self.show_params_help())
+
+        ttk.Label(self, text="Parameters (key=value, lists with ;):").grid(row=3,column=1)
+        self.job_params = ttk.Entry(self, width=80)
+        self.job_params.grid(row=3,column=2,columnspan=2)
+
+        self.params_help = ttk.Label(self, text='')
+        self.params_help.grid(row=4,column=1,columnspan=3)
+        self.show_params_help()
+
+        ttk.Button(self, text="Add job", command=self.add_job).grid(row=5,column=1)
+        ttk.Button(self, text="Remove selected job", command=self.remove_job).grid(row=5,column=2)
+        ttk.Button(self, text="Clear done/failed jobs", command=self.clear_jobs).grid(row=5,column=3)
+
+        self.job_list = Listbox(self, width=120, height=12)
+        self.job_list.grid(row=6,column=1,columnspan=3)
+        self.refresh_jobs()
+
+        ttk.Button(self, text="Run queue", command=lambda: self.run_queue(controller)).grid(row=7,column=1)
+        ttk.Button(self, text="Stop", command=lambda: controller.engine.stop()).grid(row=7,column=2)
+        ttk.Button(self, text="Pause/Resume", command=lambda: self.pause_meas(controller)).grid(row=7,column=3)
+
+        self.working_label = ttk.Label(self, text="No queue running", foreground='red')
+        self.working_label.grid(row=8,column=1,columnspan=3)
+
+        ttk.Button(self, text="Go back to measurement choice page", command=lambda: controller.show_frame(MeasTypePage)).grid(row=9,column=1)
+
+    def show_params_help(self):
+        params = JOB_PARAMS[self.job_kind.get()]
+        self.params_help['text'] = ', '.join(key if default is REQUIRED else key+'='+str(default) for key, default in params.items())
+
+    def refresh_jobs(self):
+        self.job_list.delete(0, END)
+        for i in range(len(self.job_queue.jobs)):
+            self.job_list.insert(END, self.job_queue.describe(i))
+
+    def add_job(self):
+        try:
+            os.makedirs(self.data_dir)
+        except OSError:
+            pass
+        try:
+            self.job_queue.add(self.job_kind.get(), parse_job_params(self.job_params.get()))
+        except ValueError as e:
+            messagebox.showerror('Error', str(e))
+            return
+        self.refresh_jobs()
+
+    def remove_job(self):
+        if self.job_list.curselection() == ():
+            return
+        try:
+            self.job_queue.remove(self.job_list.curselection()[0])
+        except ValueError as e:
+            messagebox.showerror('Error', str(e))
+        self.refresh_jobs()
+
+    def clear_jobs(self):
+        self.job_queue.clear_finished()
+        self.refresh_jobs()
+
+    def run_queue(self, controller):
+        if controller.engine.running:
+            messagebox.showerror('Error', 'Measurement still running')
+            return
+        if controller.SIM_slots.get('VSource', '') == '':
+            messagebox.showerror('Error', 'Set the SIM900 slots on a setup page first')
+            return
+        if self.job_queue.next_pending()[1] == None:
+            messagebox.showerror('Error', 'No pending jobs')
+            return
+        open_instruments(controller)    #Everything the jobs might need
+        self.working_label['text']="Queue running!"
+        self.working_label['foreground']='green'
+        controller.start_measurement(self, run_jobs, self.job_queue, self.data_dir)
+
+    def on_engine_message(self, controller, kind, payload):
+        if kind == 'sample':
+            if payload[0] == 'JOB':
+                self.working_label['text'] = "Running job "+str(payload[1]+1)+" ("+payload[2]+")"
+                controller.Filename = payload[3]
+                self.refresh_jobs()
+            elif payload[0] == 'JOB_FAILED':
+                self.refresh_jobs()
+        else:
+            self.working_label['text']="No queue running"
+            self.working_label['foreground']='red'
+            self.refresh_jobs()
+
+    def pause_meas(self, controller):
+        if controller.engine.paused:
+            controller.engine.resume()
+            self.working_label['foreground']='green'
+        elif controller.engine.running:
+            controller.engine.pause()
+            self.working_label['foreground']='orange'
 
 ##############################################################################
 #Functions
 ##############################################################################
 
+def add_switch_options(frame, row, column):
+    #Switching detection widgets shared by the efficiency and DCR pages
+    frame.detect_switch = BooleanVar(value=False)
+    ttk.Checkbutton(frame, text="Stop the sweep when the wire switches/latches", variable=frame.detect_switch).grid(row=row,column=column,columnspan=2)
+
+    ttk.Label(frame, text="On switching (reset = drop bias and retry the point once):").grid(row=row+1,column=column)
+    frame.on_switch = ttk.Combobox(frame, values=['stop', 'reset'], state='readonly')
+    frame.on_switch.set('stop')
+    frame.on_switch.grid(row=row+1,column=column+1)
+
+    ttk.Label(frame, text="Switched if V-dev above (V, needs voltmeter, optional):").grid(row=row+2,column=column)
+    frame.switch_v = ttk.Entry(frame)
+    frame.switch_v.grid(row=row+2,column=column+1)
+
+def make_switch_detector(frame, controller):
+    if frame.detect_switch.get() == False:
+        return None
+    if frame.switch_v.get() == '':
+        return SwitchDetector()
+    if controller.SIM_slots.get('VMeter', '') == '':
+        raise ValueError('Switching detection on V-dev needs a voltmeter slot')
+    try:
+        return SwitchDetector(v_threshold=float(frame.switch_v.get()))
+    except ValueError:
+        raise ValueError('Enter a valid switching voltage')
+
+def add_adaptive_options(frame, row, column):
+    #Adaptive bias planning widgets shared by the efficiency and DCR pages
+    frame.adaptive = BooleanVar(value=False)
+    ttk.Checkbutton(frame, text="Adaptive bias steps (bias step is then the finest step)", variable=frame.adaptive).grid(row=row,column=column,columnspan=2)
+
+    ttk.Label(frame, text="Total number of bias points:").grid(row=row+1,column=column)
+    frame.point_budget = ttk.Entry(frame)
+    frame.point_budget.insert(0, '40')
+    frame.point_budget.grid(row=row+1,column=column+1)
+
+def make_bias_plan(frame, start_bias, stop_bias, bias_step, log_values):
+    try:
+        start_bias, stop_bias, bias_step = float(start_bias), float(stop_bias), float(bias_step)
+    except ValueError:
+        raise ValueError('Enter valid start/stop/step bias values')
+    if frame.adaptive.get() == False:
+        return np.arange(start_bias, stop_bias+bias_step, bias_step)
+    try:
+        budget = int(frame.point_budget.get())
+    except ValueError:
+        raise ValueError('Enter a valid number of bias points')
+    return AdaptiveBiasPlanner(start_bias, stop_bias, budget, bias_step, log_values=log_values)
+
+def add_settle_options(frame, row, column):
+    #Settle detection widgets shared by the efficiency and DCR pages
+    frame.detect_settle = BooleanVar(value=False)
+    ttk.Checkbutton(frame, text="Move on once readings settle instead of waiting 1.5s", variable=frame.detect_settle).grid(row=row,column=column,columnspan=2)
+
+    ttk.Label(frame, text="Settle using:").grid(row=row+1,column=column)
+    frame.settle_method = ttk.Combobox(frame, values=['counter', 'voltmeter'], state='readonly')
+    frame.settle_method.set('counter')
+    frame.settle_method.grid(row=row+1,column=column+1)
+
+    ttk.Label(frame, text="Settle tolerance (relative) and max settle time (s):").grid(row=row+2,column=column)
+    frame.settle_tol = ttk.Entry(frame)
+    frame.settle_tol.insert(0, '0.05, 1.5')
+    frame.settle_tol.grid(row=row+2,column=column+1)
+
+def make_settle_detector(frame, controller):
+    if frame.detect_settle.get() == False:
+        return None
+    try:
+        tolerance, max_time = [float(i) for i in frame.settle_tol.get().split(',')]
+    except ValueError:
+        raise ValueError('Enter the settle tolerance and max time separated by a comma')
+    return SettleDetector(frame.settle_method.get(), tolerance, max_time=max_time, rig=controller)
+
+def add_format_option(frame, row, column, logs=False):
+    #Data file format, csv text or binary columns (hdf5 only offered with h5py installed,
+    #records only for logs as they can't hold marker rows)
+    ttk.Label(frame, text="Data file format (npz/hdf5/records = binary columns, faster to load):").grid(row=row,column=column)
+    frame.data_format = ttk.Combobox(frame, values=available_formats(logs), state='readonly')
+    frame.data_format.set('csv')
+    frame.data_format.grid(row=row,column=column+1)
+
+def data_extension(frame):
+    return STORE_FORMATS[frame.data_format.get()]
+
+def get_settings(widgets):
+    #Entry/Combobox/BooleanVar values by name, for a checkpoint
+    return dict((name, widget.get()) for name, widget in widgets.items())
+
+def restore_settings(widgets, settings):
+    for name, value in settings.items():
+        if name not in widgets:
+            continue
+        widget = widgets[name]
+        if isinstance(widget, (ttk.Combobox, BooleanVar)):
+            widget.set(value)
+        else:
+            widget.delete(0, END)
+            widget.insert(0, value)
+
+def resume_sweep(frame):
+    #Reloads the settings of an interrupted EFF/DCR sweep and restarts it on the same file
+    filename = askopenfilename(initialdir=os.path.dirname(os.path.abspath(__file__))+"\\Data\\", title="Choose the data file of the interrupted sweep")
+    if filename == '':
+        return
+    if not os.path.exists(checkpoint_path(filename)):
+        messagebox.showerror('Error', 'No checkpoint for that file - the sweep finished or was taken before checkpoints')
+        return
+    restore_settings(frame.settings_widgets, SweepCheckpoint(filename).settings)
+    frame.resume_filename = filename
+    frame.start_meas_button.invoke()
+
 def extract_data(controller, plt_type):
-    if controller.measurement_after_id != None:
+    if controller.engine.running and not readable_while_writing(controller.Filename):
         messagebox.showerror('Error', 'Measurement still running')
     else:
-        controller.plot_arrays_dict={}
-        with open(controller.Filename) as csv_file:
-            read_csv = csv.reader(csv_file, delimiter=',')
-            for index, row in enumerate(read_csv):
-                if len(row)>0:
-                    if index==0:
-                        controller.data_titles = row
-                        number_cols = len(row)
-                        for i in range(number_cols):
-                            controller.plot_col_dict[i]=[]
-                    else:
-                        for i in range(number_cols):
-                            controller.plot_col_dict[i].append(row[i])
-        for i in range(number_cols):
-            controller.plot_arrays_dict[i]=np.asarray(controller.plot_col_dict[i], dtype='float')
+        #One array per column, 'x' cells are NaN. Works mid-run for csv/record files:
+        #the same file is only read from where the last plot got to.
+        if controller.tail == None or controller.tail.filename != controller.Filename:
+            controller.tail = TailReader(controller.Filename)
+        try:
+            controller.tail.read()
+        except (IOError, ValueError) as e:
+            messagebox.showerror('Error', 'Could not read '+controller.Filename+': '+str(e))
+            return
+        controller.data_titles = controller.tail.titles or []
+        controller.plot_arrays_dict = dict(enumerate(controller.tail.columns()))
         controller.plot_type = plt_type
         controller.show_frame(DisplayGraphPage)
 
 
 def graph_EFF(controller):
-    if controller.measurement_after_id != None:
+    if controller.engine.running and not readable_while_writing(controller.EFF_filename):
         messagebox.showerror('Error', 'Measurement still running')
     else:
         controller.plot_arrays_dict={}
         controller.eff_dict = {}
-        bias_list=[]
-        with open(controller.EFF_filename) as csv_file:
-            read_csv = csv.reader(csv_file, delimiter=',')
-            for index, row in enumerate(read_csv):
-                if len(row)>0:
-                    if index == 0:#first time around
-                        atten=row[1]
-                        eff_list = []#empty eff container
-                    elif row[0] =='ATTENUATION':#subsequent data sets
-                        controller.eff_dict[atten] = np.asarray(eff_list, dtype='float')#save off the data
-                        atten = row[1]#new atten
-                        eff_list=[]#reset eff container
-                    else:
-                        eff_list.append(row[3])
-                        if row[0] not in bias_list:#only want one list of biases as the same for each atten
-                            bias_list.append(row[0])
-            #Last one (no 'ATTENUTION' flag
-        controller.eff_dict[atten] = np.asarray(eff_list, dtype='float')
-        controller.bias_arr = np.asarray(bias_list, dtype='float')*10#uA
+        controller.bias_dict = {}    #Each atten has its own biases (adaptive steps/switching can change them)
+        try:
+            blocks = load_efficiency(controller.EFF_filename)
+        except (IOError, ValueError) as e:
+            messagebox.showerror('Error', 'Could not read '+controller.EFF_filename+': '+str(e))
+            return
+        for atten, photon_flux, rows in blocks:
+            controller.eff_dict[atten_label(atten)] = rows['eff']
+            controller.bias_dict[atten_label(atten)] = rows['bias']*10#uA
         controller.plot_type = 'EFF'
         controller.show_frame(DisplayGraphPage)
 
@@ -1006,9 +1689,10 @@ def graph_EFF(controller):
 #Main code
 ##############################################################################
 
-app = DataGatheringapp()
-app.geometry("800x400")
-app.mainloop()
+if __name__ == '__main__':
+    app = DataGatheringapp()
+    app.geometry("800x400")
+    app.mainloop()
 
 ##############################################################################
 #Error logging
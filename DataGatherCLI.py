@@ -0,0 +1,168 @@
+'''
+Command-line runner for DataGather measurements
+
+Runs the efficiency, DCR, RT and values against time measurements without
+Tk or matplotlib, e.g. on a headless lab PC or over SSH. Writes the same
+data files as the GUI and prints each row to stdout as it is taken.
+
+Instruments and SIM900 slots come from a JSON setup file, flags, or both
+(flags win):
+
+    {"instruments": {"sim900_address": "GPIB0::2::INSTR", "pulse_c_address": "GPIB0::3::INSTR"},
+     "slots": {"VSource": "1", "VMeter": "7", "ThermSlot": "", "NumberOfVMeters": 2},
+     "data_dir": "Data"}
+
+The measurement parameters are the job queue ones, given as key=value:
+
+    python DataGatherCLI.py DCR start=0.1 stop=0.8 step=0.01 bias_r=100000 --setup rig.json
+    python DataGatherCLI.py EFF start=0.1 stop=0.8 step=0.01 bias_r=100000 "attens=30;40" wavelength=1550 power=1e-6 --setup rig.json
+    python DataGatherCLI.py RT bias_r=100000 bias_point=0.1 --setup rig.json
+    python DataGatherCLI.py --queue Data/job_queue.json --setup rig.json
+
+--format hdf5 (with h5py installed) writes binary column files instead of csv
+text; npz is for DCR/EFF sweeps and --format records a memory-mappable file
+for long VvT/RT logs. With --queue the format has to suit every pending job.
+
+VvT/RT run until Ctrl-C unless given a duration. Ctrl-C stops cleanly (bias
+off); an interrupted DCR/EFF sweep carries on where it stopped when re-run
+with --file pointing at its data file.
+'''
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from measurement import AcquisitionEngine
+from measurement.rig import Rig, ADDRESS_KEYS, open_instruments
+from measurement.store import STORE_FORMATS, available_formats
+from measurement.jobs import JOB_PARAMS, JobQueue, check_job_params, parse_job_params, job_task, run_jobs
+
+#Same file name endings as the GUI pages
+FILE_ENDINGS = {'EFF': 'EFF', 'DCR': '_DCR', 'RT': '_RT', 'VvT': '_VvT'}
+
+#Flag -> instrument address / SIM900 slot
+ADDRESS_FLAGS = {'sim900': 'sim900_address', 'counter': 'pulse_c_address', 'power_meter': 'power_m_address',
+                 'atten1': 'opat1_address', 'atten2': 'opat2_address'}
+SLOT_FLAGS = {'vsource': 'VSource', 'vmeter': 'VMeter', 'therm': 'ThermSlot', 'vmeters': 'NumberOfVMeters'}
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Run a DataGather measurement without the GUI')
+    parser.add_argument('kind', nargs='?', choices=list(JOB_PARAMS.keys()), help='Measurement type (leave out with --queue)')
+    parser.add_argument('params', nargs='*', help='Measurement parameters as key=value, lists separated by ;')
+    parser.add_argument('--setup', help='JSON file with instruments, slots and data_dir')
+    parser.add_argument('--queue', help='Run every pending job in this job queue file')
+    parser.add_argument('--file', help='Data file to write (an interrupted sweep resumes in it)')
+    parser.add_argument('--data-dir', help='Folder for new data files')
+    parser.add_argument('--format', choices=[fmt for fmt in STORE_FORMATS if fmt in available_formats()+available_formats(logs=True)], default='csv',
+                        help='Format of new data files (npz/hdf5/records = binary columns, npz for sweeps only, records for VvT/RT only)')
+    parser.add_argument('--sim900', help='SIM900 VISA address')
+    parser.add_argument('--counter', help='Pulse counter VISA address')
+    parser.add_argument('--power-meter', help='Power meter VISA address')
+    parser.add_argument('--atten1', help='Optical attenuator 1 VISA address')
+    parser.add_argument('--atten2', help='Optical attenuator 2 VISA address')
+    parser.add_argument('--vsource', help='SIM900 voltage source slot')
+    parser.add_argument('--vmeter', help='SIM900 voltmeter slot')
+    parser.add_argument('--vmeters', type=int, help='Number of voltmeter connections')
+    parser.add_argument('--therm', help='SIM900 thermometer slot')
+    args = parser.parse_args(argv)
+    if args.kind == None and args.queue == None:
+        parser.error('give a measurement type or --queue')
+    if args.kind != None and args.format not in available_formats(logs=args.kind in ('VvT', 'RT')):
+        parser.error('--format '+args.format+(' is not for VvT/RT logs' if args.kind in ('VvT', 'RT') else ' is for VvT/RT logs only'))
+    return args
+
+
+def make_rig(args):
+    setup = {}
+    if args.setup != None:
+        with open(args.setup) as file_handle:
+            setup = json.load(file_handle)
+    addresses = dict((key, '') for key in ADDRESS_KEYS)
+    addresses.update(setup.get('instruments', {}))
+    slots = dict(setup.get('slots', {}))
+    for flag, key in ADDRESS_FLAGS.items():
+        if getattr(args, flag) != None:
+            addresses[key] = getattr(args, flag)
+    for flag, key in SLOT_FLAGS.items():
+        if getattr(args, flag) != None:
+            slots[key] = getattr(args, flag)
+    data_dir = args.data_dir or setup.get('data_dir') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data')
+    return Rig(addresses, slots), data_dir
+
+
+def format_sample(sample):
+    return ', '.join(str(i) for i in sample)
+
+
+def run(engine, task, *args):
+    #Prints samples until the task ends, Ctrl-C stops it cleanly. Returns the exit code.
+    engine.start(task, *args)
+    stopping = False
+    while True:
+        try:
+            for kind, payload in engine.get_messages():
+                if kind == 'sample':
+                    print(format_sample(payload))
+                    sys.stdout.flush()
+                elif kind == 'prompt':
+                    title, message = payload
+                    input(title+': '+message+' - press enter when done ')
+                    engine.acknowledge()
+                elif kind == 'error':
+                    sys.stderr.write('Measurement failed:\n'+payload)
+                    return 1
+                elif kind == 'stopped':
+                    print('Stopped')
+                    return 1
+                else:
+                    print('Finished')
+                    return 0
+            time.sleep(0.1)
+        except KeyboardInterrupt:
+            if stopping:    #Second Ctrl-C - give up waiting for the clean up
+                return 1
+            stopping = True
+            print('Stopping...')
+            engine.stop()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rig, data_dir = make_rig(args)
+    if args.queue != None:
+        job_queue = JobQueue(args.queue)
+        if job_queue.next_pending()[1] == None:
+            print('No pending jobs in '+args.queue)
+            return 0
+        #Every job is written in the one format, so it has to suit all of them
+        kinds = set(job['kind'] for job in job_queue.jobs if job['status'] == 'pending')
+        unsuited = [kind for kind in sorted(kinds) if args.format not in available_formats(logs=kind in ('VvT', 'RT'))]
+        if unsuited != []:
+            sys.stderr.write('--format '+args.format+' can\'t be used for the queued '+'/'.join(unsuited)+' jobs\n')
+            return 2
+        task, task_args = run_jobs, (job_queue, data_dir, STORE_FORMATS[args.format])
+    else:
+        try:
+            params = parse_job_params(','.join(args.params))
+            check_job_params(args.kind, params, optional=('duration',))
+        except ValueError as e:
+            sys.stderr.write(str(e)+'\n')
+            return 2
+        filename = args.file
+        if filename == None:
+            filename = os.path.join(data_dir, time.ctime().replace(" ", "_").replace(":","_")+FILE_ENDINGS[args.kind]+STORE_FORMATS[args.format])
+        task, task_args = job_task, (args.kind, params, filename)
+        print('Writing '+filename)
+    try:
+        os.makedirs(data_dir)
+    except OSError:
+        pass
+    open_instruments(rig)
+    return run(AcquisitionEngine(), task, rig, *task_args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
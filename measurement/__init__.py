@@ -0,0 +1,19 @@
+from .engine import AcquisitionEngine, MeasurementStopped, DirectContext
+from .rig import Rig, open_instruments
+from .physics import calc_photon_flux, calc_efficiency
+from .sweeps import efficiency_sweep, dcr_sweep, DarkCountCache
+from .monitors import values_vs_time, vvt_headers, rt_log
+from .switching import switching_current_search, SwitchDetector
+from .planner import FixedBiasPlan, AdaptiveBiasPlanner
+from .settle import SettleDetector
+from .ranging import AttenuationRanger, atten_for_photon_flux
+from .scheduler import FixedRateScheduler
+from .checkpoint import SweepCheckpoint
+from .writer import DataWriter, open_writer
+from .store import read_columns
+from .loader import load_columns, load_efficiency, EFF_DTYPE
+from .stream import StreamBuffer
+from .decimate import minmax_decimate
+from .metadata import load_run_metadata
+from .reprocess import reprocess_efficiency, save_reprocessed
+from .jobs import JobQueue, run_jobs
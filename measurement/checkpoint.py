@@ -0,0 +1,116 @@
+'''
+Sweep checkpoints
+
+A small JSON file next to the data file records how far a sweep has got:
+which attenuations it has started and finished, where the wire switched
+and the last point taken. The data file itself is the record of what was
+measured - on a restart the points already in it are read back and
+skipped, so a crash between writing a row and updating the checkpoint
+can neither lose the point nor take it twice. The checkpoint stays the
+same size however long the sweep, and is removed once the sweep completes.
+'''
+
+import json
+import os
+
+import numpy as np
+
+from .loader import load_columns, load_efficiency, load_markers
+
+
+def checkpoint_path(filename):
+    return os.path.splitext(filename)[0]+'_checkpoint.json'
+
+
+class SweepCheckpoint(object):
+    def __init__(self, filename, settings=None):
+        self.filename = filename    #Data file the sweep appends to
+        self.path = checkpoint_path(filename)
+        self.settings = settings if settings != None else {}    #Whatever the caller needs to restart it
+        self.attens = {}    #str(atten) -> {'points': n, 'last': row, 'switch': bias or None, 'finished': bool}
+        self.file_rows = None    #str(atten) -> rows in the data file, read once on the first restore
+        if os.path.exists(self.path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as file_handle:
+            state = json.load(file_handle)
+        self.settings = state['settings']
+        self.attens = state['attens']
+        for progress in self.attens.values():
+            progress.pop('rows', None)    #Older checkpoints kept every row
+
+    def save(self):
+        #Write then rename so a crash can't leave half a checkpoint
+        temp = self.path+'.tmp'
+        with open(temp, 'w') as file_handle:
+            json.dump({'filename': self.filename, 'settings': self.settings, 'attens': self.attens}, file_handle)
+        os.replace(temp, self.path)
+
+    def key(self, atten):
+        return str(atten)    #DCR sweeps use atten=None
+
+    def started(self, atten):
+        return self.key(atten) in self.attens
+
+    def finished(self, atten):
+        return self.started(atten) and self.attens[self.key(atten)]['finished']
+
+    def rows(self, atten):
+        #Points of atten already in the data file (all of them for a DCR sweep)
+        #Everything before the restart is in there by the time this is first
+        #called, and points taken since don't need restoring
+        if not self.started(atten) or not os.path.exists(self.filename):
+            return []
+        if self.file_rows == None:
+            self.file_rows = {}
+            if 'None' in self.attens:
+                titles, columns = load_columns(self.filename)
+                rows = np.column_stack(columns) if columns != [] else np.zeros((0, 0))
+                self.file_rows['None'] = rows[~np.isnan(rows).all(axis=1)].tolist()    #A header written again reads as NaN
+            else:
+                for block_atten, flux, block in load_efficiency(self.filename):
+                    #More than one block if a restart wrote the marker again
+                    self.file_rows.setdefault(self.key(block_atten), []).extend(list(row) for row in block.tolist())
+        return self.file_rows.get(self.key(atten if atten == None else float(atten)), [])
+
+    def switch_written(self, atten):
+        #Whether the data file already has the SWITCHING row for atten
+        if not os.path.exists(self.filename):
+            return False
+        current = None
+        for marker in load_markers(self.filename):
+            if marker[0] == 'ATTENUATION':
+                current = float(marker[1])
+            elif marker[0] == 'SWITCHING' and (atten == None or current == float(atten)):
+                return True
+        return False
+
+    def switch_bias(self, atten):
+        return self.attens[self.key(atten)]['switch'] if self.started(atten) else None
+
+    def started_attens(self):
+        return [float(atten) for atten in self.attens if atten != 'None']
+
+    def start(self, atten):
+        self.attens[self.key(atten)] = {'points': 0, 'last': None, 'switch': None, 'finished': False}
+        self.save()
+
+    def add_row(self, atten, row):
+        #Called once the row is in the data file
+        progress = self.attens[self.key(atten)]
+        progress['points'] = progress.get('points', 0)+1
+        progress['last'] = [float(i) for i in row]
+        self.save()
+
+    def switched(self, atten, bias):
+        self.attens[self.key(atten)]['switch'] = bias
+        self.save()
+
+    def finish(self, atten):
+        self.attens[self.key(atten)]['finished'] = True
+        self.save()
+
+    def complete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
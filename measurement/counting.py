@@ -0,0 +1,97 @@
+'''
+Counter integration
+
+Counts are Poisson, so N counts in T seconds gives a rate of N/T with a
+standard error of sqrt(N)/T. Rather than always averaging a fixed number
+of gates, keep gating until the wanted relative precision is reached or
+the time budget runs out.
+'''
+
+import math
+
+GATE_TIME = 1    #s, counter gate used for DCR/PCR
+
+
+class CountIntegrator(object):
+    def __init__(self):
+        self.counts = 0.0
+        self.time = 0.0
+        self.gates = 0
+
+    def add(self, counts, gate_time):
+        self.counts += counts
+        self.time += gate_time
+        self.gates += 1
+
+    @property
+    def rate(self):
+        return self.counts/self.time if self.time > 0 else 0.0
+
+    @property
+    def variance(self):
+        #At least one count, so a run of empty gates doesn't claim zero error
+        return max(self.counts, 1.0)/self.time**2 if self.time > 0 else float('inf')
+
+    @property
+    def error(self):
+        return math.sqrt(self.variance)
+
+
+def difference_uncertainty(light, dark):
+    #Relative uncertainty of (PCR - DCR)
+    diff = light.rate - dark.rate
+    if diff <= 0:
+        return float('inf')
+    return math.sqrt(light.variance + dark.variance)/diff
+
+
+def rate_upper_limit(integrator):
+    #Roughly 95% upper bound on the rate - 3/T when no counts have been seen
+    return (integrator.counts + 2*math.sqrt(integrator.counts) + 3)/integrator.time
+
+
+def gate(engine, rig, integrator, gate_time=GATE_TIME):
+    engine.check()
+    rig.PCounter.write('SENS:TOT:ARM:STOP:TIM '+str(gate_time))
+    integrator.add(float(rig.PCounter.query("READ?")), gate_time)
+
+
+def integrate_dark(engine, rig, target=None, min_gates=5, max_time=30, reference=None):
+    '''
+    target=None takes exactly min_gates. Otherwise gates until the dark rate
+    is known to target relative to 'reference', the expected PCR-DCR (e.g.
+    from the last bias point) - that's what the DCR error ends up on. With
+    no reference it's only min_gates and integrate_light does the rest.
+    '''
+    dark = CountIntegrator()
+    while dark.gates < min_gates:
+        gate(engine, rig, dark)
+    if target == None or reference == None or reference <= 0:
+        return dark
+    while dark.time < max_time:
+        if dark.error <= target*reference/math.sqrt(2):
+            break
+        gate(engine, rig, dark)
+    return dark
+
+
+def integrate_light(engine, rig, dark, target=None, min_gates=5, max_time=30):
+    '''
+    Gates until (PCR-DCR) is known to target relative uncertainty. If the
+    dark counts alone already rule the target out (or there's no light over
+    the dark counts) it stops once the light error is no bigger than the
+    dark one - more gating wouldn't help.
+    '''
+    light = CountIntegrator()
+    while light.gates < min_gates:
+        gate(engine, rig, light)
+    if target == None:
+        return light
+    while light.time < max_time:
+        if difference_uncertainty(light, dark) <= target:
+            break
+        diff = light.rate - dark.rate
+        if light.variance <= dark.variance and (diff <= 0 or dark.error >= target*diff):
+            break
+        gate(engine, rig, light)
+    return light
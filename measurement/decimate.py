@@ -0,0 +1,60 @@
+'''
+Downsampling traces for plotting
+
+A screen can't show more than a few points per pixel column, so drawing a
+multi-million point log is mostly wasted work. For each pixel column of
+the visible x range only the first, last, lowest and highest points are
+kept (M4 decimation) - the line drawn through them covers the same pixels
+as the full trace, so spikes and steps still show. At most 4 points per
+pixel are drawn whatever the file size; zooming in decimates again from
+the full arrays, down to every point. A column with a NaN in it keeps
+one NaN too, so dropouts still break the line.
+
+x has to be sorted (time, or a monotonic sweep); anything else is plotted
+in full.
+'''
+
+import numpy as np
+
+
+def is_sorted(x):
+    #NaN in x counts as unsorted
+    return len(x) < 2 or bool(np.all(x[1:] >= x[:-1]))
+
+
+def minmax_decimate(x, y, x_low, x_high, pixels):
+    #Returns (x, y) of the points to draw between x_low and x_high
+    pixels = max(int(pixels), 1)
+    start = max(np.searchsorted(x, x_low, 'left')-1, 0)    #One point either side so the line runs off the edge
+    end = min(np.searchsorted(x, x_high, 'right')+1, len(x))
+    if end-start <= 4*pixels:
+        return x[start:end], y[start:end]
+    x = x[start:end]
+    y = y[start:end]
+    #First point of each pixel column, empty columns dropped
+    starts = np.unique(np.searchsorted(x, np.linspace(x_low, x_high, pixels+1)[1:-1]))
+    starts = np.concatenate(([0], starts[(starts > 0) & (starts < len(x))]))
+    ends = np.append(starts[1:], len(x))
+    keep = [starts, ends-1, first_match(y, np.fmin.reduceat(y, starts), starts, ends),
+            first_match(y, np.fmax.reduceat(y, starts), starts, ends), first_nan(y, starts, ends)]
+    keep = np.unique(np.concatenate(keep))
+    return x[keep], y[keep]
+
+
+def first_match(y, values, starts, ends):
+    #Index of the first point in each column equal to that column's value
+    #(columns that are all NaN have none)
+    return first_in_column(np.flatnonzero(y == np.repeat(values, ends-starts)), starts, ends)
+
+
+def first_nan(y, starts, ends):
+    #Index of the first NaN in each column that has one, so gaps stay gaps
+    return first_in_column(np.flatnonzero(np.isnan(y)), starts, ends)
+
+
+def first_in_column(matches, starts, ends):
+    #First of the sorted indices matches in each column, for columns that have one
+    found = np.searchsorted(matches, starts)
+    exists = found < len(matches)
+    index = matches[found[exists]]
+    return index[index < ends[exists]]
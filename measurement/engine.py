@@ -0,0 +1,144 @@
+'''
+Acquisition engine
+
+Runs a measurement in its own worker thread so the blocking VISA I/O never
+sits on the Tk mainloop. A measurement is a generator function that takes
+the engine as its first argument; everything it yields is handed back to
+the GUI through a thread-safe queue.
+'''
+
+import queue
+import threading
+import time
+import traceback
+
+
+class MeasurementStopped(Exception):
+    pass
+
+
+class AcquisitionEngine(object):
+    def __init__(self):
+        self.messages = queue.Queue()    #(kind, payload) tuples for the GUI
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._resume_event = threading.Event()    #Cleared while paused
+        self._resume_event.set()
+        self._prompt_event = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread != None and self._thread.is_alive()
+
+    @property
+    def paused(self):
+        return self.running and not self._resume_event.is_set()
+
+    def start(self, task, *args, **kwargs):
+        if self.running:
+            raise RuntimeError('A measurement is already running')
+        self._stop_event.clear()
+        self._resume_event.set()
+        self._thread = threading.Thread(target=self._run, args=(task, args, kwargs), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._resume_event.set()    #Wake a paused or prompting task so it sees the stop
+        self._prompt_event.set()
+
+    def pause(self):
+        self._resume_event.clear()
+
+    def resume(self):
+        self._resume_event.set()
+
+    def join(self, timeout=None):
+        if self._thread != None:
+            self._thread.join(timeout)
+
+    def _run(self, task, args, kwargs):
+        samples = task(self, *args, **kwargs)
+        try:
+            for sample in samples:
+                self.messages.put(('sample', sample))
+                self.check()
+        except MeasurementStopped:
+            self.messages.put(('stopped', None))
+        except Exception:
+            self.messages.put(('error', traceback.format_exc()))
+        else:
+            self.messages.put(('finished', None))
+        finally:
+            samples.close()    #Runs the task's clean up (bias off etc.)
+
+    ##########################################################################
+    #Called from inside a task (worker thread)
+    ##########################################################################
+
+    def check(self):
+        #Blocks while paused, raises if a stop has been requested
+        self._resume_event.wait()
+        if self._stop_event.is_set():
+            raise MeasurementStopped()
+
+    def sleep(self, seconds):
+        #Replaces app.after() waits - can be interrupted by stop
+        end = time.monotonic() + seconds
+        while True:
+            self.check()
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return
+            self._stop_event.wait(min(remaining, 0.1))
+
+    def prompt(self, title, message):
+        #Asks the GUI to show a message box and waits until it is dismissed
+        self._prompt_event.clear()
+        self.messages.put(('prompt', (title, message)))
+        self._prompt_event.wait()
+        self.check()
+
+    ##########################################################################
+    #Called from the GUI thread
+    ##########################################################################
+
+    def acknowledge(self):
+        self._prompt_event.set()
+
+    def get_messages(self):
+        msgs = []
+        while True:
+            try:
+                msgs.append(self.messages.get_nowait())
+            except queue.Empty:
+                return msgs
+
+
+class DirectContext(object):
+    '''
+    Stands in for the engine when a measurement generator is iterated
+    directly in the caller's thread (scripts, notebooks):
+
+        for sample in dcr_sweep(DirectContext(), rig, None, biases, bias_r):
+            ...
+
+    Breaking out of the loop (or closing the generator) runs the task's
+    clean up. Prompts go to on_prompt(title, message), which should return
+    once the operator has done what was asked - by default it waits for
+    enter on the console.
+    '''
+    def __init__(self, on_prompt=None):
+        self.on_prompt = on_prompt
+
+    def check(self):
+        pass
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def prompt(self, title, message):
+        if self.on_prompt != None:
+            self.on_prompt(title, message)
+        else:
+            input(title+': '+message+' - press enter when done ')
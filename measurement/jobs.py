@@ -0,0 +1,249 @@
+'''
+Job queue for unattended runs
+
+A queue is a list of measurements with their parameters, kept in a JSON
+file so it survives the app being closed. run_jobs works through the
+pending ones back-to-back in one engine task, each into its own data
+file. A job that fails is marked as such and the queue carries on; a
+stopped one goes back to pending and sweeps pick up from their checkpoint.
+'''
+
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+
+from .engine import MeasurementStopped
+from .sweeps import efficiency_sweep, dcr_sweep, DarkCountCache
+from .switching import SwitchDetector
+from .monitors import values_vs_time, vvt_headers, rt_log
+from .scheduler import FixedRateScheduler
+from .checkpoint import SweepCheckpoint, checkpoint_path
+
+REQUIRED = object()
+
+#Parameters each kind of job needs or can leave at a default
+JOB_PARAMS = {
+    'DCR': {'start': REQUIRED, 'stop': REQUIRED, 'step': REQUIRED, 'bias_r': REQUIRED, 'min_counts': None,
+            'max_dwell': 60, 'rate_floor': None, 'switching': False},
+    'EFF': {'start': REQUIRED, 'stop': REQUIRED, 'step': REQUIRED, 'bias_r': REQUIRED, 'attens': REQUIRED,
+            'wavelength': REQUIRED, 'power': REQUIRED, 'order': 'interleaved', 'target': None,
+            'max_time': 30, 'reuse_dark': True, 'switching': False},
+    'VvT': {'duration': REQUIRED, 'period': 1, 'wavelength': None, 'average': None},
+    'RT': {'bias_r': REQUIRED, 'bias_point': REQUIRED, 'duration': REQUIRED, 'period': 1},
+}
+#Anything not listed here is a number
+BOOL_PARAMS = ('switching', 'reuse_dark')
+LIST_PARAMS = ('attens',)    #A number or a list of them
+CHOICE_PARAMS = {'order': ('interleaved', 'batched')}
+
+
+def parse_value(text):
+    #'30;40;50' -> [30.0, 40.0, 50.0], numbers -> float, yes/no -> bool
+    text = text.strip()
+    if ';' in text:
+        return [parse_value(i) for i in text.split(';') if i.strip() != '']
+    if text.lower() in ('true', 'yes', 'y'):
+        return True
+    if text.lower() in ('false', 'no', 'n'):
+        return False
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def parse_job_params(text):
+    #'start=0.1, stop=0.8, attens=30;40' -> dict
+    params = {}
+    for item in text.split(','):
+        if item.strip() == '':
+            continue
+        if '=' not in item:
+            raise ValueError('Job parameters must be key=value, not '+item.strip())
+        key, value = item.split('=', 1)
+        params[key.strip()] = parse_value(value)
+    return params
+
+
+def check_job_params(kind, params, optional=()):
+    #optional lets a caller drop requirements, e.g. a duration when it can be stopped by hand
+    if kind not in JOB_PARAMS:
+        raise ValueError('Unknown job type: '+str(kind))
+    unknown = [key for key in params if key not in JOB_PARAMS[kind]]
+    if unknown != []:
+        raise ValueError('Unknown '+kind+' parameters: '+', '.join(unknown))
+    missing = [key for key, default in JOB_PARAMS[kind].items() if default is REQUIRED and key not in params and key not in optional]
+    if missing != []:
+        raise ValueError(kind+' jobs need: '+', '.join(missing))
+    for key, value in params.items():
+        check_job_value(key, value, JOB_PARAMS[kind][key])
+    if params.get('step', 1) == 0:
+        raise ValueError('step can\'t be 0')
+
+
+def check_job_value(key, value, default):
+    #Caught here rather than hours later when the queue gets to the job
+    if value == None and default == None:
+        return
+    if key in BOOL_PARAMS:
+        valid = isinstance(value, bool)
+    elif key in CHOICE_PARAMS:
+        valid = value in CHOICE_PARAMS[key]
+    elif key in LIST_PARAMS and isinstance(value, list):
+        valid = value != [] and all(is_number(i) for i in value)
+    else:
+        valid = is_number(value)
+    if not valid:
+        raise ValueError('Bad value for '+key+': '+str(value))
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def bias_range(start, stop, step):
+    #Same points as np.arange(start, stop+step, step) without the float drift
+    return [round(start+i*step, 6) for i in range(int(round((stop-start)/step))+1)]
+
+
+class JobQueue(object):
+    def __init__(self, path):
+        self.path = path
+        self.jobs = []    #dicts: kind, params, status, filename, error
+        self.lock = threading.RLock()    #run_jobs updates jobs in the worker thread while the queue page adds/removes them
+        if os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as file_handle:
+            self.jobs = json.load(file_handle)
+        for job in self.jobs:
+            if job['status'] == 'running':    #App died mid-job - run it again
+                job['status'] = 'pending'
+
+    def save(self):
+        #Write then rename so a crash can't leave half a queue file. The temp
+        #file has its own name in case a save is ever left behind.
+        with self.lock:
+            handle, temp = tempfile.mkstemp(prefix=os.path.basename(self.path)+'.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(self.path)))
+            try:
+                with os.fdopen(handle, 'w') as file_handle:
+                    json.dump(self.jobs, file_handle, indent=1)
+                os.replace(temp, self.path)
+            except Exception:
+                if os.path.exists(temp):
+                    os.remove(temp)
+                raise
+
+    def add(self, kind, params):
+        check_job_params(kind, params)
+        job = {'kind': kind, 'params': params, 'status': 'pending', 'filename': None, 'error': None}
+        with self.lock:
+            self.jobs.append(job)
+            self.save()
+        return job
+
+    def update(self, job, **changes):
+        with self.lock:
+            job.update(changes)
+            self.save()
+
+    def remove(self, index):
+        with self.lock:
+            if self.jobs[index]['status'] == 'running':
+                raise ValueError('Job is running')
+            del self.jobs[index]
+            self.save()
+
+    def clear_finished(self):
+        with self.lock:
+            self.jobs[:] = [job for job in self.jobs if job['status'] not in ('done', 'failed')]
+            self.save()
+
+    def next_pending(self):
+        with self.lock:
+            for index, job in enumerate(self.jobs):
+                if job['status'] == 'pending':
+                    return index, job
+        return None, None
+
+    def describe(self, index):
+        job = self.jobs[index]
+        params = ', '.join(key+'='+str(value) for key, value in job['params'].items())
+        return '%d. %s [%s] %s'%(index+1, job['kind'], job['status'], params)
+
+
+def run_for(samples, duration):
+    #Ends an open-ended logging loop after duration seconds (None runs until stopped)
+    if duration is REQUIRED or duration == None:
+        duration = float('inf')
+    end = time.time()+duration
+    try:
+        for row in samples:
+            yield row
+            if time.time() >= end:
+                break
+    finally:
+        samples.close()
+
+
+def job_task(engine, rig, kind, params, filename):
+    p = dict(JOB_PARAMS[kind])
+    p.update(params)
+    detector = SwitchDetector() if p.get('switching') else None
+    if kind == 'DCR':
+        return dcr_sweep(engine, rig, filename, bias_range(p['start'], p['stop'], p['step']), p['bias_r'],
+                         p['min_counts'], p['max_dwell'], p['rate_floor'], detector, checkpoint=SweepCheckpoint(filename))
+    if kind == 'EFF':
+        attens = p['attens'] if isinstance(p['attens'], list) else [p['attens']]
+        return efficiency_sweep(engine, rig, filename, bias_range(p['start'], p['stop'], p['step']), attens,
+                                p['wavelength'], p['power'], DarkCountCache() if p['reuse_dark'] else None,
+                                p['order'], p['target'], p['max_time'], detector, 'stop', p['bias_r'],
+                                checkpoint=SweepCheckpoint(filename))
+    if kind == 'VvT':
+        if getattr(rig, 'PM100', None) != None and p['wavelength'] != None:
+            rig.PM100.sense.correction.wavelength = int(p['wavelength'])
+        if getattr(rig, 'PM100', None) != None and p['average'] != None:
+            rig.PM100.sense.average.count = int(p['average'])
+        return run_for(values_vs_time(engine, rig, filename, vvt_headers(rig), FixedRateScheduler(p['period']), True), p['duration'])
+    return run_for(rt_log(engine, rig, filename, p['bias_r'], p['bias_point'], FixedRateScheduler(p['period'])), p['duration'])
+
+
+def run_jobs(engine, rig, job_queue, data_dir, extension='.txt'):
+    #Yields ['JOB', index, kind, filename] as each job starts, then its rows,
+    #and ['JOB_FAILED', index, error] if one fails. extension picks the file format (.npz/.h5 binary).
+    while True:
+        index, job = job_queue.next_pending()
+        if job == None:
+            return
+        #A sweep stopped part way has a checkpoint - carry on in its file
+        filename = job['filename']
+        if filename == None or not os.path.exists(checkpoint_path(filename)):
+            filename = os.path.join(data_dir, time.ctime().replace(" ", "_").replace(":","_")+'_job'+str(index+1)+'_'+job['kind']+extension)
+        job_queue.update(job, filename=filename, status='running', error=None)
+        task = None
+        try:
+            yield ['JOB', index, job['kind'], job['filename']]
+            if job['kind'] == 'EFF' and rig.manual_atten:    #Nobody there to block the light
+                raise ValueError('Queued efficiency jobs need programmable attenuators')
+            task = job_task(engine, rig, job['kind'], job['params'], job['filename'])
+            for row in task:
+                yield row
+        except (MeasurementStopped, GeneratorExit):    #Stopped in the job or between samples
+            job_queue.update(job, status='pending')
+            raise
+        except Exception:
+            job_queue.update(job, status='failed', error=traceback.format_exc().strip().splitlines()[-1])
+            try:
+                rig.sim900.write(rig.SIM_slots['VSource'],'OPOF')    #Don't leave the bias on for the next job
+            except Exception:
+                pass
+            yield ['JOB_FAILED', index, job['error']]
+            continue
+        finally:
+            if task != None:    #Bias off and file closed now, not whenever it's garbage collected
+                task.close()
+        job_queue.update(job, status='done')
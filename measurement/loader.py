@@ -0,0 +1,233 @@
+'''
+Fast data file loading
+
+Reads a csv data file (header row, then rows of numbers) into one float64
+array per column in a single C-level parse instead of building Python lists
+cell by cell. Cells that aren't numbers ('x' where there was no counter)
+become NaN, marker rows (SWITCHING, ATTENUATION) are dropped and a last
+line still being written is left off. pandas is used if it's installed,
+otherwise numpy.loadtxt; a file neither can take (ragged rows) falls back
+to parsing row by row. Binary files (see store.py) are read directly.
+
+Efficiency files are split into their ATTENUATION blocks with one
+str.split and each block parsed the same way, giving a structured array
+(bias, dcr, pcr, eff, eff_err) per attenuation - blocks can be any length.
+
+TailReader follows a file that's still being written: each read() parses
+only the rows appended since the last one, so plotting mid-run costs the
+new data rather than the whole file.
+'''
+
+import csv
+import io
+import os
+
+import numpy as np
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+from .store import is_binary, is_record_file, read_columns, map_records, marker_blocks, to_float
+
+MARKERS = ('ATTENUATION', 'SWITCHING')
+#Efficiency rows - older files have no eff_err column, it's NaN for them
+EFF_DTYPE = np.dtype([('bias', 'f8'), ('dcr', 'f8'), ('pcr', 'f8'), ('eff', 'f8'), ('eff_err', 'f8')])
+EFF_WIDTH = len(EFF_DTYPE.names)
+
+
+def load_columns(filename):
+    #Returns (column titles, list of float64 arrays)
+    if is_binary(filename):
+        titles, columns, metadata = read_columns(filename)
+        return titles, columns
+    with open(filename) as file_handle:    #Universal newlines - csv.writer ends rows with \r\n
+        text = file_handle.read()
+    header, _, body = text.partition('\n')
+    titles = next(csv.reader([header]), [])
+    data = parse_rows(body, len(titles))
+    return titles, [data[:, i] for i in range(len(titles))]
+
+
+def load_efficiency(filename):
+    #Returns [(atten, photon flux, EFF_DTYPE array)] in file order
+    if is_binary(filename):
+        titles, columns, metadata = read_columns(filename)
+        data = np.column_stack(columns) if columns != [] else np.zeros((0, EFF_WIDTH))
+        return [(float(values[0]), float(values[1]), eff_records(data[start:end])) for values, start, end in marker_blocks(metadata, len(data))]
+    with open(filename) as file_handle:
+        text = drop_lines(file_handle.read(), 'SWITCHING,')
+    blocks = []
+    parts = ('\n'+text).split('\nATTENUATION,')
+    for index, part in enumerate(parts[1:]):
+        head, _, body = part.partition('\n')
+        if index < len(parts)-2:    #Only the last block can end in a part-written line
+            body += '\n'
+        first_row = body[:body.find('\n')]
+        width = min(len(first_row.split(',')), EFF_WIDTH) if first_row != '' else EFF_WIDTH
+        head = head.split(',')
+        blocks.append((to_float(head[0]), to_float(head[1] if len(head) > 1 else ''), eff_records(parse_rows(body, width))))
+    return blocks
+
+
+def load_markers(filename):
+    #Marker rows in file order as [name, values...]
+    if is_binary(filename):
+        titles, columns, metadata = read_columns(filename)
+        return [marker[1:] for marker in metadata.get('markers', [])]
+    markers = []
+    with open(filename) as file_handle:
+        for line in file_handle:
+            if line.startswith(MARKERS) and line.endswith('\n'):    #Not a part-written last line
+                markers.append(next(csv.reader([line])))
+    return markers
+
+
+class ColumnBuffer(object):
+    #float64 columns that grow at the end, capacity doubled as they fill
+    def __init__(self):
+        self.buffer = np.empty((0, 0))    #One row per column
+        self.rows = 0
+
+    @property
+    def width(self):
+        return self.buffer.shape[0]
+
+    def append(self, rows):
+        #rows is (n, width) - a different width starts the buffer again
+        width = rows.shape[1]
+        if self.width != width:
+            self.buffer = np.empty((width, 1024))
+            self.rows = 0
+        needed = self.rows+len(rows)
+        if needed > self.buffer.shape[1]:
+            grown = np.empty((width, max(needed, 2*self.buffer.shape[1])))
+            grown[:, :self.rows] = self.buffer[:, :self.rows]
+            self.buffer = grown
+        self.buffer[:, self.rows:needed] = rows.T
+        self.rows = needed
+        return len(rows)
+
+    def clear(self):
+        self.rows = 0
+
+    def columns(self):
+        return [self.buffer[i, :self.rows] for i in range(self.width)]
+
+
+class TailReader(object):
+    def __init__(self, filename):
+        self.filename = filename
+        self.titles = None
+        self.offset = 0    #Bytes of the csv file parsed so far (only complete lines)
+        self.data = ColumnBuffer()
+        self.records = None    #Record files are mapped instead of buffered
+
+    @property
+    def rows(self):
+        return len(self.records) if self.records is not None else self.data.rows
+
+    def reset(self):
+        self.__init__(self.filename)
+
+    def read(self):
+        #Takes in whatever has been appended, returns how many rows that was
+        if not os.path.exists(self.filename):
+            return 0
+        if is_record_file(self.filename):
+            rows = self.rows
+            self.records, header = map_records(self.filename)
+            self.titles = header['columns']
+            return self.rows-rows
+        if is_binary(self.filename):    #npz/h5 aren't read mid-write - take the lot
+            self.titles, columns = load_columns(self.filename)
+            self.data.clear()
+            return self.data.append(np.column_stack(columns) if columns != [] else np.zeros((0, 0)))
+        if os.path.getsize(self.filename) < self.offset:    #File replaced - start again
+            self.reset()
+        with open(self.filename, 'rb') as file_handle:
+            file_handle.seek(self.offset)
+            chunk = file_handle.read()
+        end = chunk.rfind(b'\n')+1
+        self.offset += end
+        text = chunk[:end].decode().replace('\r\n', '\n')
+        if self.titles == None:
+            if end == 0:    #Not even the header yet
+                return 0
+            header, _, text = text.partition('\n')
+            self.titles = next(csv.reader([header]), [])
+        return self.data.append(parse_rows(text, len(self.titles)))
+
+    def columns(self):
+        #Views of the rows read so far, one per title
+        if self.records is not None:
+            return [self.records['c%d'%i] for i in range(len(self.titles))]
+        return self.data.columns()[:len(self.titles or [])]
+
+
+def eff_records(rows):
+    #(n, <=5) float array -> EFF_DTYPE array
+    if rows.shape[1] < EFF_WIDTH:
+        rows = np.hstack([rows, np.full((len(rows), EFF_WIDTH-rows.shape[1]), np.nan)])
+    return np.ascontiguousarray(rows[:, :EFF_WIDTH], dtype='float64').view(EFF_DTYPE)[:, 0]
+
+
+def atten_label(atten):
+    #30.0 -> '30', 40.5 -> '40.5', as the files write them
+    return '%g'%atten
+
+
+def parse_rows(text, width):
+    #csv rows -> (n, width) float64 array
+    text = text[:text.rfind('\n')+1]    #Only complete lines
+    for marker in MARKERS:
+        text = drop_lines(text, marker+',')
+    if text.strip() == '' or width == 0:
+        return np.zeros((0, width))
+    if pandas != None:
+        try:
+            frame = pandas.read_csv(io.StringIO(text), header=None, names=list(range(width)), usecols=list(range(width)))
+            return frame.apply(pandas.to_numeric, errors='coerce').to_numpy(dtype='float64')
+        except (ValueError, pandas.errors.ParserError):
+            pass
+    try:
+        return np.loadtxt(io.StringIO(fill_placeholders(text)), delimiter=',', ndmin=2, usecols=range(width))
+    except ValueError:    #Other text in the cells or rows of different lengths
+        pass
+    rows = []
+    for row in csv.reader(io.StringIO(text), delimiter=','):
+        if len(row) > 0:
+            values = [to_float(i) for i in row[:width]]
+            rows.append(values+[float('nan')]*(width-len(values)))
+    return np.array(rows, dtype='float64').reshape(len(rows), width)
+
+
+def drop_lines(text, prefix):
+    #Removes the (few) lines starting with prefix, finding them with str.find
+    #rather than looping over every line
+    if text.startswith(prefix):
+        text = text[text.find('\n')+1:] if '\n' in text else ''
+        return drop_lines(text, prefix)
+    start = text.find('\n'+prefix)
+    if start == -1:
+        return text
+    pieces = []
+    while start != -1:
+        pieces.append(text[:start])
+        end = text.find('\n', start+1)
+        text = text[end:] if end != -1 else '\n'    #Part-written marker line - the line before it is still complete
+        start = text.find('\n'+prefix)
+    pieces.append(text)
+    return ''.join(pieces)
+
+
+def fill_placeholders(text):
+    #Whole 'x' cells -> nan. str.replace runs at C speed, a regex doesn't.
+    if text.startswith('x,'):
+        text = 'nan,'+text[2:]
+    #',x,' twice as replace doesn't see overlapping matches (',x,x,')
+    for old, new in (('\nx,', '\nnan,'), (',x,', ',nan,'), (',x,', ',nan,'), (',x\n', ',nan\n')):
+        if old in text:
+            text = text.replace(old, new)
+    return text
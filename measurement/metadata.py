@@ -0,0 +1,50 @@
+'''
+Run metadata sidecar
+
+Each measurement saves what it was run with - settings, instrument
+addresses, SIM900 slots, counter gate time - to a JSON file next to its
+data file. The data can then be reprocessed later without guessing, e.g.
+efficiency recomputed with a corrected input power (see reprocess.py).
+'''
+
+import json
+import os
+import time
+
+
+def metadata_path(filename):
+    return os.path.splitext(filename)[0]+'_meta.json'
+
+
+def run_metadata(rig, kind, **settings):
+    metadata = {'measurement': kind, 'started': time.ctime(),
+                'instruments': dict(getattr(rig, 'instr_address_dict', {})),
+                'slots': dict(getattr(rig, 'SIM_slots', {})),
+                'manual_atten': getattr(rig, 'manual_atten', None)}
+    metadata.update(settings)
+    return metadata
+
+
+def save_run_metadata(filename, metadata):
+    #filename can be a writer or None (streaming - nothing to describe)
+    filename = getattr(filename, 'filename', filename)
+    if filename == None:
+        return
+    path = metadata_path(filename)
+    if os.path.exists(path):    #Resumed run - keep what it was started with
+        saved = load_run_metadata(filename)
+        saved.setdefault('resumed', []).append(metadata.get('started'))
+        metadata = saved
+    temp = path+'.tmp'
+    with open(temp, 'w') as file_handle:
+        json.dump(metadata, file_handle, indent=1, default=str)
+    os.replace(temp, path)
+
+
+def load_run_metadata(filename):
+    #{} for files taken before sidecars
+    path = metadata_path(filename)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file_handle:
+        return json.load(file_handle)
@@ -0,0 +1,114 @@
+'''
+Values against time and R-T logging loops
+
+Both run until stopped, taking a sample every scheduler period. 'rig' is
+anything holding the open instrument handles and slot config (the Tk app
+in the GUI, or a measurement.rig.Rig). filename can be a path or a
+DataWriter (the loops close it when they end); None streams the samples
+without saving them.
+'''
+
+import time
+
+from .poller import InstrumentPoller
+from .writer import open_writer
+from .metadata import run_metadata, save_run_metadata
+from .scheduler import FixedRateScheduler
+
+#Logs can sample fast - write them out in batches
+LOG_FLUSH_ROWS = 20
+LOG_FLUSH_INTERVAL = 2.0
+
+
+def sim900_reader(rig, slot, query):
+    return lambda: str(rig.sim900.ask(rig.SIM_slots[slot], query)).strip()
+
+
+def vvt_headers(rig):
+    #Columns for whichever instruments are set up
+    headers = ['Time']
+    if rig.SIM_slots.get('ThermSlot', '') != '':
+        headers += ['T1', 'T2', 'T3']
+    if rig.SIM_slots.get('VSource', '') != '':
+        headers.append('V_Source(V)')
+    if rig.SIM_slots.get('VMeter', '') != '':
+        for i in range(rig.SIM_slots.get('NumberOfVMeters', 1)):
+            headers.append('V_'+str(i+1)+'(V)')
+    if rig.instr_address_dict['power_m_address'] != '':
+        headers.append('Power(W)')
+    if rig.instr_address_dict['pulse_c_address'] != '':
+        headers.append('Counts')
+    return headers
+
+
+def vvt_poller(rig, headers):
+    #One poller group per physical instrument, columns in header order
+    poller = InstrumentPoller()
+    for i in headers[1:]:
+        if i in ('T1', 'T2', 'T3'):
+            poller.add('sim900', i, sim900_reader(rig, 'ThermSlot', 'TVAL? '+i[1]))
+        elif i == 'V_Source(V)':
+            poller.add('sim900', i, sim900_reader(rig, 'VSource', 'VOLT?')) # not sure correct
+        elif i.startswith('V_'):    #Voltmeters - V_1(V), V_2(V)...
+            poller.add('sim900', i, sim900_reader(rig, 'VMeter', 'VOLT? '+i[2:].split('(')[0]+',1'))
+        elif i == 'Power(W)':
+            poller.add('power_meter', i, lambda: str(rig.PM100.read).strip())
+        elif i == 'Counts':
+            poller.add('counter', i, lambda: 'x')#Wont do counts yet
+    return poller
+
+
+def values_vs_time(engine, rig, filename, headers, scheduler=None, write_headers=False):
+    if scheduler == None:
+        scheduler = FixedRateScheduler(1)
+    poller = vvt_poller(rig, headers)
+    metadata = run_metadata(rig, 'VvT', columns=list(headers), period=scheduler.period)
+    writer = open_writer(filename, metadata=metadata, flush_rows=LOG_FLUSH_ROWS, flush_interval=LOG_FLUSH_INTERVAL)
+    save_run_metadata(filename, metadata)
+    if write_headers:
+        writer.write_row(headers)
+    start_time_meas = time.time()
+    scheduler.start()
+    try:
+        while True:
+            timestamp, values = poller.read_row()
+            #Always time
+            data_to_write = [str(timestamp-start_time_meas)] + values
+            writer.write_row(data_to_write)
+            yield data_to_write
+            scheduler.wait(engine)
+    finally:
+        writer.close()
+        poller.close()
+
+
+def rt_log(engine, rig, filename, bias_r, bias_point, scheduler=None):
+    if scheduler == None:
+        scheduler = FixedRateScheduler(1)
+    metadata = run_metadata(rig, 'RT', bias_r=bias_r, bias_point=float(bias_point), period=scheduler.period)
+    writer = open_writer(filename, metadata=metadata, flush_rows=LOG_FLUSH_ROWS, flush_interval=LOG_FLUSH_INTERVAL)
+    save_run_metadata(filename, metadata)
+    writer.write_row(['Time(s)', 'T1(K)', 'T2(K)', 'T3(K)', 'VSrc(V)', 'VDev(V)', 'RDev'])
+    #set the bias point
+    rig.sim900.write(rig.SIM_slots['VSource'], 'VOLT '+str(bias_point))
+    rig.sim900.write(rig.SIM_slots['VSource'],'OPON')
+    start_time_meas = time.time()
+    scheduler.start()
+    try:
+        while True:
+            #TAKE DATA
+            data_to_write = [str(time.time()-start_time_meas)]#time
+            t1 = str(rig.sim900.ask(rig.SIM_slots['ThermSlot'],'TVAL? 1')).strip()
+            t2 = str(rig.sim900.ask(rig.SIM_slots['ThermSlot'],'TVAL? 2')).strip()
+            t3 = str(rig.sim900.ask(rig.SIM_slots['ThermSlot'],'TVAL? 3')).strip()
+            Vsrc=float(rig.sim900.ask(rig.SIM_slots['VMeter'],'VOLT? 1,1').strip().split(' ')[-1])
+            Vdev=float(rig.sim900.ask(rig.SIM_slots['VMeter'],'VOLT? 2,1').strip())
+            R = Vdev/((Vsrc-Vdev)/bias_r)
+            data_to_write+=[t1,t2,t3,Vsrc,Vdev,R]
+            #WRITE DATA
+            writer.write_row(data_to_write)
+            yield data_to_write
+            scheduler.wait(engine)
+    finally:
+        writer.close()
+        rig.sim900.write(rig.SIM_slots['VSource'],'OPOF')
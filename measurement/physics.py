@@ -0,0 +1,21 @@
+'''
+Physics helpers for efficiency measurements
+'''
+
+import numpy as np
+
+h = 6.626070040e-34
+c = 2.99792458e8
+
+
+def calc_photon_flux(atten, wavelength, input_pwr):
+    #Numbers or arrays (e.g. every point's attenuation when reprocessing)
+    out_pwr = np.asarray(input_pwr, dtype=float)*(10**(-np.asarray(atten, dtype=float)/10))
+    E_per_photon = h*(c/(np.trunc(np.asarray(wavelength, dtype=float))*1e-9)) #convert wlength to m 
+    photon_flux = out_pwr/E_per_photon
+    return photon_flux if np.ndim(photon_flux) > 0 else float(photon_flux)
+
+
+def calc_efficiency(P_counts, D_counts, photon_flux):
+    eff = ((P_counts-D_counts)/photon_flux)*100
+    return eff
@@ -0,0 +1,112 @@
+'''
+Bias sweep planning
+
+FixedBiasPlan steps through a given list like np.arange always did.
+AdaptiveBiasPlanner starts from a coarse uniform grid and then keeps
+splitting whichever interval has the longest stretch of curve (in
+normalised bias/value units), so points gather at the knee, the plateau
+onset and just below the switching current, and the flat parts get few.
+Both hand out one bias at a time and are told the result, so a sweep can
+use either.
+'''
+
+import math
+
+
+class FixedBiasPlan(object):
+    def __init__(self, biases):
+        self.biases = list(biases)
+        self.index = 0
+        self.done = set()    #Restored from a checkpoint
+
+    def next_bias(self):
+        while self.index < len(self.biases):
+            self.index += 1
+            if round(self.biases[self.index-1], 9) not in self.done:
+                return self.biases[self.index-1]
+        return None
+
+    def add(self, bias, value):
+        pass
+
+    def restore(self, bias, value):
+        #Point already measured before a restart - skip it
+        self.done.add(round(bias, 9))
+
+    def stop_above(self, bias):
+        #Wire switched at this bias - the rest of the list is above it
+        self.index = len(self.biases)
+
+    def planned_biases(self):
+        return list(self.biases)
+
+
+class AdaptiveBiasPlanner(object):
+    def __init__(self, start, stop, budget, min_step=0.001, coarse_points=None, log_values=False):
+        self.start = float(start)
+        self.stop = float(stop)
+        self.budget = int(budget)    #Total number of points, coarse ones included
+        self.min_step = float(min_step)
+        self.log_values = log_values    #Refine on log10(value) - for count rates
+        if coarse_points == None:
+            coarse_points = max(3, self.budget//3)
+        coarse_points = min(coarse_points, self.budget)
+        self.queue = [self.on_grid(self.start + i*(self.stop-self.start)/max(coarse_points-1, 1)) for i in range(coarse_points)]
+        self.points = {}    #bias -> value
+        self.upper = None    #Lowest bias the wire has switched at
+        self.issued = 0
+
+    def on_grid(self, bias):
+        #Keeps biases on the min_step grid so they repeat exactly between attenuations
+        return round(self.start + round((bias-self.start)/self.min_step)*self.min_step, 9)
+
+    def next_bias(self):
+        if self.issued >= self.budget:
+            return None
+        bias = None
+        while self.queue and bias == None:
+            candidate = self.queue.pop(0)
+            if (self.upper == None or candidate < self.upper) and candidate not in self.points:
+                bias = candidate
+        if bias == None:
+            bias = self.refine()
+        if bias != None:
+            self.issued += 1
+        return bias
+
+    def add(self, bias, value):
+        if value != value:    #NaN tells us nothing about the shape
+            return
+        self.points[bias] = math.log10(max(value, 0)+1) if self.log_values else value
+
+    def restore(self, bias, value):
+        #Point already measured before a restart - counts towards the budget
+        self.add(bias, value)
+        self.issued += 1
+
+    def stop_above(self, bias):
+        self.upper = bias if self.upper == None else min(self.upper, bias)
+
+    def refine(self):
+        xs = self.planned_biases()
+        if xs == []:
+            return None
+        ys = [self.points[x] for x in xs]
+        x_range = (self.stop-self.start) or 1.0
+        y_range = (max(ys)-min(ys)) or 1.0
+        intervals = [(xs[i], xs[i+1], math.hypot((xs[i+1]-xs[i])/x_range, (ys[i+1]-ys[i])/y_range)) for i in range(len(xs)-1)]
+        if self.upper != None and self.upper > xs[-1]:
+            #Edge below the switching bias counts as a full-height step so it gets narrowed down
+            intervals.append((xs[-1], self.upper, math.hypot((self.upper-xs[-1])/x_range, 1.0)))
+        best = None
+        for x0, x1, score in intervals:
+            mid = self.on_grid((x0+x1)/2)
+            if mid <= x0 or mid >= x1:    #Already down to min_step
+                continue
+            if best == None or score > best[1]:
+                best = (mid, score)
+        return best[0] if best != None else None
+
+    def planned_biases(self):
+        #Measured biases below the switching current
+        return sorted(x for x in self.points if self.upper == None or x < self.upper)
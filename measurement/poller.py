@@ -0,0 +1,42 @@
+'''
+Concurrent instrument poller
+
+Each physical instrument (one VISA session) gets its reads done on its own
+pool thread, so a row takes as long as the slowest instrument rather than
+the sum of all of them. Reads on the same instrument stay in order on one
+thread - the SIM900 in particular can only talk to one slot at a time.
+'''
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InstrumentPoller(object):
+    def __init__(self):
+        self.columns = []    #Column names in the order they come back
+        self.instruments = {}    #instrument name -> [(column index, read function), ...]
+        self.pool = None
+
+    def add(self, instrument, column, read):
+        self.instruments.setdefault(instrument, []).append((len(self.columns), read))
+        self.columns.append(column)
+
+    def _read_instrument(self, reads):
+        return [(index, read()) for index, read in reads]
+
+    def read_row(self):
+        #Returns (timestamp, values) - timestamp is when the reads were sent
+        if self.pool == None:
+            self.pool = ThreadPoolExecutor(max_workers=max(1, len(self.instruments)))
+        row = [None]*len(self.columns)
+        timestamp = time.time()
+        futures = [self.pool.submit(self._read_instrument, reads) for reads in self.instruments.values()]
+        for future in futures:
+            for index, value in future.result():    #Re-raises any VISA error from the worker
+                row[index] = value
+        return timestamp, row
+
+    def close(self):
+        if self.pool != None:
+            self.pool.shutdown()
+            self.pool = None
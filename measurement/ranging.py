@@ -0,0 +1,102 @@
+'''
+Attenuation ranging
+
+The photon flux at the detector is input power x 10^(-A/10), so the
+attenuation for a wanted flux (or photons per pulse) follows directly.
+For a wanted count rate the counter has to be asked: PCR-DCR scales the
+same way away from saturation, so each measurement predicts the next
+attenuation (secant steps once the counter starts to saturate) and a
+bracket of too-bright/too-dim values stops it hunting.
+'''
+
+import math
+
+from .physics import calc_photon_flux
+from .counting import integrate_dark, integrate_light
+from .sweeps import set_attenuation
+
+
+def atten_for_photon_flux(target, wavelength, input_pwr, resolution=0.01):
+    #Inverse of calc_photon_flux, rounded to the attenuator resolution (dB).
+    #For photons per pulse pass target*rep rate.
+    unattenuated = calc_photon_flux(0, wavelength, input_pwr)
+    return round_atten(10*math.log10(unattenuated/float(target)), resolution)
+
+
+def round_atten(atten, resolution=0.01):
+    return round(round(atten/resolution)*resolution, 6)
+
+
+class AttenuationRanger(object):
+    '''
+    Finds the attenuation where PCR-DCR hits target_rate (CPS) at bias
+    (set by the sweep before run is called). Stops once within tolerance
+    (relative), when the bracket is down to the resolution or after
+    max_steps, keeping whichever measured attenuation came closest.
+    '''
+    def __init__(self, target_rate, bias, start=None, tolerance=0.05, resolution=0.01,
+                 min_atten=0, max_atten=100, max_steps=15, max_time=10):
+        if target_rate <= 0:
+            raise ValueError('Target count rate must be positive')
+        if not min_atten < max_atten:
+            raise ValueError('Attenuation range is empty')
+        self.target_rate = float(target_rate)
+        self.bias = bias
+        self.start = start
+        self.tolerance = tolerance
+        self.resolution = resolution
+        self.min_atten = min_atten
+        self.max_atten = max_atten
+        self.max_steps = max_steps
+        self.max_time = max_time
+        self.atten = None    #Result once run
+        self.rate = None
+        self.steps = []    #(atten, PCR-DCR) in the order measured
+
+    def next_guess(self, atten, signal, low, high):
+        #Secant on log(rate) once there are two points (copes with the counter
+        #saturating), otherwise assume the ideal 10dB per decade
+        slope = -0.1
+        if len(self.steps) > 1:
+            prev_atten, prev_signal = self.steps[-2]
+            if prev_signal > 0 and signal > 0 and prev_atten != atten and prev_signal != signal:
+                slope = (math.log10(signal)-math.log10(prev_signal))/(atten-prev_atten)
+        if signal > 0 and slope < 0:
+            guess = atten + math.log10(self.target_rate/signal)/slope
+        else:
+            guess = atten - 10    #Nothing seen - open up a decade
+        if not low < guess < high:
+            guess = (low+high)/2.0    #Prediction left the bracket (saturation) - bisect
+        return round_atten(guess, self.resolution)
+
+    def run(self, engine, rig, shutter):
+        #Generator - yields ['RANGING', atten, PCR-DCR, error] after each step
+        if rig.manual_atten:
+            raise ValueError('Attenuation ranging needs programmable attenuators')
+        shutter.set(False)
+        dark = integrate_dark(engine, rig, min_gates=5)
+        shutter.set(True)
+        low, high = self.min_atten, self.max_atten
+        atten = round_atten(self.start if self.start != None else (low+high)/2.0, self.resolution)
+        self.steps = []
+        for step in range(self.max_steps):
+            set_attenuation(rig, atten)
+            engine.sleep(0.2)
+            light = integrate_light(engine, rig, dark, self.tolerance/2, min_gates=1, max_time=self.max_time)
+            signal = light.rate - dark.rate
+            self.steps.append((atten, signal))
+            yield ['RANGING', atten, signal, math.sqrt(light.variance + dark.variance)]
+            if abs(signal-self.target_rate) <= self.tolerance*self.target_rate:
+                break
+            if signal > self.target_rate:
+                low = atten    #Too bright - need more attenuation
+            else:
+                high = atten
+            if high-low <= self.resolution:
+                break
+            guess = self.next_guess(atten, signal, low, high)
+            if guess == atten:
+                break
+            atten = guess
+        self.atten, self.rate = min(self.steps, key=lambda s: abs(s[1]-self.target_rate))
+        set_attenuation(rig, self.atten)
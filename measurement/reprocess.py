@@ -0,0 +1,70 @@
+'''
+Reprocessing efficiency files
+
+Efficiency is (PCR-DCR)/photon flux and the photon flux comes from the
+input power, wavelength and attenuation. The counts are what was measured;
+if the power meter reading turns out to be off, the efficiency of every
+point can be recomputed from the file and its metadata sidecar rather than
+re-measuring the device. All the points are done at once as arrays.
+'''
+
+import os
+
+import numpy as np
+
+from .physics import calc_photon_flux, calc_efficiency
+from .metadata import load_run_metadata, save_run_metadata
+from .loader import load_efficiency
+from .writer import open_writer
+from .sweeps import EFF_COLUMNS
+
+
+def reprocess_efficiency(filename, input_power=None, wavelength=None):
+    #Recomputes photon flux and efficiency with a corrected input power (W)
+    #and/or wavelength (nm), by default the ones in the metadata sidecar.
+    #Returns blocks as load_efficiency does.
+    metadata = load_run_metadata(filename)
+    if input_power == None:
+        input_power = metadata.get('input_power')
+    if wavelength == None:
+        wavelength = metadata.get('wavelength')
+    if input_power == None or wavelength == None:
+        raise ValueError('No input power/wavelength saved for this file - give both')
+    blocks = load_efficiency(filename)
+    if blocks == []:
+        return []
+    lengths = [len(rows) for atten, flux, rows in blocks]
+    data = np.concatenate([rows for atten, flux, rows in blocks])
+    attens = np.repeat([atten for atten, flux, rows in blocks], lengths)
+    old_flux = np.repeat([flux for atten, flux, rows in blocks], lengths)
+    new_flux = calc_photon_flux(attens, float(wavelength), float(input_power))
+    data['eff'] = calc_efficiency(data['pcr'], data['dcr'], new_flux)
+    data['eff_err'] *= old_flux/new_flux    #Same relative error
+    ends = np.cumsum(lengths)
+    return [(atten, float(calc_photon_flux(atten, float(wavelength), float(input_power))), data[end-length:end])
+            for (atten, flux, rows), length, end in zip(blocks, lengths, ends)]
+
+
+def save_reprocessed(filename, new_filename, input_power=None, wavelength=None):
+    #Writes the reprocessed efficiency to new_filename (any data format) with
+    #a sidecar saying where it came from
+    if os.path.exists(new_filename):
+        raise ValueError(new_filename+' already exists')
+    blocks = reprocess_efficiency(filename, input_power, wavelength)
+    metadata = load_run_metadata(filename)
+    metadata.pop('resumed', None)
+    if input_power != None:
+        metadata['input_power'] = input_power
+    if wavelength != None:
+        metadata['wavelength'] = wavelength
+    metadata['reprocessed_from'] = filename
+    writer = open_writer(new_filename, columns=EFF_COLUMNS, metadata=metadata)
+    with writer:
+        for atten, flux, rows in blocks:
+            if float(atten).is_integer():
+                atten = int(atten)
+            writer.write_row(['ATTENUATION', atten, flux])
+            for row in rows.tolist():
+                writer.write_row(list(row))
+    save_run_metadata(new_filename, metadata)
+    return blocks
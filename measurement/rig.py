@@ -0,0 +1,52 @@
+'''
+Instrument handles and slot config
+
+Every measurement takes a 'rig': anything with instr_address_dict,
+SIM_slots, manual_atten and the open instrument handles (sim900, PCounter,
+Op_Attn_1/2, PM100) as attributes. The Tk app is one; Rig is the same
+thing without the GUI, for scripts and the command-line runner.
+'''
+
+ADDRESS_KEYS = ('power_m_address', 'sim900_address', 'opat1_address', 'opat2_address', 'pulse_c_address')
+
+
+class Rig(object):
+    def __init__(self, instr_address_dict=None, SIM_slots=None):
+        self.instr_address_dict = dict((key, '') for key in ADDRESS_KEYS)
+        self.instr_address_dict.update(instr_address_dict or {})
+        self.SIM_slots = {'VSource': '', 'VMeter': '', 'ThermSlot': ''}
+        self.SIM_slots.update(SIM_slots or {})
+        self.manual_atten = self.instr_address_dict['opat1_address'] == ''
+        self.rm = None
+        self.sim900 = None
+        self.PCounter = None
+        self.Op_Attn_1 = None
+        self.Op_Attn_2 = None
+        self.PM100 = None
+
+
+def open_instruments(rig, wavelength=None, av_pwr_count=None):
+    #Opens whatever has an address. The VISA/instrument drivers are only
+    #imported here so the measurement code itself doesn't need them.
+    from visa import ResourceManager
+    from hardware import SIM900
+    from .sweeps import setup_counter
+    if getattr(rig, 'rm', None) == None:
+        rig.rm = ResourceManager()
+    rig.manual_atten = rig.instr_address_dict['opat1_address'] == ''
+    if rig.instr_address_dict['sim900_address'] != '':
+        rig.sim900 = SIM900(rig.instr_address_dict['sim900_address'])
+    if rig.instr_address_dict['pulse_c_address'] != '':
+        rig.PCounter = rig.rm.open_resource(rig.instr_address_dict['pulse_c_address'])
+        setup_counter(rig)
+    if rig.manual_atten == False:
+        rig.Op_Attn_1 = rig.rm.open_resource(rig.instr_address_dict["opat1_address"])
+        if rig.instr_address_dict["opat2_address"] != '':
+            rig.Op_Attn_2 = rig.rm.open_resource(rig.instr_address_dict["opat2_address"])
+    if rig.instr_address_dict['power_m_address'] != '':
+        import ThorlabsPM100
+        rig.PM100 = ThorlabsPM100.ThorlabsPM100(inst=rig.rm.open_resource(rig.instr_address_dict['power_m_address']))
+        if wavelength != None:
+            rig.PM100.sense.correction.wavelength = int(wavelength)
+        if av_pwr_count != None:
+            rig.PM100.sense.average.count = int(av_pwr_count)    #must be set for low powers
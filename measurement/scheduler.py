@@ -0,0 +1,41 @@
+'''
+Fixed rate sample scheduler
+
+Deadlines are kept on a grid (start + n*period) against the monotonic
+clock, so the time spent on I/O never adds up into drift over a long log.
+If a sample overruns its slot the scheduler skips to the next free slot on
+the grid and records the miss rather than bunching samples together.
+'''
+
+import time
+
+
+class FixedRateScheduler(object):
+    def __init__(self, period=1.0):
+        if float(period) <= 0:
+            raise ValueError('Sample period must be positive')
+        self.period = float(period)
+        self.missed = 0    #Number of grid slots skipped
+        self.missed_deadlines = []    #(slot, seconds late) for each overrun
+        self.start_time = None
+        self.slot = 0
+
+    def start(self):
+        self.start_time = time.monotonic()
+        self.slot = 0
+
+    def next_deadline(self):
+        return self.start_time + self.slot*self.period
+
+    def wait(self, engine):
+        #Call once per sample, after the sample has been taken
+        if self.start_time == None:
+            self.start()
+        self.slot += 1
+        late = time.monotonic() - self.next_deadline()
+        if late > 0:
+            skipped = int(late//self.period) + 1
+            self.missed += skipped
+            self.missed_deadlines.append((self.slot, late))
+            self.slot += skipped
+        engine.sleep(self.next_deadline() - time.monotonic())
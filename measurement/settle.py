@@ -0,0 +1,60 @@
+'''
+Settle detection after a bias change
+
+Instead of a fixed wait, take short readings (0.1s counter gates or V-dev
+from the SIM900 voltmeter) and move on as soon as the last few agree. For
+the counter, readings are allowed to differ by their Poisson noise as
+well as the relative tolerance, otherwise low count rates would never
+look settled. V-dev likewise gets an absolute allowance (v_tolerance) -
+a superconducting wire sits at ~0 V, where a relative one is nothing.
+'''
+
+import time
+
+from .counting import CountIntegrator, gate
+from .sweeps import read_device_voltage
+
+
+class SettleDetector(object):
+    def __init__(self, method='counter', tolerance=0.05, consecutive=3, min_time=0.2, max_time=1.5, gate_time=0.1,
+                 rig=None, v_tolerance=1e-4):
+        #rig is needed for method='voltmeter', to check it has a voltmeter slot
+        if method not in ('counter', 'voltmeter'):
+            raise ValueError('Unknown settle method: '+str(method))
+        if method == 'voltmeter' and (rig == None or getattr(rig, 'SIM_slots', {}).get('VMeter', '') == ''):
+            raise ValueError('Settling on the voltmeter needs a voltmeter slot')
+        self.method = method
+        self.tolerance = tolerance    #Relative agreement between readings
+        self.v_tolerance = v_tolerance    #V, absolute agreement for V-dev
+        self.consecutive = consecutive    #Number of readings that have to agree
+        self.min_time = min_time
+        self.max_time = max_time
+        self.gate_time = gate_time
+        self.settle_times = []    #How long each settle took, to see what's been saved
+
+    def read(self, engine, rig):
+        if self.method == 'voltmeter':
+            return read_device_voltage(rig), self.v_tolerance
+        counts = CountIntegrator()
+        gate(engine, rig, counts, self.gate_time)
+        return counts.rate, 3*counts.error
+
+    def settled(self, readings):
+        if len(readings) < self.consecutive:
+            return False
+        values = [v for v, noise in readings[-self.consecutive:]]
+        allowance = self.tolerance*abs(sum(values)/len(values)) + max(noise for v, noise in readings[-self.consecutive:])
+        return max(values)-min(values) <= allowance
+
+    def wait(self, engine, rig):
+        start = time.monotonic()
+        readings = []
+        while True:
+            readings.append(self.read(engine, rig))
+            elapsed = time.monotonic()-start
+            if elapsed >= self.max_time:
+                break
+            if elapsed >= self.min_time and self.settled(readings):
+                break
+        self.settle_times.append(elapsed)
+        return elapsed
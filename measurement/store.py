@@ -0,0 +1,345 @@
+'''
+Binary column storage
+
+An alternative to the CSV text files: every column is stored as float64
+and rows are appended in chunks, so files are smaller and load without any
+text parsing. The format is picked by the file extension:
+
+    .npz  one .npy member per column per flush, plus a JSON metadata member
+          (sweeps only - too many members for logs)
+    .h5   one resizable dataset per column (needs h5py), metadata as attributes
+    .rec  fixed-size float64 records after a JSON header, for long logs
+          (no marker rows) - read back as a memory-mapped structured array
+
+Header rows name the columns, values that aren't numbers ('x' for a counter
+that isn't there) are stored as NaN, and marker rows (ATTENUATION,
+SWITCHING) go in the metadata as [row index, name, values...] so the plot
+pages can split efficiency files into their attenuation blocks.
+'''
+
+import io
+import json
+import os
+import re
+import time
+import zipfile
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+#Format name -> file extension
+STORE_FORMATS = {'csv': '.txt', 'npz': '.npz', 'hdf5': '.h5', 'records': '.rec'}
+MARKERS = ('ATTENUATION', 'SWITCHING')
+RECORD_MAGIC = 'DataGather records'
+RECORD_HEADER_SIZE = 4096    #Grown in steps of this if the column names don't fit
+
+
+def available_formats(logs=False):
+    #Record files can't hold marker rows, so they're only offered for logs.
+    #npz isn't - logs flush every few rows and each flush adds zip members,
+    #so a long log would grow to hundreds of thousands of them.
+    return [fmt for fmt in STORE_FORMATS if (fmt != 'hdf5' or h5py != None) and (fmt != 'records' or logs) and (fmt != 'npz' or not logs)]
+
+
+def is_binary(filename):
+    return isinstance(filename, str) and os.path.splitext(filename)[1].lower() in ('.npz', '.h5', '.hdf5', '.rec')
+
+
+def readable_while_writing(filename):
+    #csv and record files only ever grow at the end; npz/h5 are rewritten in place
+    return not is_binary(filename) or is_record_file(filename)
+
+
+def is_record_file(filename):
+    return isinstance(filename, str) and os.path.splitext(filename)[1].lower() == '.rec'
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def to_json(value):
+    #Markers/metadata hold numpy floats and numeric strings from the measurements
+    if isinstance(value, (list, tuple)):
+        return [to_json(i) for i in value]
+    if isinstance(value, dict):
+        return dict((str(key), to_json(i)) for key, i in value.items())
+    if isinstance(value, (bool, int, float)) or value == None:
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class ColumnWriter(object):
+    #Same interface and flush policy as DataWriter. Subclasses do the file format.
+    def __init__(self, filename, flush_rows=1, flush_interval=None, fsync=False, columns=None, metadata=None):
+        self.filename = filename
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.columns = list(columns) if columns != None else None    #Titles, from the first row if not given
+        self.metadata = {'created': time.ctime()}
+        self.metadata.update(metadata or {})
+        self.markers = []    #[row index, name, values...]
+        self.rows = 0    #Data rows in the file, flushed or not
+        self.pending = []
+        self.bytes_written = 0
+        self.initial_size = 0
+        self.last_flush = time.monotonic()
+        self.opened = False
+        self.meta_changed = True
+
+    @property
+    def size(self):
+        return self.initial_size + self.bytes_written
+
+    def open(self):
+        if self.opened:
+            return
+        self.opened = True
+        if os.path.exists(self.filename):    #Resumed sweep - carry on after what's there
+            self.initial_size = os.path.getsize(self.filename)
+            columns, data, metadata = read_columns(self.filename)
+            if self.columns == None:
+                self.columns = columns
+            self.markers = metadata.pop('markers', [])
+            metadata.pop('columns', None)
+            metadata.update(self.metadata)
+            self.metadata = metadata
+            self.rows = len(data[0]) if data != [] else 0
+        self.open_file()
+
+    def write_row(self, row):
+        self.open()
+        if len(row) > 0 and row[0] in MARKERS:
+            self.markers.append([self.rows, row[0]]+to_json(list(row[1:])))
+            self.meta_changed = True
+        elif self.columns == None:
+            self.columns = [str(i) for i in row]
+            self.meta_changed = True
+            return
+        else:
+            values = [to_float(i) for i in row[:len(self.columns)]]
+            values += [float('nan')]*(len(self.columns)-len(values))
+            self.pending.append(values)
+            self.rows += 1
+            self.bytes_written += 8*len(values)
+        if len(self.pending) >= self.flush_rows or self.meta_changed:
+            self.flush()
+        elif self.flush_interval != None and time.monotonic()-self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if self.pending == [] and not self.meta_changed:
+            return
+        self.open()
+        data = np.array(self.pending, dtype='float64').reshape(len(self.pending), len(self.columns or []))
+        metadata = None
+        if self.meta_changed:
+            metadata = dict(self.metadata, columns=self.columns, markers=self.markers)
+        self.write_chunk(data, to_json_dict(metadata))
+        self.pending = []
+        self.meta_changed = False
+
+    def close(self):
+        self.flush()
+        if self.opened:
+            self.close_file()
+            self.opened = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def to_json_dict(metadata):
+    if metadata == None:
+        return None
+    return dict((str(key), to_json(value)) for key, value in metadata.items())
+
+
+class NpzWriter(ColumnWriter):
+    #Each flush appends new members and rewrites the zip directory, so the
+    #file can be read at any time. Many small flushes make many members -
+    #use .h5 for week-long logs sampled every second.
+    def open_file(self):
+        self.chunks = 0
+        self.meta_count = 0
+        if os.path.exists(self.filename):
+            with zipfile.ZipFile(self.filename) as zip_file:
+                names = zip_file.namelist()
+            self.chunks = len([i for i in names if i.startswith('c0_')])
+            self.meta_count = len([i for i in names if i.startswith('meta_')])
+
+    def write_chunk(self, data, metadata):
+        with zipfile.ZipFile(self.filename, 'a') as zip_file:
+            if len(data) > 0:
+                for i in range(data.shape[1]):
+                    member = io.BytesIO()
+                    np.save(member, data[:, i])
+                    zip_file.writestr('c%d_%06d.npy'%(i, self.chunks), member.getvalue())
+                self.chunks += 1
+            if metadata != None:
+                zip_file.writestr('meta_%06d.json'%self.meta_count, json.dumps(metadata))
+                self.meta_count += 1
+        if self.fsync:
+            with open(self.filename, 'ab') as file_handle:
+                os.fsync(file_handle.fileno())
+
+    def close_file(self):
+        pass
+
+
+class Hdf5Writer(ColumnWriter):
+    #The file stays open for the run, each flush resizes the column datasets
+    def open_file(self):
+        if h5py == None:
+            raise ImportError('Saving .h5 files needs h5py')
+        self.h5_file = h5py.File(self.filename, 'a')
+
+    def write_chunk(self, data, metadata):
+        if len(data) > 0:
+            for i in range(data.shape[1]):
+                name = 'c%d'%i
+                if name not in self.h5_file:
+                    self.h5_file.create_dataset(name, shape=(0,), maxshape=(None,), chunks=(4096,), dtype='float64')
+                dataset = self.h5_file[name]
+                start = dataset.shape[0]
+                dataset.resize((start+len(data),))
+                dataset[start:] = data[:, i]
+        if metadata != None:
+            for key, value in metadata.items():
+                self.h5_file.attrs[key] = json.dumps(value)
+        self.h5_file.flush()
+
+    def close_file(self):
+        self.h5_file.close()
+
+
+class RecordWriter(ColumnWriter):
+    #Header (written once the columns are known) then one little-endian
+    #float64 per column per row. Appending never touches earlier bytes, so a
+    #reader can map the file while the logger is still writing it.
+    def open_file(self):
+        if os.path.exists(self.filename) and os.path.getsize(self.filename) > 0:
+            #Cut off a row a crash left half written, or every row after it is misaligned
+            size, header = record_header(self.filename)
+            row_size = 8*len(header['columns'])
+            with open(self.filename, 'rb+') as file_handle:
+                file_handle.truncate(size+(os.path.getsize(self.filename)-size)//row_size*row_size)
+        self.file_handle = open(self.filename, 'ab')
+        self.header_written = self.file_handle.tell() > 0
+
+    def write_row(self, row):
+        if len(row) > 0 and row[0] in MARKERS:
+            raise ValueError('Record files are for logs - '+row[0]+' rows need npz/hdf5')
+        ColumnWriter.write_row(self, row)
+
+    def write_chunk(self, data, metadata):
+        if not self.header_written:
+            if self.columns == None:    #Nothing to describe yet
+                return
+            header = json.dumps(dict(metadata or {}, dtype='<f8'))
+            size = RECORD_HEADER_SIZE*(1+(len(header)+len(RECORD_MAGIC)+20)//RECORD_HEADER_SIZE)
+            first_line = '%s %d\n'%(RECORD_MAGIC, size)
+            self.file_handle.write((first_line+header).ljust(size-1).encode()+b'\n')
+            self.header_written = True
+        if len(data) > 0:
+            self.file_handle.write(data.astype('<f8').tobytes())
+        self.file_handle.flush()
+        if self.fsync:
+            os.fsync(self.file_handle.fileno())
+
+    def close_file(self):
+        self.file_handle.close()
+
+
+def record_header(filename):
+    #Returns (header size, header dict)
+    with open(filename, 'rb') as file_handle:
+        first_line = file_handle.readline().decode()
+        if not first_line.startswith(RECORD_MAGIC):
+            raise ValueError(filename+' is not a DataGather record file')
+        size = int(first_line.split()[-1])
+        header = file_handle.read(size-len(first_line)).decode()
+    return size, json.loads(header)
+
+
+def map_records(filename):
+    #Zero-copy structured array of the complete records in the file right
+    #now ('c0', 'c1', ... fields) - map again to see rows appended since
+    size, header = record_header(filename)
+    dtype = np.dtype([('c%d'%i, header['dtype']) for i in range(len(header['columns']))])
+    rows = (os.path.getsize(filename)-size)//dtype.itemsize    #A part-written last row is left off
+    if rows == 0:
+        return np.zeros(0, dtype=dtype), header
+    return np.memmap(filename, dtype=dtype, mode='r', offset=size, shape=(rows,)), header
+
+
+def open_store(filename, **policy):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.npz':
+        return NpzWriter(filename, **policy)
+    if extension == '.rec':
+        return RecordWriter(filename, **policy)
+    return Hdf5Writer(filename, **policy)
+
+
+def read_columns(filename):
+    #Returns (column titles, list of float64 arrays, metadata dict). Record
+    #file columns are views of the memory map, not copies.
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.npz':
+        return read_npz(filename)
+    if extension == '.rec':
+        records, header = map_records(filename)
+        return header['columns'], [records['c%d'%i] for i in range(len(header['columns']))], header
+    return read_hdf5(filename)
+
+
+def read_npz(filename):
+    chunks = {}
+    metadata = {}
+    with zipfile.ZipFile(filename) as zip_file:
+        for name in sorted(zip_file.namelist()):
+            match = re.match(r'c(\d+)_(\d+)\.npy$', name)
+            if match:
+                with zip_file.open(name) as member:
+                    chunks.setdefault(int(match.group(1)), []).append(np.lib.format.read_array(member))
+            elif name.startswith('meta_'):    #Sorted, so the last one wins
+                metadata = json.loads(zip_file.read(name).decode())
+    columns = metadata.get('columns') or []
+    data = [np.concatenate(chunks[i]) if i in chunks else np.zeros(0) for i in range(len(columns))]
+    return columns, data, metadata
+
+
+def read_hdf5(filename):
+    if h5py == None:
+        raise ImportError('Reading .h5 files needs h5py')
+    with h5py.File(filename, 'r') as h5_file:
+        metadata = dict((key, json.loads(value)) for key, value in h5_file.attrs.items())
+        columns = metadata.get('columns') or []
+        data = [h5_file['c%d'%i][:] if 'c%d'%i in h5_file else np.zeros(0) for i in range(len(columns))]
+    return columns, data, metadata
+
+
+def marker_blocks(metadata, rows, name='ATTENUATION'):
+    #[(marker values, start row, end row)] for each block started by a marker row
+    starts = [marker for marker in metadata.get('markers', []) if marker[1] == name]
+    blocks = []
+    for i, marker in enumerate(starts):
+        end = starts[i+1][0] if i+1 < len(starts) else rows
+        blocks.append((marker[2:], marker[0], end))
+    return blocks
@@ -0,0 +1,53 @@
+'''
+Samples from a running measurement, kept for live plotting
+
+The engine hands every row a measurement yields to the GUI as it's taken.
+StreamBuffer keeps the numeric ones in growable float64 columns so a plot
+can follow the run without reading the data file (which is only written
+out in batches). Efficiency sweeps are split at their ATTENUATION rows and
+a job queue starts afresh at each JOB row.
+'''
+
+import numpy as np
+
+from .loader import ColumnBuffer
+from .store import to_float
+
+#Progress/marker rows that aren't data points
+SKIP_ROWS = ('SWITCHING', 'PROGRESS', 'RANGING', 'JOB_FAILED')
+
+
+class StreamBuffer(object):
+    def __init__(self, filename=None):
+        self.filename = filename    #Data file of the run, so a plot of another file isn't mixed up with it
+        self.data = ColumnBuffer()
+        self.blocks = []    #[(atten, first row)] for efficiency sweeps
+        self.version = 0    #Changes with every row - a plot only redraws when it has
+
+    def add(self, row):
+        if len(row) == 0 or row[0] in SKIP_ROWS:
+            return
+        if row[0] == 'JOB':    #['JOB', index, kind, filename] - a new file and columns
+            self.filename = row[3]
+            self.data.clear()
+            self.blocks = []
+        elif row[0] == 'ATTENUATION':
+            self.blocks.append((to_float(row[1]), self.data.rows))
+        else:
+            self.data.append(np.array([[to_float(i) for i in row]]))
+        self.version += 1
+
+    @property
+    def rows(self):
+        return self.data.rows
+
+    def column(self, index):
+        #Empty until rows that wide have come in
+        if index >= self.data.width:
+            return np.zeros(0)
+        return self.data.buffer[index, :self.data.rows]
+
+    def block_ranges(self):
+        #[(atten, start row, end row)] for each attenuation so far
+        ends = [start for atten, start in self.blocks[1:]]+[self.data.rows]
+        return [(atten, start, end) for (atten, start), end in zip(self.blocks, ends)]
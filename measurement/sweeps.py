@@ -0,0 +1,386 @@
+'''
+Bias sweeps - efficiency and dark counts against bias
+'''
+
+import time
+
+from .physics import calc_photon_flux, calc_efficiency
+from .planner import FixedBiasPlan
+from .counting import CountIntegrator, gate, rate_upper_limit, integrate_dark, integrate_light, difference_uncertainty, GATE_TIME
+from .writer import open_writer
+from .metadata import run_metadata, save_run_metadata
+
+#Efficiency files have no header row - these name the columns in binary files
+EFF_COLUMNS = ['Bias(V)', 'DCR(CPS)', 'PCR(CPS)', 'Eff(%)', 'EffErr(%)']
+
+
+def setup_counter(rig):
+    rig.PCounter.write(':INP1:COUP DC;IMP 50 OHM')
+    rig.PCounter.write('SENS:TOT:ARM:STOP:TIM 1')
+
+
+def set_bias(rig, bias):
+    rig.sim900.write(rig.SIM_slots['VSource'], 'VOLT %.3f'%bias)
+    rig.sim900.write(rig.SIM_slots['VSource'],'OPON')
+
+
+def settle_bias(engine, rig, settle):
+    #After a bias change - the old fixed 1.5s wait if there's no SettleDetector
+    if settle == None:
+        engine.sleep(1.5)
+    else:
+        settle.wait(engine, rig)
+
+
+def set_attenuation(rig, atten):
+    if rig.instr_address_dict["opat2_address"] != '':    #If two attenuators needed use both
+        rig.Op_Attn_1.write(':INP:ATT '+ str(atten/2) + ' dB')
+        rig.Op_Attn_2.write(':INP:ATT '+ str(atten/2) + ' dB')
+        rig.Op_Attn_2.write(':OUTP:STAT ON')
+    else:    #else use one
+        rig.Op_Attn_1.write(':INP:ATT '+ str(atten) + ' dB')
+
+
+def read_temperature(rig):
+    #T1 from the SIM900 thermometer, None if there isn't one
+    if rig.SIM_slots.get('ThermSlot', '') == '':
+        return None
+    return float(rig.sim900.ask(rig.SIM_slots['ThermSlot'],'TVAL? 1'))
+
+
+class Shutter(object):
+    #Blocks/unblocks the light - attenuator output, or a prompt in manual mode.
+    #Only acts when the state actually changes.
+    def __init__(self, engine, rig):
+        self.engine = engine
+        self.rig = rig
+        self.light_on = None
+
+    def set(self, light_on):
+        if light_on == self.light_on:
+            return
+        if self.rig.manual_atten == False:
+            self.rig.Op_Attn_1.write(':OUTP:STAT ON' if light_on else ':OUTP:STAT OFF')
+        elif light_on:
+            self.engine.prompt('Unblock input', 'Allow the light into the fibre')
+        else:
+            self.engine.prompt('Block input', 'Block the light into the fibre')
+        self.light_on = light_on
+
+
+class DarkCountCache(object):
+    '''
+    Dark counts against bias, shared by every attenuation of a sweep since
+    they don't depend on the attenuator. If t_tolerance (K) is given an
+    entry is only reused while T1 is within that of where it was measured.
+    '''
+    def __init__(self, t_tolerance=None):
+        self.t_tolerance = t_tolerance
+        self.entries = {}    #bias -> (dark CountIntegrator, temperature)
+
+    def key(self, bias):
+        return round(float(bias), 9)
+
+    def get(self, bias, temperature=None):
+        if self.key(bias) not in self.entries:
+            return None
+        dark, t_measured = self.entries[self.key(bias)]
+        if self.t_tolerance != None and temperature != None and t_measured != None:
+            if abs(temperature-t_measured) > self.t_tolerance:
+                return None    #Fridge has drifted - measure again
+        return dark
+
+    def put(self, bias, dark, temperature=None):
+        self.entries[self.key(bias)] = (dark, temperature)
+
+
+def read_device_voltage(rig):
+    #V-dev on voltmeter input 2, None if there isn't a voltmeter
+    if rig.SIM_slots.get('VMeter', '') == '':
+        return None
+    return float(rig.sim900.ask(rig.SIM_slots['VMeter'],'VOLT? 2,1').strip().split(' ')[-1])
+
+
+def has_switched(rig, detector, rate, bias=None):
+    if detector == None:
+        return False
+    v_dev = read_device_voltage(rig) if detector.v_threshold != None else None
+    return detector.check(rate, v_dev, bias)
+
+
+def reset_bias(engine, rig):
+    #Drop the bias so a latched wire can recover
+    rig.sim900.write(rig.SIM_slots['VSource'],'OPOF')
+    engine.sleep(1)
+
+
+def cached_dark_counts(rig, bias, dark_cache):
+    #Returns (dark CountIntegrator or None if it needs measuring, temperature)
+    if dark_cache == None:
+        return None, None
+    temperature = read_temperature(rig) if dark_cache.t_tolerance != None else None
+    return dark_cache.get(bias, temperature), temperature
+
+
+def measure_dark_counts(engine, rig, shutter, bias, dark_cache, temperature, target, max_time, reference=None):
+    shutter.set(False)
+    dark = integrate_dark(engine, rig, target, min_gates=5 if target == None else 1, max_time=max_time, reference=reference)
+    if dark_cache != None:
+        dark_cache.put(bias, dark, temperature)
+    return dark
+
+
+def make_plan(biases):
+    #A list/array of biases or a planner that hands them out one at a time
+    if hasattr(biases, 'next_bias'):
+        return biases
+    return FixedBiasPlan(biases)
+
+
+def restore_points(plan, rows, bias_column, value_column, switch_bias):
+    #Replays the rows a checkpoint says were measured so the plan skips them
+    for row in rows:
+        plan.restore(float(row[bias_column]), float(row[value_column]))
+    if switch_bias != None:
+        plan.stop_above(switch_bias)
+
+
+def restore_detector(detector, rows, bias_column, rate_column):
+    #Gives the switching detector the rates it saw before the restart
+    if detector == None:
+        return
+    for row in rows:
+        detector.check(float(row[rate_column]), None, float(row[bias_column]))
+
+
+def efficiency_sweep(engine, rig, filename, biases, attens, wav, ip_pwr, dark_cache=None, order='interleaved',
+                     target=None, max_time=30, detector=None, on_switch='stop', bias_r=None, settle=None,
+                     ranger=None, checkpoint=None):
+    #biases is a list or an AdaptiveBiasPlanner - the planner picks the points for
+    #the first attenuation and the later ones reuse them.
+    #dark_cache=None measures the dark counts at every bias of every attenuation.
+    #order='interleaved' takes dark then light at each bias, 'batched' takes every
+    #bias dark first then every bias light - two shutter changes per attenuation.
+    #target=None averages five 1s gates for each of DCR and PCR, otherwise each is
+    #integrated until PCR-DCR has that relative uncertainty or max_time (s) is up.
+    #With a SwitchDetector the attenuation ends at the switching bias, which is
+    #written as a ['SWITCHING', bias, current] row. on_switch='reset' first drops
+    #the bias and retries the point once in case it was a one-off latch.
+    #settle is a SettleDetector run after each bias change, None waits 1.5s.
+    #With an AttenuationRanger the attenuation is found on the counter first
+    #(yielding ['RANGING', atten, PCR-DCR, error] steps) and the sweep runs there.
+    #With a SweepCheckpoint progress is recorded after each point, and a restart
+    #skips the points already in the data file - filename should be the same file.
+    #filename can also be a DataWriter, None streams without saving.
+    if order not in ('interleaved', 'batched'):
+        raise ValueError('Unknown sweep order: '+str(order))
+    plan = make_plan(biases)
+    if order == 'batched' and not isinstance(plan, FixedBiasPlan):
+        raise ValueError('Adaptive bias planning needs the interleaved sweep order')
+    shutter = Shutter(engine, rig)
+    metadata = run_metadata(rig, 'EFF', wavelength=float(wav), input_power=float(ip_pwr), bias_r=bias_r, attens=[float(i) for i in attens or []],
+                            gate_time=GATE_TIME, order=order, target=target, max_time=max_time, reuse_dark=dark_cache != None,
+                            ranged=ranger != None, settle=settle != None)
+    #Flushed every row - points are seconds apart. Binary files get column names and the settings.
+    writer = open_writer(filename, columns=EFF_COLUMNS, metadata=metadata)
+    save_run_metadata(filename, metadata)
+    diffs = {}    #Bias -> PCR-DCR at the last attenuation, how well the batched DC pass needs DCR known
+    try:
+        if ranger != None and checkpoint != None and checkpoint.started_attens() != []:
+            attens = checkpoint.started_attens()    #Ranged before the restart
+        elif ranger != None:
+            set_bias(rig, ranger.bias)
+            settle_bias(engine, rig, settle)
+            for step in ranger.run(engine, rig, shutter):
+                yield step
+            rig.sim900.write(rig.SIM_slots['VSource'],'OPOF')
+            attens = [ranger.atten]
+        for atten_id, atten in enumerate(attens):
+            atten = float(atten)
+            if atten.is_integer():
+                atten = int(atten)
+            photon_flux = calc_photon_flux(atten, wav, ip_pwr)
+            if atten_id > 0:
+                plan = FixedBiasPlan(plan.planned_biases())
+            switch_bias = None
+            last_diff = None    #PCR-DCR at the previous bias, sets how well DCR needs known
+            if checkpoint != None and checkpoint.started(atten):
+                switch_bias = checkpoint.switch_bias(atten)
+                rows = checkpoint.rows(atten)
+                restore_points(plan, rows, 0, 3, switch_bias)
+                if checkpoint.finished(atten):
+                    continue
+                if rows != [] and rows[-1][3] > rows[-1][4]:    #eff clear of its error (nan fails)
+                    last_diff = rows[-1][2]-rows[-1][1]
+                for row in rows:
+                    if row[3] > row[4]:
+                        diffs[round(row[0], 9)] = row[2]-row[1]
+            else:
+                writer.write_row(['ATTENUATION', atten, photon_flux])
+                if checkpoint != None:
+                    checkpoint.start(atten)
+            yield ['ATTENUATION', atten, photon_flux]
+            if rig.manual_atten == False:
+                set_attenuation(rig, atten)
+            if order == 'batched':
+                #DC pass
+                darks = {}
+                if detector != None:
+                    detector.reset()
+                for bias in plan.planned_biases():
+                    if round(bias, 9) in plan.done:
+                        continue
+                    dark, temperature = cached_dark_counts(rig, bias, dark_cache)
+                    if dark == None:
+                        set_bias(rig, bias)
+                        settle_bias(engine, rig, settle)
+                        dark = measure_dark_counts(engine, rig, shutter, bias, dark_cache, temperature, target, max_time,
+                                                   diffs.get(round(bias, 9)))
+                        if has_switched(rig, detector, dark.rate, bias):    #No point taking light above here
+                            switch_bias = bias
+                            if checkpoint != None:
+                                checkpoint.switched(atten, switch_bias)
+                            reset_bias(engine, rig)
+                            break
+                    darks[bias] = dark
+                done = plan.done
+                plan = FixedBiasPlan([bias for bias in plan.planned_biases() if bias in darks or round(bias, 9) in done])
+                plan.done = done
+            if detector != None:
+                detector.reset()
+                if checkpoint != None:
+                    restore_detector(detector, checkpoint.rows(atten), 0, 2)
+            retried = False
+            bias = plan.next_bias()
+            while bias != None:
+                set_bias(rig, bias)
+                settle_bias(engine, rig, settle)
+                #DC
+                if order == 'batched':
+                    dark = darks[bias]
+                else:
+                    dark, temperature = cached_dark_counts(rig, bias, dark_cache)
+                    if dark == None:
+                        dark = measure_dark_counts(engine, rig, shutter, bias, dark_cache, temperature, target, max_time, last_diff)
+                #PC
+                shutter.set(True)
+                light = integrate_light(engine, rig, dark, target, min_gates=5 if target == None else 1, max_time=max_time)
+                switched = has_switched(rig, detector, light.rate, bias)
+                if switched and on_switch == 'reset' and not retried:
+                    reset_bias(engine, rig)
+                    retried = True
+                    continue
+                retried = False
+                DC_val = dark.rate
+                PC_val = light.rate
+                eff = calc_efficiency(PC_val, DC_val, photon_flux)
+                eff_err = abs(eff)*difference_uncertainty(light, dark) if PC_val > DC_val else float('nan')
+                #Only a difference clear of the noise says how well DCR needs known
+                last_diff = PC_val-DC_val if difference_uncertainty(light, dark) < 1 else None
+                if last_diff != None:
+                    diffs[round(bias, 9)] = last_diff
+
+                data_to_write = ([bias, DC_val, PC_val, eff, eff_err])
+                writer.write_row(data_to_write)    #File first - a restart skips the points already in it
+                if checkpoint != None:
+                    checkpoint.add_row(atten, data_to_write)
+                yield data_to_write
+                if switched:
+                    switch_bias = bias if switch_bias == None else min(switch_bias, bias)
+                    if checkpoint != None:
+                        checkpoint.switched(atten, switch_bias)
+                    plan.stop_above(bias)
+                    reset_bias(engine, rig)
+                else:
+                    plan.add(bias, eff)
+                bias = plan.next_bias()
+            if switch_bias != None and not (checkpoint != None and checkpoint.switch_written(atten)):
+                I_sw = switch_bias/float(bias_r) if bias_r != None else ''
+                writer.write_row(['SWITCHING', switch_bias, I_sw])
+                yield ['SWITCHING', switch_bias, I_sw]
+            rig.sim900.write(rig.SIM_slots['VSource'],'OPOF')    #turn bias off before changing attenuations
+            if checkpoint != None:
+                checkpoint.finish(atten)
+        if checkpoint != None:
+            checkpoint.complete()
+    finally:
+        writer.close()
+        rig.sim900.write(rig.SIM_slots['VSource'],'OPOF')
+        if rig.manual_atten == False:
+            rig.Op_Attn_1.write(':OUTP:STAT OFF')
+
+
+def dcr_sweep(engine, rig, filename, biases, bias_r, min_counts=None, max_dwell=60, rate_floor=None,
+              detector=None, on_switch='stop', settle=None, checkpoint=None):
+    #biases is a list or an AdaptiveBiasPlanner (use log_values=True for counts).
+    #min_counts=None takes one 1s gate per bias. Otherwise gates are added until
+    #min_counts have been seen or max_dwell (s) is up, yielding a running
+    #['PROGRESS', bias, rate, error, dwell] after each gate. With rate_floor (CPS)
+    #a bias is left as soon as the rate is clearly (95%) below the floor.
+    #detector/on_switch/settle/checkpoint as for efficiency_sweep.
+    plan = make_plan(biases)
+    metadata = run_metadata(rig, 'DCR', bias_r=bias_r, gate_time=GATE_TIME, min_counts=min_counts, max_dwell=max_dwell,
+                            rate_floor=rate_floor, settle=settle != None)
+    writer = open_writer(filename, metadata=metadata)
+    save_run_metadata(filename, metadata)
+    start_time_meas = time.time()
+    switch_bias = None
+    if checkpoint != None and checkpoint.started(None):
+        rows = checkpoint.rows(None)
+        switch_bias = checkpoint.switch_bias(None)
+        restore_points(plan, rows, 1, 3, switch_bias)
+        restore_detector(detector, rows, 1, 3)
+        if rows != []:
+            start_time_meas -= float(rows[-1][0])    #Time column carries on
+    else:
+        writer.write_row(['Time(s)', 'VSrc(V)', 'ISrc(A)', 'Counts(CPS)', 'Error(CPS)', 'Dwell(s)'])
+        if checkpoint != None:
+            checkpoint.start(None)
+    try:
+        retried = False
+        bias = plan.next_bias()
+        while bias != None:
+            set_bias(rig, bias)
+            settle_bias(engine, rig, settle)
+            #TAKE DATA
+            data_to_write = [str(time.time()-start_time_meas)]#time
+            data_to_write.append(str(bias).strip()) #voltage
+            I_src = bias/float(bias_r) #work out the current from the bias r
+            data_to_write.append(str(I_src).strip())
+            dark = CountIntegrator()
+            gate(engine, rig, dark)
+            if min_counts != None:
+                while dark.counts < min_counts and dark.time < max_dwell:
+                    yield ['PROGRESS', bias, dark.rate, dark.error, dark.time]
+                    if rate_floor != None and rate_upper_limit(dark) < rate_floor:
+                        break
+                    gate(engine, rig, dark)
+            switched = has_switched(rig, detector, dark.rate, bias)
+            if switched and on_switch == 'reset' and not retried:
+                reset_bias(engine, rig)
+                retried = True
+                continue
+            retried = False
+            data_to_write += [dark.rate, dark.error, dark.time]
+            #WRITE DATA
+            writer.write_row(data_to_write)    #File first - a restart skips the points already in it
+            if checkpoint != None:
+                checkpoint.add_row(None, data_to_write)
+            yield data_to_write
+            if switched:
+                switch_bias = bias if switch_bias == None else min(switch_bias, bias)
+                if checkpoint != None:
+                    checkpoint.switched(None, switch_bias)
+                plan.stop_above(bias)
+                reset_bias(engine, rig)
+            else:
+                plan.add(bias, dark.rate)
+            bias = plan.next_bias()
+        if switch_bias != None and not (checkpoint != None and checkpoint.switch_written(None)):
+            writer.write_row(['SWITCHING', switch_bias, switch_bias/float(bias_r)])
+            yield ['SWITCHING', switch_bias, switch_bias/float(bias_r)]
+        if checkpoint != None:
+            checkpoint.complete()
+    finally:
+        writer.close()
+        rig.sim900.write(rig.SIM_slots['VSource'],'OPOF')
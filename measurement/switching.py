@@ -0,0 +1,106 @@
+'''
+Switching/latching detection
+
+Once the bias passes the switching current the nanowire goes normal and,
+with a DC bias, stays latched there. The counts collapse to ~zero after
+having been up (or the counter saturates on the relaxation oscillation)
+and the voltage across the device jumps. Spotting that lets a sweep stop
+instead of stepping through the rest of the bias list.
+
+switching_current_search finds the switching bias directly by bisection.
+'''
+
+from .counting import CountIntegrator, gate
+from .sweeps import set_bias, read_device_voltage
+from .writer import open_writer
+from .metadata import run_metadata, save_run_metadata
+
+
+class SwitchDetector(object):
+    def __init__(self, collapse_fraction=0.01, min_rate=100, saturation=None, v_threshold=None):
+        self.collapse_fraction = collapse_fraction    #Switched if rate < this fraction of the peak so far
+        self.min_rate = min_rate    #...once the peak has been at least this (CPS)
+        self.saturation = saturation    #Switched if the rate reaches this (CPS)
+        self.v_threshold = v_threshold    #Switched if |V-dev| from the voltmeter is above this (V)
+        self.reset()
+
+    def reset(self):
+        self.history = []    #(bias, rate) of points that hadn't switched
+
+    def peak_rate(self, bias=None):
+        #Highest rate seen so far - only at lower biases if the sweep isn't monotonic
+        rates = [r for b, r in self.history if bias == None or b == None or b < bias]
+        return max(rates) if rates else 0.0
+
+    def check(self, rate, v_dev=None, bias=None):
+        if self.v_threshold != None and v_dev != None and abs(v_dev) > self.v_threshold:
+            return True
+        if self.saturation != None and rate >= self.saturation:
+            return True
+        peak = self.peak_rate(bias)
+        if peak >= self.min_rate and rate < self.collapse_fraction*peak:
+            return True
+        self.history.append((bias, rate))
+        return False
+
+
+def switched_at(engine, rig, bias, method='voltmeter', threshold=0.01, settle=0.2):
+    #Sets the bias from zero, reads the state, then drops the bias again so a
+    #latched wire is back superconducting for the next test
+    set_bias(rig, bias)
+    engine.sleep(settle)
+    if method == 'voltmeter':    #Normal state - V-dev above threshold (V)
+        switched = abs(read_device_voltage(rig)) > threshold
+    else:    #Latched - counts (with light on) below threshold (CPS)
+        counts = CountIntegrator()
+        gate(engine, rig, counts, 0.1)
+        switched = counts.rate < threshold
+    rig.sim900.write(rig.SIM_slots['VSource'],'OPOF')
+    engine.sleep(settle)
+    return switched
+
+
+def switching_current_search(engine, rig, filename, low, high, resolution, bias_r, repeats=1,
+                             method='voltmeter', threshold=0.01, settle=0.2):
+    '''
+    Brackets and bisects the switching bias between low and high (V) down to
+    resolution, repeats times, writing a row per repeat for the histogram.
+    After the first repeat the bracket is narrowed round the last result and
+    only widened back out if the switching bias has moved outside it.
+    '''
+    low, high = float(low), float(high)    #Callers can pass the entry text
+    metadata = run_metadata(rig, 'ISW', low=low, high=high, resolution=float(resolution), bias_r=bias_r,
+                            repeats=repeats, method=method, threshold=threshold, settle=settle)
+    writer = open_writer(filename, metadata=metadata)
+    save_run_metadata(filename, metadata)
+    writer.write_row(['Repeat', 'VSw(V)', 'ISw(A)', 'Steps'])
+    try:
+        resolution = max(float(resolution), 0.001)    #SIM900 is set to the nearest mV
+        bracket = (low, high)
+        for repeat in range(repeats):
+            lo, hi = bracket
+            steps = 2
+            if switched_at(engine, rig, lo, method, threshold, settle) or not switched_at(engine, rig, hi, method, threshold, settle):
+                if bracket == (low, high):
+                    raise ValueError('Switching bias is not between %.3f and %.3f V'%(low, high))
+                lo, hi = low, high    #Moved - go back to the full range
+                steps += 2
+                if switched_at(engine, rig, lo, method, threshold, settle) or not switched_at(engine, rig, hi, method, threshold, settle):
+                    raise ValueError('Switching bias is not between %.3f and %.3f V'%(low, high))
+            while hi - lo > resolution:
+                mid = round((lo+hi)/2, 3)
+                if mid <= lo or mid >= hi:
+                    break
+                steps += 1
+                if switched_at(engine, rig, mid, method, threshold, settle):
+                    hi = mid
+                else:
+                    lo = mid
+            V_sw = (lo+hi)/2
+            data_to_write = [repeat+1, V_sw, V_sw/float(bias_r), steps]
+            writer.write_row(data_to_write)
+            yield data_to_write
+            width = max(10*resolution, hi-lo)
+            bracket = (max(float(low), round(V_sw-width, 3)), min(float(high), round(V_sw+width, 3)))
+    finally:
+        writer.close()
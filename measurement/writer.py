@@ -0,0 +1,107 @@
+'''
+Buffered data file writer
+
+Opening the file, making a csv.writer and closing it again for every row
+costs a lot when sampling fast, and more when the Data folder is on a
+network share. DataWriter keeps the file open for the whole run and
+buffers the formatted rows, writing them out every flush_rows rows or
+once flush_interval seconds have passed since the last write (checked as
+rows arrive). It counts the bytes itself so nothing needs to stat the file.
+'''
+
+import csv
+import io
+import os
+import time
+
+from .store import is_binary, open_store
+
+
+class DataWriter(object):
+    def __init__(self, filename, flush_rows=1, flush_interval=None, fsync=False):
+        self.filename = filename    #None just counts - nothing is saved
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync    #os.fsync after each flush, for when a crash mustn't lose rows
+        self.file_handle = None
+        self.pending = []    #Formatted rows not written yet
+        self.bytes_written = 0    #By this writer, buffered rows included
+        self.initial_size = 0
+        self.last_flush = time.monotonic()
+        self._line = io.StringIO()
+        self._csv = csv.writer(self._line, delimiter=',')
+
+    @property
+    def size(self):
+        #File size once everything is flushed
+        return self.initial_size + self.bytes_written
+
+    def open(self):
+        if self.file_handle == None and self.filename != None:
+            if os.path.exists(self.filename):    #Resumed - carry on after the last complete row
+                self.initial_size = trim_partial_line(self.filename)
+            self.file_handle = open(self.filename, 'a', newline='')
+
+    def write_row(self, row):
+        self._line.seek(0)
+        self._line.truncate()
+        self._csv.writerow(row)
+        line = self._line.getvalue()
+        self.bytes_written += len(line.encode())
+        if self.filename == None:
+            return
+        self.pending.append(line)
+        if len(self.pending) >= self.flush_rows:
+            self.flush()
+        elif self.flush_interval != None and time.monotonic()-self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if self.pending == []:
+            return
+        self.open()
+        self.file_handle.write(''.join(self.pending))
+        self.pending = []
+        self.file_handle.flush()
+        if self.fsync:
+            os.fsync(self.file_handle.fileno())
+
+    def close(self):
+        self.flush()
+        if self.file_handle != None:
+            self.file_handle.close()
+            self.file_handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def trim_partial_line(filename):
+    #Cuts off a last row a crash left half written, so appended rows don't
+    #run on from it. Returns the file size.
+    with open(filename, 'rb+') as file_handle:
+        size = file_handle.seek(0, os.SEEK_END)
+        if size == 0:
+            return 0
+        file_handle.seek(max(size-65536, 0))
+        tail = file_handle.read()
+        if tail.endswith(b'\n'):
+            return size
+        size -= len(tail)-(tail.rfind(b'\n')+1)
+        file_handle.truncate(size)
+    return size
+
+
+def open_writer(filename, columns=None, metadata=None, **policy):
+    #Measurements take a file name or a writer the caller made (to pick the
+    #flush policy or watch the size) and close it when they end. .npz/.h5
+    #names get a binary column writer; columns and metadata only go in those.
+    if hasattr(filename, 'write_row'):
+        return filename
+    if is_binary(filename):
+        return open_store(filename, columns=columns, metadata=metadata, **policy)
+    return DataWriter(filename, **policy)
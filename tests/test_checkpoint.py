@@ -0,0 +1,42 @@
+import os
+
+from measurement.checkpoint import SweepCheckpoint
+from measurement.writer import open_writer, trim_partial_line
+
+
+def write_rows(filename, rows):
+    with open_writer(filename) as writer:
+        for row in rows:
+            writer.write_row(row)
+
+
+def test_rows_come_from_the_data_file(tmp_path):
+    #Row written but the checkpoint not updated - the restart still sees it
+    filename = os.path.join(str(tmp_path), 'eff.txt')
+    checkpoint = SweepCheckpoint(filename)
+    write_rows(filename, [['ATTENUATION', 30, 1e6]])
+    checkpoint.start(30)
+    write_rows(filename, [[0.1, 10, 110, 1, 0.1], [0.2, 10, 210, 2, 0.1]])
+    checkpoint.add_row(30, [0.1, 10, 110, 1, 0.1])
+    restarted = SweepCheckpoint(filename)
+    assert [row[0] for row in restarted.rows(30)] == [0.1, 0.2]
+    assert restarted.rows(40) == []
+    assert restarted.attens['30']['points'] == 1
+
+
+def test_switch_written(tmp_path):
+    filename = os.path.join(str(tmp_path), 'eff.txt')
+    write_rows(filename, [['ATTENUATION', 30, 1e6], [0.1, 10, 110, 1, 0.1], ['SWITCHING', 0.1, 1e-6], ['ATTENUATION', 40, 1e5]])
+    checkpoint = SweepCheckpoint(filename)
+    assert checkpoint.switch_written(30)
+    assert not checkpoint.switch_written(40)
+
+
+def test_trim_partial_line(tmp_path):
+    filename = os.path.join(str(tmp_path), 'dcr.txt')
+    with open(filename, 'w') as file_handle:
+        file_handle.write('a,b\n1,2\n3,')
+    assert trim_partial_line(filename) == len('a,b\n1,2\n')
+    with open(filename) as file_handle:
+        assert file_handle.read() == 'a,b\n1,2\n'
+    assert trim_partial_line(filename) == len('a,b\n1,2\n')
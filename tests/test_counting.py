@@ -0,0 +1,79 @@
+import math
+
+from measurement.counting import CountIntegrator, difference_uncertainty, rate_upper_limit, integrate_dark, integrate_light
+
+
+class Counter(object):
+    #Counter that always reads rate counts per gate
+    def __init__(self, rate):
+        self.rate = rate
+        self.gates = 0
+
+    def write(self, text):
+        pass
+
+    def query(self, text):
+        self.gates += 1
+        return str(self.rate)
+
+
+class Rig(object):
+    def __init__(self, rate):
+        self.PCounter = Counter(rate)
+
+
+class Engine(object):
+    def check(self):
+        pass
+
+
+def integrator(counts, time):
+    result = CountIntegrator()
+    result.add(counts, time)
+    return result
+
+
+def test_count_integrator():
+    counts = CountIntegrator()
+    assert counts.rate == 0.0 and counts.error == float('inf')
+    counts.add(100, 1)
+    counts.add(300, 1)
+    assert counts.rate == 200
+    assert math.isclose(counts.error, math.sqrt(400)/2)
+    empty = integrator(0, 10)
+    assert empty.error == 0.1    #Counted as one count, not zero error
+
+
+def test_difference_uncertainty():
+    light = integrator(1000, 1)
+    dark = integrator(100, 1)
+    assert math.isclose(difference_uncertainty(light, dark), math.sqrt(1100)/900)
+    assert difference_uncertainty(dark, light) == float('inf')
+    assert difference_uncertainty(dark, dark) == float('inf')
+
+
+def test_integrate_dark_without_reference_takes_min_gates():
+    rig = Rig(30)
+    dark = integrate_dark(Engine(), rig, target=0.02, min_gates=2, max_time=30)
+    assert dark.gates == 2
+
+
+def test_integrate_dark_to_reference():
+    #DCR 100 against PCR-DCR 1000: error 10/sqrt(n) <= 0.02*1000/sqrt(2) after n = 1
+    rig = Rig(100)
+    assert integrate_dark(Engine(), rig, target=0.02, min_gates=1, max_time=30, reference=1000).gates == 1
+    #Against PCR-DCR 100 it needs 10/sqrt(n) <= 1.414, n >= 50 - capped by max_time
+    assert integrate_dark(Engine(), rig, target=0.02, min_gates=1, max_time=30, reference=100).gates == 30
+    assert integrate_dark(Engine(), rig, target=None, min_gates=5, reference=100).gates == 5
+
+
+def test_integrate_light_stops_with_no_light_over_dark():
+    dark = integrator(100, 1)
+    light = integrate_light(Engine(), Rig(90), dark, target=0.01, min_gates=1, max_time=30)
+    assert light.gates == 1
+
+
+def test_rate_upper_limit():
+    assert rate_upper_limit(integrator(0, 10)) == 0.3    #3/T with nothing seen
+    assert math.isclose(rate_upper_limit(integrator(100, 10)), (100+20+3)/10)
+    assert rate_upper_limit(integrator(100, 10)) > integrator(100, 10).rate
@@ -0,0 +1,53 @@
+import numpy as np
+
+from measurement.decimate import is_sorted, minmax_decimate
+
+
+def test_is_sorted():
+    assert is_sorted(np.array([1.0]))
+    assert is_sorted(np.array([1.0, 1.0, 2.0]))
+    assert not is_sorted(np.array([2.0, 1.0]))
+    assert not is_sorted(np.array([1.0, np.nan, 2.0]))
+
+
+def test_short_slice_passed_through():
+    x = np.arange(100.0)
+    y = np.sin(x)
+    dx, dy = minmax_decimate(x, y, 10, 20, 100)
+    #One point either side of the range
+    np.testing.assert_array_equal(dx, x[9:22])
+    np.testing.assert_array_equal(dy, y[9:22])
+
+
+def test_spikes_and_edges_kept():
+    x = np.arange(100000.0)
+    y = np.zeros(len(x))
+    y[12345] = 5
+    y[54321] = -3
+    dx, dy = minmax_decimate(x, y, 0, x[-1], 100)
+    assert len(dx) <= 4*100
+    assert np.all(dx[1:] > dx[:-1])
+    assert dx[0] == 0 and dx[-1] == x[-1]
+    assert 12345 in dx and 54321 in dx
+    assert dy.max() == 5 and dy.min() == -3
+
+
+def test_range_beyond_data():
+    x = np.arange(100000.0)
+    y = np.cos(x)
+    dx, dy = minmax_decimate(x, y, -1e6, 1e6, 50)
+    assert dx[0] == 0 and dx[-1] == x[-1]
+    assert len(dx) <= 4*50
+
+
+def test_nan_gaps_kept():
+    x = np.arange(100000.0)
+    y = np.ones(len(x))
+    y[40500:40510] = np.nan
+    y[70321] = np.nan
+    y[79500:81500] = np.nan    #Spans a whole column
+    dx, dy = minmax_decimate(x, y, 0, x[-1], 100)
+    gaps = dx[np.isnan(dy)]
+    assert 40500 in gaps and 70321 in gaps
+    assert np.any((gaps >= 79500) & (gaps < 81500))
+    assert np.all(dx[1:] > dx[:-1])
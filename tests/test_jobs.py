@@ -0,0 +1,81 @@
+import os
+import threading
+
+import pytest
+
+from measurement.jobs import JobQueue, bias_range, check_job_params, parse_job_params
+
+
+def test_parse_job_params():
+    params = parse_job_params('start=0.1, stop = 0.8,attens=30;40, switching=yes, order=batched,')
+    assert params == {'start': 0.1, 'stop': 0.8, 'attens': [30, 40], 'switching': True, 'order': 'batched'}
+    with pytest.raises(ValueError):
+        parse_job_params('start=0.1, stop')
+
+
+def test_bias_range_without_float_drift():
+    assert bias_range(0.1, 0.8, 0.1) == [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8]
+    assert bias_range(0.5, 0.2, -0.1) == [0.5, 0.4, 0.3, 0.2]
+    assert bias_range(0.3, 0.3, 0.1) == [0.3]
+
+
+@pytest.mark.parametrize('kind, text', [
+    ('DCR', 'start=0.1, stop=0.3, step=0.1, bias_r=abc'),
+    ('DCR', 'start=0.1, stop=0.3, step=0, bias_r=1'),
+    ('DCR', 'start=0.1, stop=0.3, step=0.1, bias_r=1, switching=2'),
+    ('DCR', 'start=0.1, stop=0.3, step=0.1'),
+    ('DCR', 'start=0.1, stop=0.3, step=0.1, bias_r=1, speed=2'),
+    ('EFF', 'start=0.1, stop=0.2, step=0.1, bias_r=1e5, attens=30;x, wavelength=1550, power=1e-6'),
+    ('EFF', 'start=0.1, stop=0.2, step=0.1, bias_r=1e5, attens=30, wavelength=1550, power=1e-6, order=fast'),
+    ('IV', 'start=0.1'),
+])
+def test_check_job_params_rejects(kind, text):
+    with pytest.raises(ValueError):
+        check_job_params(kind, parse_job_params(text))
+
+
+def test_check_job_params_accepts():
+    check_job_params('EFF', parse_job_params('start=0.1, stop=0.2, step=0.1, bias_r=1e5, attens=30;40, wavelength=1550, power=1e-6, target=1000'))
+    check_job_params('VvT', parse_job_params('period=0.5'), optional=('duration',))
+
+
+def test_queue_saved_and_reloaded(tmp_path):
+    path = os.path.join(str(tmp_path), 'queue.json')
+    queue = JobQueue(path)
+    first = queue.add('DCR', parse_job_params('start=0.1, stop=0.3, step=0.1, bias_r=1e5'))
+    queue.add('RT', parse_job_params('bias_r=1e5, bias_point=0.1, duration=10'))
+    queue.update(first, status='running', filename='a.txt')
+    with pytest.raises(ValueError):
+        queue.remove(0)
+    jobs = queue.jobs
+    queue.update(first, status='done')
+    queue.clear_finished()
+    assert queue.jobs is jobs    #run_jobs holds on to the list
+    assert [job['kind'] for job in queue.jobs] == ['RT']
+    reloaded = JobQueue(path)
+    assert reloaded.jobs == queue.jobs
+    assert reloaded.next_pending()[0] == 0
+
+
+def test_running_job_pending_after_reload(tmp_path):
+    path = os.path.join(str(tmp_path), 'queue.json')
+    queue = JobQueue(path)
+    queue.update(queue.add('RT', parse_job_params('bias_r=1e5, bias_point=0.1, duration=10')), status='running')
+    assert JobQueue(path).jobs[0]['status'] == 'pending'
+
+
+def test_queue_saves_from_two_threads(tmp_path):
+    path = os.path.join(str(tmp_path), 'queue.json')
+    queue = JobQueue(path)
+    job = queue.add('RT', parse_job_params('bias_r=1e5, bias_point=0.1, duration=10'))
+
+    def add_jobs():
+        for i in range(50):
+            queue.add('RT', parse_job_params('bias_r=1e5, bias_point=0.1, duration=10'))
+    thread = threading.Thread(target=add_jobs)
+    thread.start()
+    for i in range(100):
+        queue.update(job, error=str(i))
+    thread.join()
+    assert len(JobQueue(path).jobs) == 51
+    assert os.listdir(str(tmp_path)) == ['queue.json']    #No temp files left
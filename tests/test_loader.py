@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+
+from measurement.loader import drop_lines, load_efficiency, atten_label, EFF_DTYPE
+from measurement.writer import open_writer
+
+
+def test_drop_lines_last_marker_without_newline():
+    assert drop_lines('a\nSWITCHING,1\nb\nSWITCHING,2', 'SWITCHING,') == 'a\nb\n'
+    assert drop_lines('SWITCHING,1\na\nSWITCHING,2\nSWITCHING,3\nb\n', 'SWITCHING,') == 'a\nb\n'
+
+
+def test_load_efficiency_part_written_switching_line(tmp_path):
+    #Sweep stopped while the SWITCHING row was being written
+    filename = os.path.join(str(tmp_path), 'eff.txt')
+    with open(filename, 'w') as file_handle:
+        file_handle.write('ATTENUATION,30,1000\n0.1,10,110,10,1\n0.2,20,220,20,2\nSWITCHING,0.')
+    blocks = load_efficiency(filename)
+    assert len(blocks) == 1
+    atten, flux, rows = blocks[0]
+    assert atten == 30 and flux == 1000
+    np.testing.assert_array_equal(rows['bias'], [0.1, 0.2])
+    np.testing.assert_array_equal(rows['eff'], [10, 20])
+
+
+def test_load_efficiency_blocks(tmp_path):
+    #Blocks of any length, SWITCHING rows dropped, 'x' cells as NaN
+    filename = os.path.join(str(tmp_path), 'eff.txt')
+    with open(filename, 'w') as file_handle:
+        file_handle.write('ATTENUATION,30,1000\n0.1,10,110,10,1\n0.2,20,x,20,2\n0.3,30,330,30,3\nSWITCHING,0.3,3e-06\n'
+                          'ATTENUATION,40.5,100\n0.1,10,20,1,0.5\n')
+    blocks = load_efficiency(filename)
+    assert [(atten, flux, len(rows)) for atten, flux, rows in blocks] == [(30, 1000, 3), (40.5, 100, 1)]
+    rows = blocks[0][2]
+    assert rows.dtype == EFF_DTYPE
+    np.testing.assert_array_equal(rows['bias'], [0.1, 0.2, 0.3])
+    assert np.isnan(rows['pcr'][1])
+    assert [atten_label(atten) for atten, flux, rows in blocks] == ['30', '40.5']
+
+
+def test_load_efficiency_old_files_without_error_column(tmp_path):
+    filename = os.path.join(str(tmp_path), 'eff.txt')
+    with open(filename, 'w') as file_handle:
+        file_handle.write('ATTENUATION,30,1000\n0.1,10,110,10\n0.2,20,220,20\n')
+    atten, flux, rows = load_efficiency(filename)[0]
+    np.testing.assert_array_equal(rows['eff'], [10, 20])
+    assert np.isnan(rows['eff_err']).all()
+
+
+def test_load_efficiency_binary_matches_csv(tmp_path):
+    rows = [['ATTENUATION', 30, 1000], [0.1, 10, 110, 10, 1], [0.2, 20, 220, 20, 2], ['ATTENUATION', 40, 100], [0.1, 10, 20, 1, 0.5]]
+    blocks = []
+    for name in ('eff.txt', 'eff.npz'):
+        filename = os.path.join(str(tmp_path), name)
+        with open_writer(filename, columns=['Bias(V)', 'DCR(CPS)', 'PCR(CPS)', 'Eff(%)', 'EffErr(%)']) as writer:
+            for row in rows:
+                writer.write_row(row)
+        blocks.append(load_efficiency(filename))
+    for (atten, flux, csv_rows), (npz_atten, npz_flux, npz_rows) in zip(*blocks):
+        assert (atten, flux) == (npz_atten, npz_flux)
+        np.testing.assert_array_equal(csv_rows, npz_rows)
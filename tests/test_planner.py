@@ -0,0 +1,56 @@
+from measurement.planner import FixedBiasPlan, AdaptiveBiasPlanner
+
+
+def run(plan, curve):
+    biases = []
+    bias = plan.next_bias()
+    while bias != None:
+        biases.append(bias)
+        plan.add(bias, curve(bias))
+        bias = plan.next_bias()
+    return biases
+
+
+def step(bias):
+    return 0.0 if bias < 0.5 else 1.0
+
+
+def test_budget_and_grid():
+    plan = AdaptiveBiasPlanner(0, 1, 20, min_step=0.01)
+    biases = run(plan, step)
+    assert len(biases) == 20
+    assert len(set(biases)) == 20
+    assert all(abs(b*100-round(b*100)) < 1e-6 for b in biases)
+
+
+def test_refines_at_the_step():
+    biases = run(AdaptiveBiasPlanner(0, 1, 20, min_step=0.001), step)
+    refined = biases[6:14]    #First refinements after the 6 point coarse grid, before the flat parts get theirs
+    assert all(0.4 <= b <= 0.6 for b in refined)
+    assert min(b for b in biases if b >= 0.5)-max(b for b in biases if b < 0.5) <= 0.002
+
+
+def test_stops_at_min_step():
+    #Only 11 points fit the grid - the budget can't be spent
+    biases = run(AdaptiveBiasPlanner(0, 1, 50, min_step=0.1), step)
+    assert len(biases) == 11
+
+
+def test_stop_above_and_restore():
+    plan = AdaptiveBiasPlanner(0, 1, 10, min_step=0.01)
+    plan.restore(0.0, 0.0)
+    plan.restore(0.5, 1.0)
+    plan.stop_above(0.6)
+    biases = run(plan, step)
+    assert len(biases) == 8    #Restored points count towards the budget
+    assert all(b < 0.6 for b in biases) and 0.0 not in biases
+    assert plan.planned_biases() == sorted(plan.planned_biases())
+
+
+def test_fixed_plan():
+    plan = FixedBiasPlan([0.1, 0.2, 0.3, 0.4])
+    plan.restore(0.2, 0)
+    assert plan.next_bias() == 0.1
+    assert plan.next_bias() == 0.3
+    plan.stop_above(0.3)
+    assert plan.next_bias() == None
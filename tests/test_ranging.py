@@ -0,0 +1,36 @@
+import pytest
+
+from measurement.physics import calc_photon_flux
+from measurement.ranging import AttenuationRanger, atten_for_photon_flux, round_atten
+
+
+def test_atten_for_photon_flux_inverts_calc_photon_flux():
+    atten = atten_for_photon_flux(1e6, 1550, 1e-6)
+    assert round(atten, 2) == atten
+    assert calc_photon_flux(atten, 1550, 1e-6) == pytest.approx(1e6, rel=0.003)    #Within 0.01dB
+
+
+def test_round_atten():
+    assert round_atten(30.123) == 30.12
+    assert round_atten(30.126, 0.05) == 30.15
+
+
+def test_next_guess():
+    ranger = AttenuationRanger(1e4, 0.5)
+    #Ideal 10dB per decade from one point
+    ranger.steps = [(30, 1e5)]
+    assert ranger.next_guess(30, 1e5, 0, 100) == 40
+    #Secant once there are two (saturating: 20dB per decade here)
+    ranger.steps = [(30, 1e5), (40, 1e4*10**0.5)]
+    assert ranger.next_guess(40, 1e4*10**0.5, 30, 100) == pytest.approx(50)
+    #Nothing seen - open up a decade, bisecting if that leaves the bracket
+    ranger.steps = [(60, 0)]
+    assert ranger.next_guess(60, 0, 0, 100) == 50
+    assert ranger.next_guess(60, 0, 55, 100) == 77.5
+
+
+def test_bad_settings():
+    with pytest.raises(ValueError):
+        AttenuationRanger(0, 0.5)
+    with pytest.raises(ValueError):
+        AttenuationRanger(1e4, 0.5, min_atten=50, max_atten=40)
@@ -0,0 +1,54 @@
+import pytest
+
+from measurement import scheduler
+from measurement.scheduler import FixedRateScheduler
+
+
+class Clock(object):
+    #Fake monotonic clock - sleeping moves it on, so does taking a sample
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += max(seconds, 0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def test_no_drift(clock):
+    sched = FixedRateScheduler(1.0)
+    sched.start()
+    for i in range(1000):
+        clock.now += 0.3    #Sample takes 0.3s
+        sched.wait(clock)
+    assert clock.now == pytest.approx(100.0+1000)
+    assert sched.missed == 0
+
+
+def test_overrun_skips_slots(clock):
+    sched = FixedRateScheduler(1.0)
+    sched.start()
+    clock.now += 2.5    #Sample took two and a half periods
+    sched.wait(clock)
+    assert sched.missed == 2
+    assert sched.missed_deadlines == [(1, pytest.approx(1.5))]
+    assert clock.now == pytest.approx(103.0)    #Back on the grid, not bunched up
+    clock.now += 0.1
+    sched.wait(clock)
+    assert sched.missed == 2
+    assert clock.now == pytest.approx(104.0)
+
+
+def test_period_must_be_positive():
+    with pytest.raises(ValueError):
+        FixedRateScheduler(0)
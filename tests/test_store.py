@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+from measurement.store import NpzWriter, Hdf5Writer, RecordWriter, map_records, read_columns, marker_blocks, available_formats
+
+
+def write(writer_class, filename, rows, **policy):
+    with writer_class(filename, **policy) as writer:
+        for row in rows:
+            writer.write_row(row)
+
+
+EFF_ROWS = [['Bias', 'DCR', 'PCR'], ['ATTENUATION', 30, 1e6], [0.1, 10, 'x'], [0.2, 20, 200],
+            ['ATTENUATION', 40, 1e5], [0.1, 11, 21], ['SWITCHING', 0.1, 1e-6]]
+
+
+def check_eff(filename):
+    titles, columns, metadata = read_columns(filename)
+    assert titles == ['Bias', 'DCR', 'PCR']
+    np.testing.assert_array_equal(columns[0], [0.1, 0.2, 0.1])
+    assert np.isnan(columns[2][0]) and columns[2][2] == 21    #'x' stored as NaN
+    blocks = marker_blocks(metadata, len(columns[0]))
+    assert [(values[0], start, end) for values, start, end in blocks] == [(30, 0, 2), (40, 2, 3)]
+    assert metadata['markers'][-1] == [3, 'SWITCHING', 0.1, 1e-6]
+
+
+def test_npz_round_trip(tmp_path):
+    filename = os.path.join(str(tmp_path), 'eff.npz')
+    write(NpzWriter, filename, EFF_ROWS, metadata={'wavelength': 1550})
+    check_eff(filename)
+    assert read_columns(filename)[2]['wavelength'] == 1550
+
+
+def test_npz_append_carries_on(tmp_path):
+    #Resumed sweep - the second writer picks up the columns, markers and rows
+    filename = os.path.join(str(tmp_path), 'eff.npz')
+    write(NpzWriter, filename, EFF_ROWS[:4], flush_rows=2)
+    write(NpzWriter, filename, EFF_ROWS[4:])
+    check_eff(filename)
+
+
+def test_hdf5_round_trip(tmp_path):
+    pytest.importorskip('h5py')
+    filename = os.path.join(str(tmp_path), 'eff.h5')
+    write(Hdf5Writer, filename, EFF_ROWS)
+    check_eff(filename)
+
+
+def test_npz_not_offered_for_logs():
+    assert 'npz' in available_formats() and 'npz' not in available_formats(logs=True)
+    assert 'records' in available_formats(logs=True) and 'records' not in available_formats()
+
+
+def test_record_round_trip(tmp_path):
+    filename = os.path.join(str(tmp_path), 'log.rec')
+    rows = [['Time', 'T1', 'R']]+[[i, 4.2-i*0.01, 'x' if i == 3 else 100+i] for i in range(10)]
+    write(RecordWriter, filename, rows, flush_rows=4)
+    records, header = map_records(filename)
+    assert isinstance(records, np.memmap) and len(records) == 10
+    assert header['columns'] == ['Time', 'T1', 'R']
+    np.testing.assert_array_equal(records['c0'], np.arange(10))
+    assert np.isnan(records['c2'][3])
+    titles, columns, metadata = read_columns(filename)
+    np.testing.assert_array_equal(columns[1], records['c1'])
+
+
+def test_record_part_written_row_ignored(tmp_path):
+    filename = os.path.join(str(tmp_path), 'log.rec')
+    write(RecordWriter, filename, [['Time', 'V'], [0, 1.5], [1, 2.5]])
+    with open(filename, 'ab') as file_handle:
+        file_handle.write(np.array([2.0]).tobytes())    #Half a row, still being written
+    records, header = map_records(filename)
+    assert len(records) == 2
+    write(RecordWriter, filename, [[3, 3.5]])    #Carries on after the last whole row
+    records, header = map_records(filename)
+    assert header['columns'] == ['Time', 'V']
+    np.testing.assert_array_equal(records['c0'], [0, 1, 3])
+    np.testing.assert_array_equal(records['c1'], [1.5, 2.5, 3.5])
+
+
+def test_record_rejects_markers(tmp_path):
+    writer = RecordWriter(os.path.join(str(tmp_path), 'log.rec'))
+    with pytest.raises(ValueError):
+        writer.write_row(['ATTENUATION', 30, 1e6])